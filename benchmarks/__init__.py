@@ -0,0 +1,11 @@
+"""Benchmarks of easyshell and easycompleter.
+
+Run a benchmark from the root of the source tree, e.g.:
+
+    $ python3 -m benchmarks.bench_fs
+
+bench_engine measures the shell engine end to end, writes its results as JSON
+with -o, and benchmarks.runner compares two such files to flag regressions.
+bench_pty measures keystroke latency through readline under a pseudo-terminal.
+check_imports fails if importing easyshell exceeds its time or module budget.
+"""
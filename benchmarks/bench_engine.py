@@ -0,0 +1,254 @@
+"""Benchmark the throughput of the shell engine.
+
+Measures:
+    exec_line       Lines per second of __exec_line__() on MyShell.
+    batch_string    Lines per second of batch_string() on generated scripts in
+                    the format of example_script.m, including the child process.
+    compile         Lines per second of compiling the generated scripts as
+                    block-structured scripts, and of loading the cached plans.
+    run_plan        Lines per second of executing runs of lines of the same
+                    command, with and without batching.
+    subshell        Round trips entering and leaving a subshell through
+                    launch_subshell() and through a subshell command.
+    instantiate     The cost of creating a shell as the number of its commands
+                    grows.
+    complete        The latency of completing command names, arguments, file
+                    names, and python names.
+
+Save the results and compare them with a later run to find regressions:
+
+    $ python3 -m benchmarks.bench_engine -o old.json
+    $ python3 -m benchmarks.bench_engine -o new.json
+    $ python3 -m benchmarks.runner old.json new.json
+"""
+
+import argparse
+import contextlib
+import os
+import shutil
+import tempfile
+
+from easycompleter import Completer, fs
+from easyshell import command, script
+from easyshell.example_shell import FooShell, MyShell
+from easyshell.shell import Shell
+
+from . import runner
+
+# A block of a generated script. Every line of the block is a command.
+_SCRIPT_BLOCK = '''\
+foo
+    context
+    stack 0
+bar
+    hello
+    end
+# A comment.
+cat
+'''
+
+class BenchShell(MyShell):
+
+    @command('noop')
+    def _do_noop(self, cmd, args):
+        pass
+
+    @command('noop-batch', batch = True)
+    def _do_noop_batch(self, cmd, argvs):
+        pass
+
+class _Lines(object):
+
+    """Stands in for the pipe end of a shell in batch mode, feeding it the
+    same line forever."""
+
+    def __init__(self, line):
+        self._line = line
+
+    def recv(self):
+        return self._line
+
+def generate_script(nlines):
+    """Generate a script of about nlines lines."""
+    nblocks = max(nlines // _SCRIPT_BLOCK.count('\n'), 1)
+    return _SCRIPT_BLOCK * nblocks
+
+def make_shell_class(ncommands):
+    """Create a shell class with ncommands commands, 'cmd00000' and so on.
+
+    The commands do nothing. Commands are looked up by the __name__ of their
+    methods, so every command has a method of its own.
+    """
+    attrs = {}
+    for i in range(ncommands):
+        cmd = 'cmd{:05d}'.format(i)
+        def do(self, cmd, args):
+            pass
+        do.__name__ = do.__qualname__ = '_do_' + cmd
+        attrs[do.__name__] = command(cmd)(do)
+    return type('Shell{}'.format(ncommands), (Shell,), attrs)
+
+@contextlib.contextmanager
+def _silenced():
+    """Redirect the file descriptors 1 and 2, which child processes inherit, to
+    os.devnull."""
+    saved = [ os.dup(1), os.dup(2) ]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        yield
+    finally:
+        os.dup2(saved[0], 1)
+        os.dup2(saved[1], 2)
+        for fd in saved + [ devnull ]:
+            os.close(fd)
+
+def exec_line_cases(temp_dir, devnull):
+    shell = BenchShell(batch_mode = True, stdout = devnull, stderr = devnull,
+            temp_dir = temp_dir)
+    cases = []
+    for name, line in [
+            ('noop', 'noop'),
+            ('noop, quoted arguments', 'noop a "b c" \'d e\' f g h'),
+            ('comment', '# a comment'),
+            ('unknown command', 'nosuchcommand'),
+            ('nargs error', 'bar x'),
+    ]:
+        cases.append(runner.Case('exec_line: ' + name,
+                lambda line = line: shell.__exec_line__(line), unit = 'line'))
+    return cases
+
+def batch_cases(temp_dir, sizes):
+    cases = []
+    for n in sizes:
+        script = generate_script(n)
+        nlines = script.count('\n')
+        def fn(script = script):
+            with _silenced():
+                MyShell(batch_mode = True,
+                        temp_dir = temp_dir).batch_string(script)
+        cases.append(runner.Case('batch_string: {} lines'.format(nlines), fn,
+                items = nlines, unit = 'line', number = 1))
+    return cases
+
+def compile_cases(temp_dir, sizes):
+    cases = []
+    cache_dir = os.path.join(temp_dir, 'plans')
+    for n in sizes:
+        content = generate_script(n)
+        nlines = content.count('\n')
+        script.load_plan(content, MyShell, cache_dir = cache_dir)
+        cases.append(runner.Case('compile: {} lines'.format(nlines),
+                lambda content = content: script.compile_script(
+                script.parse(content), MyShell), items = nlines, unit = 'line',
+                number = 1))
+        cases.append(runner.Case('compile: {} lines, cached'.format(nlines),
+                lambda content = content: script.load_plan(content, MyShell,
+                cache_dir = cache_dir), items = nlines, unit = 'line',
+                number = 1))
+    return cases
+
+def run_plan_cases(devnull, sizes):
+    cases = []
+    for n in sizes:
+        for cmd in ( 'noop', 'noop-batch' ):
+            content = '{} a b c\n'.format(cmd) * n
+            plan = script.compile_script(script.parse(content), BenchShell)
+            executor = script.BlockExecutor(BenchShell(batch_mode = True,
+                    stdout = devnull, stderr = devnull))
+            def fn(executor = executor, plan = plan):
+                # preloop() and postloop() print().
+                with contextlib.redirect_stdout(devnull):
+                    executor.run_plan(plan)
+            cases.append(runner.Case('run_plan: {} lines of {}'.format(n, cmd),
+                    fn, items = n, unit = 'line', number = 1))
+    return cases
+
+def subshell_cases(temp_dir, devnull):
+    shell = BenchShell(batch_mode = True, pipe_end = _Lines('end'),
+            stdout = devnull, stderr = devnull, temp_dir = temp_dir)
+    return [
+        runner.Case('subshell: launch_subshell',
+                lambda: shell.launch_subshell(FooShell, 'foo', []),
+                unit = 'round trip'),
+        runner.Case('subshell: command',
+                lambda: shell.__exec_line__('foo'), unit = 'round trip'),
+    ]
+
+def instantiate_cases(temp_dir, sizes):
+    cases = []
+    for n in sizes:
+        cls = make_shell_class(n)
+        cases.append(runner.Case('instantiate: {} commands'.format(n),
+                lambda cls = cls: cls(batch_mode = True, temp_dir = temp_dir),
+                unit = 'shell'))
+    return cases
+
+def complete_cases(temp_dir, devnull):
+    shell = BenchShell(batch_mode = True, stdout = devnull, stderr = devnull,
+            temp_dir = temp_dir)
+    big = make_shell_class(1000)(batch_mode = True, temp_dir = temp_dir)
+    files_dir = os.path.join(temp_dir, 'files')
+    os.makedirs(files_dir)
+    for i in range(1000):
+        open(os.path.join(files_dir, 'f{:04d}'.format(i)), 'w').close()
+    files_text = os.path.join(files_dir, 'f01')
+    namespace = { 'name{:05d}'.format(i): i for i in range(10000) }
+    completer = Completer(namespace)
+    driver = shell._ShellBase__driver_completer
+    return [
+        runner.Case('complete: all commands',
+                lambda: shell._ShellBase__complete_cmds('')),
+        runner.Case('complete: commands by prefix',
+                lambda: shell._ShellBase__complete_cmds('h')),
+        runner.Case('complete: 1000 commands by prefix',
+                lambda: big._ShellBase__complete_cmds('cmd005')),
+        runner.Case('complete: choices',
+                lambda: driver([ 'foo' ], '--', 0)),
+        runner.Case('complete: file names',
+                lambda: fs.find_matches(files_text)),
+        runner.Case('complete: python names',
+                lambda: completer.global_matches('name01')),
+    ]
+
+def _sizes(s):
+    return [ int(float(x)) for x in s.split(',') ]
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    runner.add_arguments(parser)
+    parser.add_argument('--batch-lines',
+            metavar = 'N,...',
+            type = _sizes,
+            default = '1e3,1e4,1e5',
+            help = 'the sizes of the generated scripts, e.g., 1e3,1e6')
+    parser.add_argument('--commands',
+            metavar = 'N,...',
+            type = _sizes,
+            default = '10,100,1000',
+            help = 'the numbers of commands of the instantiated shells')
+    parser.add_argument('-k', '--only',
+            metavar = 'PREFIX',
+            help = 'only run the cases whose name starts with PREFIX')
+    args = parser.parse_args()
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            cases = exec_line_cases(temp_dir, devnull) + \
+                    subshell_cases(temp_dir, devnull) + \
+                    instantiate_cases(temp_dir, args.commands) + \
+                    complete_cases(temp_dir, devnull) + \
+                    compile_cases(temp_dir, args.batch_lines) + \
+                    run_plan_cases(devnull, args.batch_lines) + \
+                    batch_cases(temp_dir, args.batch_lines)
+            if args.only:
+                cases = [ c for c in cases if c.name.startswith(args.only) ]
+            runner.main_run(args, cases)
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors = True)
+
+if __name__ == '__main__':
+    main()
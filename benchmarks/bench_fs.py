@@ -0,0 +1,61 @@
+"""Benchmark file name completion over a synthetic directory.
+
+The baseline is the glob-based matcher, which lists the directory and stats
+every hit on each call.
+"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import timeit
+
+from easycompleter import fs
+
+def populate(path, n):
+    """Create n empty files and n // 100 subdirectories in path."""
+    for i in range(n):
+        name = os.path.join(path, 'f{:06d}'.format(i))
+        if i % 100 == 0:
+            os.mkdir(name)
+        else:
+            open(name, 'w').close()
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-n', '--entries',
+            type = int,
+            default = 100000,
+            help = 'number of entries in the synthetic directory')
+    parser.add_argument('-r', '--repeat',
+            type = int,
+            default = 5,
+            help = 'number of timed repetitions')
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        populate(tmpdir, args.entries)
+        cases = [
+            ('all entries', os.path.join(tmpdir, 'f')),
+            ('1% of entries', os.path.join(tmpdir, 'f012')),
+            ('single entry', os.path.join(tmpdir, 'f01234')),
+        ]
+        print('{:<16}{:>14}{:>14}{:>14}'.format(
+                'query', 'glob (ms)', 'cold (ms)', 'warm (ms)'))
+        for name, text in cases:
+            glob_t = min(timeit.repeat(lambda: fs._glob_matches(text),
+                    number = 1, repeat = args.repeat))
+            fs._cache.clear()
+            cold_t = timeit.timeit(lambda: fs.find_matches(text), number = 1)
+            warm_t = min(timeit.repeat(lambda: fs.find_matches(text),
+                    number = 1, repeat = args.repeat))
+            assert sorted(fs.find_matches(text)) == sorted(fs._glob_matches(text))
+            print('{:<16}{:>14.3f}{:>14.3f}{:>14.3f}'.format(
+                    name, glob_t * 1e3, cold_t * 1e3, warm_t * 1e3))
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors = True)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measure the overhead of recording per-command metrics.
+
+Reports the cost of one Registry.observe() call and the cost per line of
+__exec_line__() on a no-op command with metrics enabled and disabled.
+"""
+
+import argparse
+import io
+import tempfile
+import timeit
+
+from easyshell import command, metrics
+from easyshell.basic_shell import BasicShell
+
+class NoopShell(BasicShell):
+
+    @command('noop', nargs = 0)
+    def _do_noop(self, cmd, args):
+        pass
+
+def best_per_call(stmt, number, repeat):
+    return min(timeit.repeat(stmt, number = number, repeat = repeat)) / number
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-n', '--number',
+            type = int,
+            default = 100000,
+            help = 'number of calls per repetition')
+    parser.add_argument('-r', '--repeat',
+            type = int,
+            default = 5,
+            help = 'number of timed repetitions')
+    args = parser.parse_args()
+
+    registry = metrics.Registry()
+    observe = lambda: registry.observe('command', 'NoopShell', 'noop', 1e-5)
+    shell = NoopShell(batch_mode = True, stdout = io.StringIO(),
+            temp_dir = tempfile.mkdtemp())
+    exec_line = lambda: shell.__exec_line__('noop')
+
+    observe_t = best_per_call(observe, args.number, args.repeat)
+    metrics.enabled = False
+    disabled_t = best_per_call(exec_line, args.number, args.repeat)
+    metrics.enabled = True
+    enabled_t = best_per_call(exec_line, args.number, args.repeat)
+
+    print('Registry.observe()          {:8.3f} us'.format(observe_t * 1e6))
+    print('__exec_line__, disabled     {:8.3f} us'.format(disabled_t * 1e6))
+    print('__exec_line__, enabled      {:8.3f} us'.format(enabled_t * 1e6))
+    print('overhead per command        {:8.3f} us'.format(
+            (enabled_t - disabled_t) * 1e6))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""Benchmark interactive latency under a pseudo-terminal.
+
+The in-process benchmarks bypass readline, the completion driver, and the
+terminal. This benchmark instead starts a shell in a child process attached to
+a pseudo-terminal, types keystrokes into it, and measures the time from the
+keystroke that triggers an action to the moment its output is rendered:
+
+    complete command    TAB completing a unique command name.
+    list commands       TAB listing the 100 or fewer commands sharing a prefix.
+    complete argument   TAB completing an argument from its choices.
+    help                '?' TAB displaying the help of a command.
+    ctrl-d              Ctrl-D leaving a subshell until the parent prompt.
+
+The shells have a configurable number of commands, and the actions are run at
+several depths of the shell stack. Results are percentiles over many trials,
+and -o writes them in the format of benchmarks.runner, e.g., for comparison.
+
+The PtyShell class is also usable on its own to script an interactive session.
+"""
+
+import argparse
+import fcntl
+import json
+import os
+import pty
+import select
+import signal
+import struct
+import sys
+import tempfile
+import termios
+import time
+
+from easyshell import command, subshell
+from easyshell.replay import summarize
+
+from . import bench_engine, runner
+
+# Keystrokes.
+TAB = b'\t'
+CTRL_D = b'\x04'
+CTRL_U = b'\x15'
+
+# The readline configuration of the child, so that user settings do not skew
+# the results and candidates are listed on the first TAB without asking.
+_INPUTRC = '''\
+set show-all-if-ambiguous on
+set completion-query-items -1
+set page-completions off
+set bell-style none
+'''
+
+class PtyShell(object):
+
+    """A shell running in a child process attached to a pseudo-terminal.
+
+    Attributes:
+        pid: The process id of the child.
+        fd: The file descriptor of the master end of the pseudo-terminal.
+    """
+
+    def __init__(self, argv, *, env = None, rows = 50, cols = 200):
+        """Start a child process.
+
+        Arguments:
+            argv: The command line of the child.
+            env: The environment of the child. The default, None, means the
+                environment of this process.
+            rows, cols: The size of the terminal.
+        """
+        self.pid, self.fd = pty.fork()
+        if self.pid == 0:
+            try:
+                os.execvpe(argv[0], argv, env if env is not None else os.environ)
+            finally:
+                os._exit(127)
+        fcntl.ioctl(self.fd, termios.TIOCSWINSZ,
+                struct.pack('HHHH', rows, cols, 0, 0))
+        self._buf = b''
+        self._status = None
+
+    def send(self, keys):
+        """Type keystrokes, a bytes or str object.
+
+        Returns:
+            The time.perf_counter() right after the keystrokes were written.
+        """
+        if isinstance(keys, str):
+            keys = keys.encode('utf8')
+        os.write(self.fd, keys)
+        return time.perf_counter()
+
+    def expect(self, pattern, *, timeout = 10.0):
+        """Read output until it contains a pattern.
+
+        The output up to and including the pattern is consumed.
+
+        Arguments:
+            pattern: A bytes or str object.
+            timeout: The maximal time to wait, in seconds.
+
+        Returns:
+            The time.perf_counter() when the pattern was read.
+
+        Raises:
+            TimeoutError: The pattern did not show up in time.
+            EOFError: The child closed the terminal.
+        """
+        if isinstance(pattern, str):
+            pattern = pattern.encode('utf8')
+        deadline = time.perf_counter() + timeout
+        while True:
+            i = self._buf.find(pattern)
+            if i >= 0:
+                now = time.perf_counter()
+                self._buf = self._buf[i + len(pattern):]
+                return now
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError('{!r} not found in {!r}'.format(pattern,
+                        self._buf[-200:]))
+            self.__read(remaining)
+
+    def drain(self):
+        """Discard the output read so far and any pending output."""
+        while self.__read(0):
+            pass
+        self._buf = b''
+
+    def close(self, *, timeout = 5.0):
+        """Wait for the child to exit, killing it after a timeout.
+
+        Closing again returns the same status.
+
+        Returns:
+            The exit status of the child, as returned by os.waitpid().
+        """
+        if self._status is not None:
+            return self._status
+        deadline = time.perf_counter() + timeout
+        while True:
+            pid, status = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                break
+            if time.perf_counter() > deadline:
+                os.kill(self.pid, signal.SIGKILL)
+                pid, status = os.waitpid(self.pid, 0)
+                break
+            try:
+                self.__read(0.05)
+            except EOFError:
+                pass
+        os.close(self.fd)
+        self._status = status
+        return status
+
+    def __read(self, timeout):
+        readable, _, _ = select.select([ self.fd ], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError:
+            # Linux raises EIO on the master end once the child is gone.
+            data = b''
+        if not data:
+            raise EOFError('the child closed the terminal')
+        self._buf += data
+        return True
+
+def make_target_class(ncommands):
+    """Create the shell class driven by this benchmark.
+
+    Besides the ncommands commands of bench_engine.make_shell_class(), the
+    class has a 'zzz-unique' command with choices and a docstring, and a 'sub'
+    command entering another instance of the class.
+    """
+    cls = bench_engine.make_shell_class(ncommands)
+
+    def do_unique(self, cmd, args):
+        """The command completed by the benchmark."""
+    cls.do_unique = command('zzz-unique',
+            choices = [ 'alpha-choice', 'beta-choice' ])(do_unique)
+
+    def do_sub(self, cmd, args):
+        return 'sub'
+    cls.do_sub = subshell(cls, 'sub')(do_sub)
+    return cls
+
+def run_child(ncommands, temp_dir):
+    """The main function of the child process."""
+    cls = make_target_class(ncommands)
+    cls(root_prompt = 'root', temp_dir = temp_dir).cmdloop()
+
+def start_child(ncommands, temp_dir):
+    """Start a child process running the shell of make_target_class().
+
+    Arguments:
+        ncommands: The number of commands of the shell.
+        temp_dir: The directory to write the readline configuration and the
+            history files of the child to.
+
+    Returns:
+        A PtyShell object.
+    """
+    inputrc = os.path.join(temp_dir, 'inputrc')
+    with open(inputrc, 'w') as f:
+        f.write(_INPUTRC)
+    env = dict(os.environ, INPUTRC = inputrc, TERM = 'xterm')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(
+            [ root ] + env.get('PYTHONPATH', '').split(os.pathsep)).rstrip(
+            os.pathsep)
+    argv = [ sys.executable, '-m', 'benchmarks.bench_pty', '--child',
+            str(ncommands), '--temp-dir', temp_dir ]
+    return PtyShell(argv, env = env)
+
+def prompt(depth):
+    return '(' + '-'.join([ 'root' ] + [ 'sub' ] * depth) + ')$ '
+
+def measure(shell, depth, trials):
+    """Run the trials of all actions at the current depth.
+
+    Returns:
+        A dictionary mapping the names of the actions to lists of latencies in
+        seconds.
+    """
+    p = prompt(depth)
+    # Each action is (name, typed text, expected output after TAB).
+    actions = [
+        ('complete command', 'zzz-u', 'nique'),
+        ('list commands', 'cmd000', p + 'cmd000'),
+        ('complete argument', 'zzz-unique b', 'eta-choice'),
+        ('help', 'zzz-unique ?', p + 'zzz-unique ?'),
+    ]
+    ret = {}
+    for name, text, expected in actions:
+        latencies = []
+        for i in range(trials):
+            shell.send(CTRL_U + text.encode('utf8'))
+            shell.expect(text)
+            shell.drain()
+            start = shell.send(TAB)
+            latencies.append(shell.expect(expected) - start)
+        shell.send(CTRL_U)
+        ret[name] = latencies
+
+    latencies = []
+    for i in range(trials):
+        shell.send('sub\n')
+        shell.expect(prompt(depth + 1))
+        shell.drain()
+        start = shell.send(CTRL_D)
+        latencies.append(shell.expect(p) - start)
+    ret['ctrl-d'] = latencies
+    return ret
+
+def _sizes(s):
+    return [ int(float(x)) for x in s.split(',') ]
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--commands',
+            metavar = 'N,...',
+            type = _sizes,
+            default = '10,100,1000',
+            help = 'the numbers of commands of the shells')
+    parser.add_argument('--depths',
+            metavar = 'D,...',
+            type = _sizes,
+            default = '0,4',
+            help = 'the depths of the shell stack to measure at')
+    parser.add_argument('-n', '--trials',
+            type = int,
+            default = 50,
+            help = 'the number of trials per action')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            help = 'write the results to FILE as JSON')
+    parser.add_argument('--child',
+            metavar = 'N',
+            type = int,
+            help = argparse.SUPPRESS)
+    parser.add_argument('--temp-dir',
+            help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child is not None:
+        run_child(args.child, args.temp_dir)
+        return
+
+    temp_dir = tempfile.mkdtemp()
+    results = []
+    print('{:<44}{:>12}{:>12}{:>12}'.format('case', 'p50', 'p90', 'p99'))
+    for ncommands in args.commands:
+        shell = start_child(ncommands, temp_dir)
+        try:
+            shell.expect(prompt(0), timeout = 30.0)
+            depth = 0
+            for target in sorted(args.depths):
+                while depth < target:
+                    shell.send('sub\n')
+                    depth += 1
+                    shell.expect(prompt(depth))
+                for action, latencies in measure(shell, depth,
+                        args.trials).items():
+                    name = '{} [commands={} depth={}]'.format(action,
+                            ncommands, depth)
+                    result = summarize(name, latencies,
+                            unit = 'keystroke')
+                    results.append(result)
+                    print('{:<44}{:>12}{:>12}{:>12}'.format(name,
+                            runner.format_time(result['median']),
+                            runner.format_time(result['p90']),
+                            runner.format_time(result['p99'])), flush = True)
+            for i in range(depth + 1):
+                shell.send(CTRL_D)
+        finally:
+            shell.close()
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf8') as f:
+            json.dump({ 'environment': { 'python': sys.version.split()[0],
+                    'time': time.time() }, 'results': results }, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Benchmark name completion over a large namespace.
+
+The baseline is the linear scan over the keywords, the namespace and the
+builtins that Completer.global_matches() used to do on every call.
+"""
+
+import argparse
+import builtins
+import keyword
+import timeit
+
+from easycompleter import Completer
+
+def linear_matches(completer, text):
+    """The linear global_matches() used as the baseline."""
+    matches = []
+    seen = {"__builtins__"}
+    n = len(text)
+    for word in keyword.kwlist:
+        if word[:n] == text:
+            seen.add(word)
+            matches.append(word)
+    for nspace in [completer.namespace, builtins.__dict__]:
+        for word, val in nspace.items():
+            if word[:n] == text and word not in seen:
+                seen.add(word)
+                matches.append(completer._callable_postfix(val, word))
+    return matches
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('-n', '--names',
+            type = int,
+            default = 100000,
+            help = 'number of names in the namespace')
+    parser.add_argument('-r', '--repeat',
+            type = int,
+            default = 5,
+            help = 'number of timed repetitions')
+    args = parser.parse_args()
+
+    namespace = { 'name_{:06d}'.format(i): i for i in range(args.names) }
+    completer = Completer(namespace)
+    cases = [
+        ('1% of names', 'name_001'),
+        ('single name', 'name_00123'),
+        ('builtin', 'pri'),
+    ]
+    print('{:<16}{:>14}{:>14}{:>14}'.format(
+            'query', 'linear (ms)', 'cold (ms)', 'warm (ms)'))
+    for name, text in cases:
+        linear_t = min(timeit.repeat(lambda: linear_matches(completer, text),
+                number = 1, repeat = args.repeat))
+        completer._indexes.clear()
+        cold_t = timeit.timeit(lambda: completer.global_matches(text),
+                number = 1)
+        warm_t = min(timeit.repeat(lambda: completer.global_matches(text),
+                number = 1, repeat = args.repeat))
+        assert sorted(completer.global_matches(text)) == \
+                sorted(linear_matches(completer, text))
+        print('{:<16}{:>14.3f}{:>14.3f}{:>14.3f}'.format(
+                name, linear_t * 1e3, cold_t * 1e3, warm_t * 1e3))
+
+if __name__ == '__main__':
+    main()
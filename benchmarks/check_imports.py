@@ -0,0 +1,144 @@
+"""Check the cold import time and the number of imported modules of easyshell.
+
+Each module is imported in fresh interpreters with -X importtime. The check
+fails, with exit status 1, if the best cumulative import time exceeds the time
+budget, if more modules than the module budget are imported, or if any of the
+modules that must be imported lazily is imported, e.g.:
+
+    $ python3 -m benchmarks.check_imports --max-ms 30 --max-modules 70
+
+tests/test_imports.py runs the same check with the tests, with a wider time
+budget, as the timing depends on the load of the machine.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+# The modules checked by default, i.e., the shells and the command line entry
+# point.
+MODULES = [ 'easyshell.shell', 'easyshell.example_shell', 'easyshell.__main__' ]
+
+# The default budgets.
+MAX_MS = 30.0
+MAX_MODULES = 70
+
+# Modules that must only be imported on first use of the commands needing them.
+LAZY_MODULES = [
+    'cProfile',
+    'easycompleter',
+    'easyshell.debugging_shell',
+    'easyshell.hooks',
+    'easyshell.metrics',
+    'easyshell.prefetch',
+    'multiprocessing',
+    'pstats',
+    'readline',
+    'shutil',
+    'subprocess',
+    'tempfile',
+    'terminaltables',
+    'threading',
+]
+
+def import_profile(module):
+    """Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        A tuple (seconds, modules), the cumulative import time of the module,
+        and the names of the modules imported by importing it.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+            [ root ] + env.get('PYTHONPATH', '').split(os.pathsep)).rstrip(
+            os.pathsep)
+    proc = subprocess.run([ sys.executable, '-X', 'importtime', '-c',
+            'import ' + module ], env = env, stderr = subprocess.PIPE,
+            universal_newlines = True, check = True)
+
+    # The lines are in post order, i.e., the module imported by the command
+    # line is the last top level entry, preceded by the modules it imported.
+    entries = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        name = fields[2].rstrip()
+        top_level = not name[1:].startswith(' ')
+        entries.append((int(fields[1]), name.strip(), top_level))
+    modules = []
+    for cumulative, name, top_level in reversed(entries):
+        if top_level and modules:
+            break
+        modules.append(name)
+    return entries[-1][0] * 1e-6, modules
+
+def check(module, *, max_ms = MAX_MS, max_modules = MAX_MODULES, runs = 5):
+    """Check the imports of a module against the budgets.
+
+    Arguments:
+        module: The name of the module.
+        max_ms: The budget of the best cumulative import time in milliseconds.
+        max_modules: The budget of the number of imported modules.
+        runs: The number of imports timed, the best counts.
+
+    Returns:
+        A tuple (seconds, modules, problems), the best import time, the names
+        of the imported modules, and a list of messages describing the budgets
+        exceeded, empty if none is.
+    """
+    profiles = [ import_profile(module) for i in range(runs) ]
+    seconds = min(p[0] for p in profiles)
+    modules = profiles[0][1]
+    lazy = sorted({ m for m in modules for lazy_module in LAZY_MODULES
+            if m == lazy_module or m.startswith(lazy_module + '.') })
+    problems = []
+    if seconds * 1e3 > max_ms:
+        problems.append('over the time budget of {} ms'.format(max_ms))
+    if len(modules) > max_modules:
+        problems.append('over the module budget of {}'.format(max_modules))
+    if lazy:
+        problems.append('imports lazy modules: {}'.format(', '.join(lazy)))
+    return seconds, modules, problems
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules',
+            metavar = 'MODULE',
+            nargs = '*',
+            default = MODULES,
+            help = 'the modules to import, by default the shells and the'
+                    ' command line entry point')
+    parser.add_argument('--max-ms',
+            type = float,
+            default = MAX_MS,
+            help = 'the budget of the cumulative import time in milliseconds')
+    parser.add_argument('--max-modules',
+            type = int,
+            default = MAX_MODULES,
+            help = 'the budget of the number of imported modules')
+    parser.add_argument('-n', '--runs',
+            type = int,
+            default = 5,
+            help = 'the number of imports timed, the best counts')
+    args = parser.parse_args()
+
+    failed = False
+    for module in args.modules:
+        seconds, modules, problems = check(module, max_ms = args.max_ms,
+                max_modules = args.max_modules, runs = args.runs)
+        print('{}: {:.1f} ms, {} modules'.format(module, seconds * 1e3,
+                len(modules)))
+        for problem in problems:
+            print('  ' + problem)
+        failed = failed or bool(problems)
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
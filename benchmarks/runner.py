@@ -0,0 +1,212 @@
+"""Repeatable timing of benchmark cases and comparison of results.
+
+A case is a function called without arguments. It is timed in several
+repetitions after a warmup. Each repetition makes enough calls to last at least
+a minimal time, and the garbage collector is off while it runs, as in timeit.
+The median of the per-call times across repetitions is the headline number.
+The interquartile range measures its noise.
+
+Compare two result files written by a benchmark's -o option, e.g.:
+
+    $ python3 -m benchmarks.runner old.json new.json
+"""
+
+import argparse
+import gc
+import json
+import platform
+import statistics
+import sys
+import time
+
+from easyshell.base import format_time
+
+class Case(object):
+
+    """A benchmark case.
+
+    Attributes:
+        name: The name of the case, unique within a run.
+        fn: The function to time.
+        items: The number of items, e.g., lines, processed per call of fn, for
+            reporting the throughput.
+        unit: The name of the items.
+        number: The number of calls per repetition. The default, None, means to
+            calibrate it such that a repetition lasts at least min_time.
+    """
+
+    def __init__(self, name, fn, *, items = 1, unit = 'call', number = None):
+        self.name = name
+        self.fn = fn
+        self.items = items
+        self.unit = unit
+        self.number = number
+
+def measure(case, *, repeat = 7, warmup = 1, min_time = 0.2):
+    """Time a case.
+
+    Returns:
+        A dictionary with the keys name, unit, items, number, repeat, min,
+        median, mean, stdev, and iqr, all times in seconds per call, and rate,
+        the number of items per second at the median.
+    """
+    number = case.number if case.number else _calibrate(case.fn, min_time)
+    for i in range(warmup):
+        _time(case.fn, number)
+    times = [ _time(case.fn, number) / number for i in range(repeat) ]
+    median = statistics.median(times)
+    if len(times) >= 4:
+        quartiles = statistics.quantiles(times, n = 4)
+        iqr = quartiles[2] - quartiles[0]
+    else:
+        iqr = max(times) - min(times)
+    return {
+        'name': case.name,
+        'unit': case.unit,
+        'items': case.items,
+        'number': number,
+        'repeat': repeat,
+        'min': min(times),
+        'median': median,
+        'mean': statistics.mean(times),
+        'stdev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'iqr': iqr,
+        'rate': case.items / median if median else float('inf'),
+    }
+
+def _time(fn, number):
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        start = time.perf_counter()
+        for i in range(number):
+            fn()
+        return time.perf_counter() - start
+    finally:
+        if enabled:
+            gc.enable()
+
+def _calibrate(fn, min_time):
+    """Find a number of calls of fn lasting at least min_time."""
+    number = 1
+    while True:
+        if _time(fn, number) >= min_time:
+            return number
+        number *= 2
+
+def run(cases, *, repeat = 7, warmup = 1, min_time = 0.2, out = sys.stdout):
+    """Time cases one by one, printing a line per case as it finishes.
+
+    Returns:
+        A dictionary with the keys 'environment' and 'results', the latter a
+        list of the return values of measure().
+    """
+    results = []
+    print('{:<44}{:>14}{:>10}{:>18}'.format('case', 'median', 'iqr', 'rate'),
+            file = out)
+    for case in cases:
+        result = measure(case, repeat = repeat, warmup = warmup,
+                min_time = min_time)
+        results.append(result)
+        print('{:<44}{:>14}{:>9.1f}%{:>18}'.format(case.name,
+                format_time(result['median']),
+                100.0 * result['iqr'] / result['median'],
+                '{:.4g} {}/s'.format(result['rate'], case.unit)),
+                file = out, flush = True)
+    return {
+        'environment': {
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'time': time.time(),
+        },
+        'results': results,
+    }
+
+def compare(old, new, *, threshold = 0.05):
+    """Compare the results of two runs case by case.
+
+    A case regressed if its median grew by more than threshold and by more than
+    the sum of the interquartile ranges of both runs, i.e., beyond the noise.
+    Similarly for improvements.
+
+    Returns:
+        A list of tuples (name, old_median, new_median, ratio, verdict), where
+        verdict is 'regressed', 'improved', 'same', or 'new', and the medians
+        and ratio are None where not applicable.
+    """
+    old_results = { r['name']: r for r in old['results'] }
+    ret = []
+    for r in new['results']:
+        o = old_results.get(r['name'])
+        if o is None:
+            ret.append((r['name'], None, r['median'], None, 'new'))
+            continue
+        ratio = r['median'] / o['median']
+        noise = r['iqr'] + o['iqr']
+        delta = r['median'] - o['median']
+        if ratio > 1 + threshold and delta > noise:
+            verdict = 'regressed'
+        elif ratio < 1 / (1 + threshold) and -delta > noise:
+            verdict = 'improved'
+        else:
+            verdict = 'same'
+        ret.append((r['name'], o['median'], r['median'], ratio, verdict))
+    return ret
+
+def add_arguments(parser):
+    """Add the options shared by all benchmarks to an argparse parser."""
+    parser.add_argument('-r', '--repeat',
+            type = int,
+            default = 7,
+            help = 'number of timed repetitions')
+    parser.add_argument('--min-time',
+            metavar = 'SECONDS',
+            type = float,
+            default = 0.2,
+            help = 'minimal duration of a repetition')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            help = 'write the results to FILE as JSON')
+
+def main_run(args, cases):
+    """Run cases with the options added by add_arguments()."""
+    report = run(cases, repeat = args.repeat, min_time = args.min_time)
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf8') as f:
+            json.dump(report, f, indent = 2)
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('old',
+            metavar = 'OLD',
+            help = 'the results of the baseline run')
+    parser.add_argument('new',
+            metavar = 'NEW',
+            help = 'the results of the run to check')
+    parser.add_argument('-t', '--threshold',
+            type = float,
+            default = 0.05,
+            help = 'the relative slowdown tolerated, 0.05 = 5%%')
+    args = parser.parse_args()
+
+    with open(args.old, encoding = 'utf8') as f:
+        old = json.load(f)
+    with open(args.new, encoding = 'utf8') as f:
+        new = json.load(f)
+
+    rows = compare(old, new, threshold = args.threshold)
+    print('{:<44}{:>14}{:>14}{:>9}  {}'.format('case', 'old', 'new', 'ratio',
+            'verdict'))
+    for name, old_median, new_median, ratio, verdict in rows:
+        print('{:<44}{:>14}{:>14}{:>9}  {}'.format(name,
+                format_time(old_median) if old_median is not None else '-',
+                format_time(new_median),
+                '{:.3f}'.format(ratio) if ratio is not None else '-',
+                verdict))
+    if any(row[4] == 'regressed' for row in rows):
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
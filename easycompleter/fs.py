@@ -1,16 +1,223 @@
+import bisect
+import collections
 import glob
 import os
+import re
 
-def find_matches(text):
+# The maximal number of directory listings kept in the cache.
+_CACHE_SIZE = 64
+
+# Maps (st_dev, st_ino) of a directory to a tuple (mtime_ns, names, isdirs),
+# where names is the sorted list of entry names and isdirs[i] tells if names[i]
+# is a directory. Least recently used listings are evicted first.
+_cache = collections.OrderedDict()
+
+_magic_check = re.compile('[*?[]')
+
+def find_matches(text, *, fuzzy = False, limit = 50):
     r"""Find matching files for text.
 
     For this completer to function in Unix systems, the readline module must not
     treat \ and / as delimiters.
+
+    If fuzzy is True, the matching is delegated to fuzzy_matches() and at most
+    limit candidates are returned.
+
+    Directory listings are cached and invalidated when the modification time of
+    the directory changes, so that repeated completions in the same directory
+    cost one stat() call. Texts containing wildcard characters are matched with
+    the glob module.
     """
     path = os.path.expanduser(text)
     if os.path.isdir(path) and not path.endswith('/'):
         return [ text + '/' ]
 
+    if fuzzy:
+        return fuzzy_matches(text, limit = limit)
+
+    if _magic_check.search(path):
+        return _glob_matches(path)
+
+    dirname, prefix = os.path.split(path)
+    names, isdirs = listdir(dirname if dirname else '.')
+    lo = bisect.bisect_left(names, prefix)
+    hi = bisect.bisect_left(names, prefix + chr(0x10ffff), lo)
+    # Same as glob, hidden files only match a prefix starting with '.'.
+    show_hidden = prefix.startswith('.')
+    ret = []
+    for i in range(lo, hi):
+        name = names[i]
+        if not show_hidden and name.startswith('.'):
+            continue
+        fname = os.path.join(dirname, name)
+        ret.append(fname + '/' if isdirs[i] else fname)
+    return ret
+
+def fuzzy_matches(text, *, limit = 50):
+    """Find files whose path segments match those of text as subsequences.
+
+    For example, 'e/bs' matches 'easyshell/basic_shell.py'. A lowercase
+    segment matches case-insensitively. The segments '.', '..' and '~' are
+    taken literally.
+
+    The directories are listed with listdir(), whose cache serves as a lazily
+    built path index: a directory is only listed when a query reaches it, and
+    only the directories modified since are listed again by later queries.
+    Only the names containing the characters of a segment in order, found with
+    a regular expression, are scored with _fuzzy_score().
+
+    Arguments:
+        text: The text to complete.
+        limit: The maximal number of candidates to return.
+
+    Returns:
+        A list of at most limit paths, best matches first. Directories have a
+        trailing '/'.
+    """
+    path = os.path.expanduser(text)
+    segments = path.split('/')
+    if path.startswith('/'):
+        prefixes = [ (0, '/') ]
+        segments = segments[1:]
+    else:
+        prefixes = [ (0, '') ]
+    # The number of partial paths kept after each segment.
+    beam = max(limit, 32)
+
+    for i, segment in enumerate(segments):
+        is_last = i == len(segments) - 1
+        matches = []
+        is_subsequence = _subsequence_regex(segment).match
+        for score, prefix in prefixes:
+            if segment in ('.', '..', '~') or (not segment and not is_last):
+                if not is_last:
+                    matches.append((score, prefix + segment + '/'))
+                continue
+            names, isdirs = listdir(prefix if prefix else '.')
+            show_hidden = segment.startswith('.')
+            for name, isdir in zip(names, isdirs):
+                if not is_last and not isdir:
+                    continue
+                if not show_hidden and name.startswith('.'):
+                    continue
+                if not is_subsequence(name):
+                    continue
+                s = _fuzzy_score(segment, name)
+                if s is None:
+                    continue
+                fname = prefix + name
+                if is_last:
+                    matches.append((score + s, fname + '/' if isdir else fname))
+                else:
+                    matches.append((score + s, fname + '/'))
+        matches.sort(key = lambda x: (-x[0], x[1]))
+        prefixes = matches[:beam]
+
+    return [ fname for score, fname in prefixes[:limit] ]
+
+def _subsequence_regex(pattern):
+    """Compile a regular expression matching names that contain the characters
+    of pattern in order, with the same case rule as _fuzzy_score().
+
+    Every character is preceded by the class of all other characters, so that
+    names that do not match are rejected without backtracking.
+    """
+    flags = re.IGNORECASE if pattern.islower() else 0
+    return re.compile(''.join('[^{0}]*{0}'.format(re.escape(ch))
+            for ch in pattern), flags)
+
+def _fuzzy_score(pattern, name):
+    """Score how well pattern matches name as a subsequence.
+
+    Every matched character scores 1. Consecutive characters score 2 more and
+    characters at the beginning of a word score 3 more. Among all ways to match
+    pattern, the best one counts. Shorter names are preferred when the matches
+    are equally good.
+
+    Returns:
+        An integer, or None if pattern is not a subsequence of name.
+    """
+    if not pattern:
+        return 0
+    name_cmp = name.lower() if pattern.islower() else name
+    n = len(name)
+    # best[i] is the best score of matching the pattern so far with its last
+    # character at name[i], None if impossible.
+    best = [ None ] * n
+    for j, ch in enumerate(pattern):
+        prev = best
+        best = [ None ] * n
+        # The best score of prev[k] for k < i - 1.
+        running = 0 if j == 0 else None
+        for i in range(n):
+            if i >= 2 and prev[i - 2] is not None and j > 0:
+                if running is None or prev[i - 2] > running:
+                    running = prev[i - 2]
+            if name_cmp[i] != ch:
+                continue
+            bonus = 1
+            if i == 0 or name[i - 1] in '._- ':
+                bonus += 3
+            candidates = []
+            if running is not None:
+                candidates.append(running)
+            if j > 0 and i >= 1 and prev[i - 1] is not None:
+                candidates.append(prev[i - 1] + 2)
+            if candidates:
+                best[i] = max(candidates) + bonus
+    scores = [ x for x in best if x is not None ]
+    if not scores:
+        return None
+    return max(scores) * 100 - len(name)
+
+def listdir(path):
+    """List a directory, using the cached listing if it is still valid.
+
+    Arguments:
+        path: The path of the directory.
+
+    Returns:
+        A tuple (names, isdirs), where names is the sorted list of names of the
+        entries and isdirs[i] tells whether names[i] is a directory. Both are
+        empty if the directory cannot be listed.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return [], []
+
+    # Relative paths name different directories after a chdir, so the cache is
+    # keyed by the identity of the directory instead.
+    key = (st.st_dev, st.st_ino)
+    mtime = st.st_mtime_ns
+    cached = _cache.get(key)
+    if cached and cached[0] == mtime:
+        _cache.move_to_end(key)
+        return cached[1], cached[2]
+
+    entries = []
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    isdir = entry.is_dir()
+                except OSError:
+                    isdir = False
+                entries.append((entry.name, isdir))
+    except OSError:
+        return [], []
+    entries.sort()
+    names = [ name for name, isdir in entries ]
+    isdirs = [ isdir for name, isdir in entries ]
+
+    _cache[key] = (mtime, names, isdirs)
+    _cache.move_to_end(key)
+    if len(_cache) > _CACHE_SIZE:
+        _cache.popitem(last = False)
+    return names, isdirs
+
+def _glob_matches(path):
+    """Find matching files for a path containing wildcard characters."""
     pattern = path + '*'
     is_implicit_cwd = not (path.startswith('/') or path.startswith('./'))
     if is_implicit_cwd:
@@ -1,7 +1,24 @@
 import atexit
+import bisect
 import builtins
+import inspect
+import keyword
+import re
+import weakref
 import __main__
 
+# Returned by Completer._lookup() if the expression cannot be resolved without
+# side effects.
+_MISSING = object()
+
+_keywords = sorted(keyword.kwlist)
+
+# Maps a class to a tuple (signature, members), where members is a dictionary
+# mapping the names of its members, including the inherited ones, to whether
+# they are callable, and signature is returned by _class_signature() when the
+# members were collected.
+_class_members_cache = weakref.WeakKeyDictionary()
+
 class Completer:
     def __init__(self, namespace = None):
         """Create a new completer for the command line.
@@ -30,6 +47,11 @@ class Completer:
             self.use_main_ns = 0
             self.namespace = namespace
 
+        # Maps id(namespace) to a tuple (namespace, size, names), where names
+        # is the sorted list of the names in the namespace when it had size
+        # entries. The namespace is kept so that its id is not reused.
+        self._indexes = {}
+
     def complete(self, text, state):
         """Return the next possible completion for 'text'.
 
@@ -82,67 +104,184 @@ class Completer:
         Return a list of all keywords, built-in functions and names currently
         defined in self.namespace that match.
 
+        The names of each namespace are kept sorted and the matching names are
+        found by bisection. The sorted names are rebuilt when the size of the
+        namespace changes. Names deleted since are skipped. Names added without
+        changing the size are found only after the next rebuild.
         """
-        import keyword
-        matches = []
-        seen = {"__builtins__"}
-        n = len(text)
-        for word in keyword.kwlist:
-            if word[:n] == text:
-                seen.add(word)
-                matches.append(word)
+        matches = _prefix_matches(_keywords, text)
+        seen = set(matches)
+        seen.add("__builtins__")
         for nspace in [self.namespace, builtins.__dict__]:
-            for word, val in nspace.items():
-                if word[:n] == text and word not in seen:
-                    seen.add(word)
-                    matches.append(self._callable_postfix(val, word))
+            for word in _prefix_matches(self._index(nspace), text):
+                if word in seen:
+                    continue
+                try:
+                    val = nspace[word]
+                except KeyError:
+                    continue
+                seen.add(word)
+                matches.append(self._callable_postfix(val, word))
         return matches
 
+    def _index(self, nspace):
+        """Get the sorted names of a namespace, rebuilding them if outdated."""
+        entry = self._indexes.get(id(nspace))
+        if entry is None or entry[0] is not nspace or entry[1] != len(nspace):
+            names = sorted(word for word in list(nspace) \
+                    if isinstance(word, str))
+            entry = (nspace, len(nspace), names)
+            self._indexes[id(nspace)] = entry
+        return entry[2]
+
     def attr_matches(self, text):
         """Compute matches when text contains a dot.
 
         Assuming the text is of the form NAME.NAME....[NAME], and is
-        evaluable in self.namespace, it will be evaluated and its attributes
-        (as revealed by dir()) are used as possible completions.  (For class
-        instances, class members are also considered.)
-
-        WARNING: this can still invoke arbitrary C code, if an object
-        with a __getattr__ hook is evaluated.
+        resolvable in self.namespace, its attributes are used as possible
+        completions.
 
+        The object is resolved without evaluating the text or invoking
+        descriptors such as properties. The members of the object are found
+        statically in its __dict__ and in the __dict__ of the classes in the
+        MRO of its type, which are cached per type.
         """
-        import re
         m = re.match(r"(\w+(\.\w+)*)\.(\w*)", text)
         if not m:
             return []
         expr, attr = m.group(1, 3)
-        try:
-            thisobject = eval(expr, self.namespace)
-        except Exception:
+        thisobject = self._lookup(expr)
+        if thisobject is _MISSING:
             return []
 
-        # get the content of the object, except __builtins__
-        words = set(dir(thisobject))
-        words.discard("__builtins__")
-
-        if hasattr(thisobject, '__class__'):
-            words.add('__class__')
-            words.update(get_class_members(thisobject.__class__))
         matches = []
-        n = len(attr)
-        for word in words:
-            if word[:n] == attr:
-                try:
-                    val = getattr(thisobject, word)
-                except Exception:
-                    continue  # Exclude properties that are not set
-                word = self._callable_postfix(val, "%s.%s" % (expr, word))
-                matches.append(word)
+        for word, iscallable in get_members(thisobject).items():
+            if word.startswith(attr) and word != "__builtins__":
+                word = "%s.%s" % (expr, word)
+                matches.append(word + "(" if iscallable else word)
         matches.sort()
         return matches
 
-def get_class_members(klass):
-    ret = dir(klass)
-    if hasattr(klass,'__bases__'):
-        for base in klass.__bases__:
-            ret = ret + get_class_members(base)
+    def _lookup(self, expr):
+        """Resolve a dotted name without side effects.
+
+        Returns:
+            The object, or _MISSING if any part of the name is not found or
+            can only be resolved by invoking code, e.g., a property.
+        """
+        names = expr.split('.')
+        if names[0] in self.namespace:
+            obj = self.namespace[names[0]]
+        elif names[0] in builtins.__dict__:
+            obj = builtins.__dict__[names[0]]
+        else:
+            return _MISSING
+        for name in names[1:]:
+            try:
+                obj = _getattr_static(obj, name)
+            except AttributeError:
+                return _MISSING
+        return obj
+
+def _prefix_matches(words, text):
+    """Find the strings starting with text in a sorted list of strings."""
+    lo = bisect.bisect_left(words, text)
+    hi = bisect.bisect_left(words, text + chr(0x10ffff), lo)
+    return words[lo:hi]
+
+def _getattr_static(obj, name):
+    """Get an attribute without invoking descriptors defined in Python.
+
+    Descriptors implemented in C that merely read a slot or a field, e.g., the
+    members defined by __slots__, are resolved.
+
+    Raises:
+        AttributeError: The attribute is not found or is computed by code.
+    """
+    value = inspect.getattr_static(obj, name)
+    if isinstance(value, (staticmethod, classmethod)):
+        return value.__func__
+    if inspect.ismemberdescriptor(value) or inspect.isgetsetdescriptor(value):
+        if isinstance(obj, type):
+            return value
+        return value.__get__(obj, type(obj))
+    if isinstance(value, property):
+        raise AttributeError(name)
+    return value
+
+def _iscallable(value):
+    """Is the value, as found in a __dict__, callable or not."""
+    return callable(value) or isinstance(value, (staticmethod, classmethod))
+
+def _class_members(klass):
+    """Get the members of a class, including those inherited.
+
+    The cached members are collected again when the class, or any class in its
+    MRO, gains or loses members, e.g., via setattr() or delattr(), or when the
+    MRO changes. Replacing the value of an existing member is not noticed.
+
+    Returns:
+        A dictionary mapping names of members to whether they are callable. The
+        dictionary is cached and must not be modified.
+    """
+    mro = inspect.getmro(klass)
+    signature = _class_signature(mro)
+    try:
+        cached = _class_members_cache[klass]
+    except (KeyError, TypeError):
+        cached = None
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    ret = {}
+    for base in mro:
+        try:
+            members = vars(base)
+        except TypeError:
+            continue
+        for name, value in members.items():
+            if not name in ret:
+                ret[name] = _iscallable(value)
+    try:
+        _class_members_cache[klass] = (signature, ret)
+    except TypeError:
+        pass
     return ret
+
+def _class_signature(mro):
+    """Get what changes when members are added to or removed from the classes
+    of an MRO, i.e., the classes and the sizes of their __dict__.
+
+    The classes are identified by id(), as the cache must not keep them alive.
+    The ids are stable while the class of the MRO is alive.
+    """
+    ret = []
+    for base in mro:
+        try:
+            ret.append((id(base), len(vars(base))))
+        except TypeError:
+            ret.append((id(base), -1))
+    return tuple(ret)
+
+def get_members(obj):
+    """Get the members of an object statically.
+
+    Returns:
+        A dictionary mapping names of members to whether they are callable.
+    """
+    ret = dict(_class_members(type(obj)))
+    ret['__class__'] = True
+    if isinstance(obj, type):
+        ret.update(_class_members(obj))
+    try:
+        instance_dict = object.__getattribute__(obj, '__dict__')
+    except (AttributeError, TypeError):
+        instance_dict = None
+    if isinstance(instance_dict, dict):
+        for name, value in instance_dict.items():
+            if isinstance(name, str):
+                ret[name] = callable(value)
+    return ret
+
+def get_class_members(klass):
+    """Get the names of the members of a class, including those inherited."""
+    return list(_class_members(klass))
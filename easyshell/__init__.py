@@ -4,7 +4,25 @@ from .base import deprecated, isdeprecated, \
         helper, ishelper, \
         completer, iscompleter, \
         subshell
-from .basic_shell import BasicShell
-from .debugging_shell import DebuggingShell
-from .example_shell import MyShell
-from .shell import Shell
+
+# The shell classes are imported on first access, so that importing the
+# decorators alone does not import the modules of all the shells.
+_lazy_classes = {
+    'BasicShell': 'basic_shell',
+    'DebuggingShell': 'debugging_shell',
+    'MyShell': 'example_shell',
+    'Shell': 'shell',
+}
+
+def __getattr__(name):
+    module = _lazy_classes.get(name)
+    if module is None:
+        raise AttributeError("module '{}' has no attribute '{}'".format(
+                __name__, name))
+    import importlib
+    value = getattr(importlib.import_module('.' + module, __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(list(globals().keys()) + list(_lazy_classes.keys()))
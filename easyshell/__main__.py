@@ -3,7 +3,6 @@
 
 import argparse
 import sys
-import subprocess
 
 from .example_shell import MyShell
 from .main import update_parser
@@ -14,8 +13,78 @@ if __name__ == '__main__':
             formatter_class = argparse.ArgumentDefaultsHelpFormatter)
     update_parser(parser)
     args = parser.parse_args()
+    if (args.checkpoint or args.fail_fast or args.max_errors is not None) and \
+            not args.blocks:
+        parser.error('--checkpoint, --fail-fast, and --max-errors require'
+                ' --blocks')
+    if args.resume and not args.checkpoint:
+        parser.error('--resume requires --checkpoint')
 
-    if args.file:
+    sample_profile = args.sample_profile
+    if sample_profile:
+        from . import sampler
+        sampler.start(rate = args.sample_rate)
+    exporter = None
+    if args.metrics_file:
+        from . import metrics
+        exporter = metrics.Exporter(args.metrics_file,
+                fmt = args.metrics_format, interval = args.metrics_interval)
+        exporter.start()
+    tracer = None
+    if args.trace:
+        from . import hooks
+        tracer = hooks.JsonlTracer(args.trace)
+        tracer.start()
+    recorder = None
+    if args.record:
+        from . import replay
+        recorder = replay.Recorder(args.record)
+        recorder.start()
+
+    # The exit code of the process.
+    status = 0
+    if args.blocks and (args.command is not None or args.file):
+        from . import script
+        content = args.command if args.command is not None else \
+                args.file.read()
+        cache_dir = None
+        if not args.no_plan_cache:
+            cache_dir = args.plan_cache or script.default_cache_dir()
+        try:
+            plan = script.load_plan(content, MyShell, cache_dir = cache_dir)
+        except script.ScriptError as e:
+            sys.stderr.write('{}\n'.format(e))
+            sys.exit(2)
+        for e in plan.errors:
+            sys.stderr.write('{}\n'.format(e))
+        if plan.errors:
+            sys.exit(2)
+        if not args.check:
+            checkpoint = None
+            if args.checkpoint:
+                checkpoint = script.Checkpoint(args.checkpoint,
+                        interval = args.checkpoint_interval)
+            executor = script.BlockExecutor(MyShell(
+                    batch_mode = True,
+                    debug = args.debug,
+                    root_prompt = args.root_prompt,
+            ), checkpoint = checkpoint,
+                    max_errors = 1 if args.fail_fast else args.max_errors,
+                    batch_size = args.batch_size)
+            try:
+                executor.run_plan(plan, resume = args.resume)
+            except ValueError as e:
+                sys.stderr.write('{}\n'.format(e))
+                sys.exit(2)
+            if executor.stopped:
+                status = 1
+    elif args.command is not None:
+        status = MyShell(
+                batch_mode = True,
+                debug = args.debug,
+                root_prompt = args.root_prompt,
+        ).batch_lines(args.command.split('\n'))
+    elif args.file:
         MyShell(
                 batch_mode = True,
                 debug = args.debug,
@@ -24,5 +93,34 @@ if __name__ == '__main__':
         ).batch_string(args.file.read())
     else:
         d = vars(args)
+        del d['blocks']
+        del d['check']
+        del d['plan_cache']
+        del d['no_plan_cache']
+        del d['checkpoint']
+        del d['checkpoint_interval']
+        del d['resume']
+        del d['fail_fast']
+        del d['batch_size']
+        del d['max_errors']
+        del d['command']
         del d['file']
+        del d['sample_profile']
+        del d['sample_rate']
+        del d['metrics_file']
+        del d['metrics_format']
+        del d['metrics_interval']
+        del d['trace']
+        del d['record']
         MyShell(**d).cmdloop()
+
+    if sample_profile:
+        sampler.stop(sample_profile)
+    if exporter:
+        exporter.stop()
+    if tracer:
+        tracer.stop()
+    if recorder:
+        recorder.stop()
+    if status:
+        sys.exit(status)
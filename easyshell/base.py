@@ -19,15 +19,42 @@
 """A generic class to build line-oriented command interpreters.
 """
 
-import multiprocessing
+import bisect
+import collections
+import contextlib
+import functools
 import os
-import readline
 import shlex
-import subprocess
 import sys
-import tempfile
 import textwrap
-import traceback
+import time
+
+# easyshell.hooks and easyshell.metrics are imported on first use, see
+# _active_hooks() and _metrics().
+_HOOKS_MODULE = __package__ + '.hooks'
+_metrics_module = None
+
+def _format_exc():
+    """Format the exception being handled, importing traceback only then."""
+    import traceback
+    return traceback.format_exc()
+
+def _active_hooks():
+    """Get the easyshell.hooks module if any hook is registered, else None.
+
+    Hooks are registered via that module, so that no hook is registered unless
+    it was imported by someone else.
+    """
+    hooks = sys.modules.get(_HOOKS_MODULE)
+    return hooks if hooks is not None and hooks.active else None
+
+def _metrics():
+    """Get the easyshell.metrics module, imported when first recording."""
+    global _metrics_module
+    if _metrics_module is None:
+        from . import metrics
+        _metrics_module = metrics
+    return _metrics_module
 
 def isdeprecated(f):
     """Is the function object deprecated or not."""
@@ -44,23 +71,36 @@ def deprecated(f):
 
     Add a __deprecated__ field to the input object and set it to True.
     """
-    def inner_func(*args, **kwargs):
+    def warn():
         print(textwrap.dedent("""\
                 This command is deprecated and is subject to complete
                 removal at any later version without notice.
                 """))
-        f(*args, **kwargs)
+    def inner_func(*args, **kwargs):
+        warn()
+        return f(*args, **kwargs)
     inner_func.__deprecated__ = True
     inner_func.__doc__ = f.__doc__
     inner_func.__name__ = f.__name__
     if iscommand(f):
         inner_func.__command__ = f.__command__
+    if hasattr(f, '__complete_spec__'):
+        inner_func.__complete_spec__ = f.__complete_spec__
+    if hasattr(f, '__command_parser__'):
+        inner_func.__command_parser__ = f.__command_parser__
+    if hasattr(f, '__batch__'):
+        def batch_func(*args, **kwargs):
+            warn()
+            return f.__batch__(*args, **kwargs)
+        inner_func.__batch__ = batch_func
     return inner_func
 
 # Decorators with arguments is a little bit tricky to get right. A good
 # thread on it is:
 #       http://stackoverflow.com/questions/5929107/python-decorators-with-parameters
-def command(*commands, visible = True, internal = False, nargs = '*'):
+def command(*commands, visible = True, internal = False, nargs = '*',
+        choices = None, choices_fn = None, int_range = None, files = False,
+        parser = None, batch = False):
     """Decorate a function to be the entry function of commands.
 
     Arguments:
@@ -68,6 +108,18 @@ def command(*commands, visible = True, internal = False, nargs = '*'):
         visible: This command is visible in tab completions.
         internal: The lexing rule is unchanged even if the parse_line() method
             is overloaded in the subclasses.
+        choices, choices_fn, int_range, files: Declarative completion of the
+            first argument. See the doc string of the _CompletionSpec class.
+            A completer registered via the @completer decorator takes
+            precedence over these.
+        parser: A function taking no arguments and returning an instance of
+            argparse.ArgumentParser. The parser is built on first use and
+            cached. If specified, the nargs argument is ignored, the arguments
+            are parsed by the parser, and the command method receives the
+            resulting argparse.Namespace object instead of the list of
+            arguments. Unless the command has other completion means, the
+            options and choices of the parser drive the completion. The help
+            message of the parser is the ?<TAB> help message of the command.
         nargs: Short for number of arguments. Similar to the nargs argument in
             the argparse module. Has the following valid values:
                     a non-negative integer
@@ -79,6 +131,13 @@ def command(*commands, visible = True, internal = False, nargs = '*'):
             the number of arguments. If it does not match this nargs argument,
             an error message will be printed to self.stderr and the shell is
             resumed.
+        batch: The command method receives a list of argument vectors, each
+            as it would receive them without batch, instead of one. A line
+            executes the method with a list of one vector, while executors of
+            scripts, e.g., easyshell.script.BlockExecutor, pass the vectors of
+            runs of consecutive lines of the command at once, e.g., to use
+            bulk I/O. Vectors failing the nargs check or the parser are
+            reported and left out.
 
     ----------------------------
     Interface of command methods:
@@ -111,51 +170,381 @@ def command(*commands, visible = True, internal = False, nargs = '*'):
             if not isinstance(ele, int) or ele < 0:
                 raise RuntimeError(err_str)
 
+    command_parser = _CommandParser(parser) if parser else None
+    spec = None
+    if choices or choices_fn or int_range is not None or files:
+        spec = _CompletionSpec(choices = choices, choices_fn = choices_fn,
+                int_range = int_range, files = files)
+
     def decorated_func(f):
         def inner_func(self, cmd, args):
+            if batch:
+                return batch_func(self, cmd, [ args ])
+            if command_parser:
+                args = command_parser.parse(self, cmd, args)
+                if args is None:
+                    return
+                return f(self, cmd, args)
             # Check the number of args according to nargs.
-            n = len(args)
-            if isinstance(nargs, str):
-                if nargs == '*':
-                    pass
-                elif nargs == '?':
-                    if n > 1:
-                        self.error("{}: expect 0 or 1 argument, provided {}: {}\n".
-                                format(cmd, n, args))
-                        return
-                elif nargs == '+':
-                    if n == 0:
-                        self.error("{}: expect 1 or more arguments, provided {}: {}\n".
-                                format(cmd, n, args))
-                        return
-            elif isinstance(nargs, int):
-                if n != nargs:
-                        self.error("{}: expect {} arguments, provided {}: {}\n".
-                                format(cmd, nargs, n, args))
-                        return
-            else:
-                # nargs is already converted to a list.
-                if not n in nargs:
-                        self.error("{}: the number of arguments could be one of "
-                                "{}, provided {}: {}\n".
-                                format(cmd, nargs, n, args))
-                        return
+            msg = _check_nargs(cmd, nargs, args)
+            if msg:
+                self.error(msg)
+                return
             return f(self, cmd, args)
+        def batch_func(self, cmd, argvs):
+            valid = []
+            for args in argvs:
+                if command_parser:
+                    args = command_parser.parse(self, cmd, args)
+                    if args is None:
+                        continue
+                else:
+                    msg = _check_nargs(cmd, nargs, args)
+                    if msg:
+                        self.error(msg)
+                        continue
+                valid.append(args)
+            if valid:
+                return f(self, cmd, valid)
         inner_func.__name__ = f.__name__
         inner_func.__doc__ = f.__doc__
         inner_func.__command__ = {
                 'commands': list(commands),
                 'visible': visible,
                 'internal': internal,
+                'nargs': nargs,
+                'batch': batch,
         }
         # If f is deprecated, inner_func should also be deprecated. Do not use
         # the deprecated() function directly, as that adds duplicate warning
         # message.
         if isdeprecated(f):
             inner_func.__deprecated__ = True
+        if spec:
+            inner_func.__complete_spec__ = spec
+        if command_parser:
+            inner_func.__command_parser__ = command_parser
+        if batch:
+            inner_func.__batch__ = batch_func
         return inner_func
     return decorated_func
 
+def _check_nargs(cmd, nargs, args):
+    """Check the number of arguments of a command, see command().
+
+    Returns:
+        The error message if the number does not match nargs, or None.
+    """
+    n = len(args)
+    if isinstance(nargs, str):
+        if nargs == '?' and n > 1:
+            return "{}: expect 0 or 1 argument, provided {}: {}\n".format(cmd,
+                    n, args)
+        if nargs == '+' and n == 0:
+            return "{}: expect 1 or more arguments, provided {}: {}\n".format(
+                    cmd, n, args)
+    elif isinstance(nargs, int):
+        if n != nargs:
+            return "{}: expect {} arguments, provided {}: {}\n".format(cmd,
+                    nargs, n, args)
+    elif not n in nargs:
+        # nargs is already converted to a list.
+        return "{}: the number of arguments could be one of {}, provided {}:" \
+                " {}\n".format(cmd, nargs, n, args)
+    return None
+
+
+class _CompletionSpec(object):
+
+    """Declarative completion of the first argument of a command.
+
+    Fixed candidates are sorted once, when the command is decorated. Prefix
+    queries are then answered by bisecting the sorted list instead of scanning
+    all candidates.
+
+    Attributes:
+        choices: An iterable of fixed candidate strings.
+        choices_fn: A function taking the shell object and returning an
+            iterable of candidates that depend on the state of the shell. The
+            candidates are converted to strings.
+        int_range: A range of integers as fixed candidates.
+        files: Complete file names with easycompleter.fs.find_matches(). If it
+            is 'fuzzy', the file names are matched fuzzily.
+    """
+
+    def __init__(self, *, choices, choices_fn, int_range, files):
+        words = set(choices) if choices else set()
+        if int_range is not None:
+            words.update(str(i) for i in int_range)
+        self._words = sorted(words)
+        self._choices_fn = choices_fn
+        self._files = files
+
+    def complete(self, shell, args, text):
+        """The completer method generated from this spec."""
+        if args:
+            return []
+        ret = _prefix_matches(self._words, text)
+        if self._choices_fn:
+            words = sorted({ str(x) for x in self._choices_fn(shell) })
+            ret += _prefix_matches(words, text)
+        if self._files:
+            import easycompleter
+            ret += easycompleter.fs.find_matches(text,
+                    fuzzy = self._files == 'fuzzy')
+        return ret
+
+
+class _CommandParser(object):
+
+    """The argparse parser of a command.
+
+    The parser is built by the factory on first use and cached. As commands are
+    class members, this happens once per class, not once per call.
+
+    The options and choices of the parser are compiled to sorted lists on first
+    completion, which are queried in the same way as _CompletionSpec does.
+
+    Successful parses are cached by their arguments, as a few forms, e.g.,
+    'exit' or 'stack 0', make up most calls of built-in commands. Parsers with
+    actions whose results are not plain values, e.g., argparse.FileType or
+    'append', are not cached.
+    """
+
+    # The maximal number of cached parses per parser.
+    cache_size = 256
+
+    # The actions and types whose results do not depend on anything but the
+    # arguments and are not mutated in place.
+    _pure_actions = ('_StoreAction', '_StoreConstAction', '_StoreTrueAction',
+            '_StoreFalseAction', '_CountAction', '_HelpAction')
+    _pure_types = (None, int, float, str)
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._parser = None
+        self._options = None
+        self._cache = None
+
+    @property
+    def parser(self):
+        if self._parser is None:
+            self._parser = self._factory()
+        return self._parser
+
+    def __cacheable(self):
+        for action in self.parser._actions:
+            if type(action).__name__ not in self._pure_actions or \
+                    action.type not in self._pure_types:
+                return False
+            if isinstance(action.default, (list, dict, set)) or \
+                    isinstance(action.const, (list, dict, set)):
+                return False
+        return True
+
+    def parse(self, shell, cmd, args):
+        """Parse the arguments of a command.
+
+        Messages of the parser, including the usage printed upon errors, are
+        written to shell.stdout and shell.stderr.
+
+        Returns:
+            An argparse.Namespace object, or None if the parser exited, e.g.,
+            due to invalid arguments or the -h option.
+        """
+        if self._cache is None:
+            self._cache = {} if self.__cacheable() else False
+        if self._cache is not False:
+            key = tuple(args)
+            namespace = self._cache.get(key)
+            if namespace is not None:
+                return _copy_namespace(namespace)
+        parser = self.parser
+        parser.prog = cmd
+        with contextlib.redirect_stdout(shell.stdout), \
+                contextlib.redirect_stderr(shell.stderr):
+            try:
+                namespace = parser.parse_args(args)
+            except SystemExit as e:
+                if e.code:
+                    shell.status = e.code
+                return None
+        if self._cache is not False and len(self._cache) < self.cache_size:
+            self._cache[key] = _copy_namespace(namespace)
+        return namespace
+
+    def format_help(self, cmd):
+        """Get the help message of the parser for a command."""
+        parser = self.parser
+        parser.prog = cmd
+        return parser.format_help()
+
+    def complete(self, shell, args, text):
+        """The completer method derived from the parser."""
+        if self._options is None:
+            self.__compile()
+        args = args if args else []
+
+        # Complete the value of an option.
+        if args and args[-1] in self._optionals.keys():
+            action = self._optionals[args[-1]]
+            if action.nargs != 0:
+                return _prefix_matches(self._choices[action], text)
+
+        if text.startswith('-'):
+            return _prefix_matches(self._options, text)
+
+        # Find the positional argument being completed.
+        npos = 0
+        skip = False
+        for arg in args:
+            if skip:
+                skip = False
+            elif arg in self._optionals.keys():
+                skip = self._optionals[arg].nargs != 0
+            elif not arg.startswith('-'):
+                npos += 1
+        for action in self._positionals:
+            if action.nargs in ('*', '+', '...') or npos <= 0:
+                return _prefix_matches(self._choices[action], text)
+            npos -= 1 if action.nargs in (None, '?') else action.nargs
+        return []
+
+    def __compile(self):
+        optionals = {}
+        positionals = []
+        choices = {}
+        for action in self.parser._actions:
+            if action.option_strings:
+                for option in action.option_strings:
+                    optionals[option] = action
+            else:
+                positionals.append(action)
+            choices[action] = sorted({ str(x) for x in action.choices }) \
+                    if action.choices else []
+        self._optionals = optionals
+        self._positionals = positionals
+        self._choices = choices
+        self._options = sorted(optionals.keys())
+
+
+def _copy_namespace(namespace):
+    """Copy a namespace of parsed arguments, and the lists of values in it, in
+    case the command modifies them."""
+    return type(namespace)(**{ k: list(v) if isinstance(v, list) else v
+            for k, v in vars(namespace).items() })
+
+
+def strip_tokens(line, n):
+    """Strip the first n tokens off a line and keep the rest verbatim.
+
+    The tokens are found with the same rules as shlex.split(). Unlike joining
+    the remaining tokens, quotes and whitespace in the rest are preserved.
+
+    Returns:
+        The rest of the line, with leading whitespace removed.
+    """
+    lex = shlex.shlex(line, posix = True)
+    lex.whitespace_split = True
+    lex.commenters = ''
+    for _ in range(n):
+        if lex.get_token() is None:
+            return ''
+    return line[lex.instream.tell():].lstrip()
+
+
+def format_time(seconds):
+    """Format a duration with a unit that fits its magnitude, e.g., 1.234 ms."""
+    for unit, scale in (('s', 1.0), ('ms', 1e-3), ('us', 1e-6)):
+        if seconds >= scale:
+            return '{:.3f} {}'.format(seconds / scale, unit)
+    return '{:.1f} ns'.format(seconds / 1e-9)
+
+
+def positive_int(s):
+    """Convert a command line argument to a positive integer.
+
+    Used as the type of argparse arguments, e.g., of rates and counts.
+
+    Raises:
+        argparse.ArgumentTypeError: s is not a positive integer.
+    """
+    try:
+        value = int(s)
+    except ValueError:
+        value = 0
+    if value <= 0:
+        import argparse
+        raise argparse.ArgumentTypeError(
+                "expect a positive integer: '{}'".format(s))
+    return value
+
+
+# The sequencing operators, see split_sequence().
+SEQUENCE_OPERATORS = (';', '&&', '||')
+
+def split_sequence(line):
+    """Split a line into commands at the sequencing operators.
+
+    The operators are ';', '&&', and '||' outside quotes and not escaped by a
+    backslash, following the same quoting rules as shlex.split(). Quotes and
+    backslashes are kept in the commands, to be lexed by the shells.
+
+    A command whose first token is '!' extends to the end of the line, as its
+    arguments are passed to the system shell verbatim, operators included.
+
+    Returns:
+        A list of tuples (op, command), where op is the operator preceding the
+        command, ';' for the first one. Empty commands are dropped.
+    """
+    ret = []
+    op = ';'
+    start = 0
+    quote = None
+    escaped = False
+    i = 0
+    n = len(line)
+    verbatim = _is_system_command(line, start)
+    while i < n and not verbatim:
+        c = line[i]
+        if escaped:
+            escaped = False
+        elif c == '\\' and quote != "'":
+            escaped = True
+        elif quote:
+            if c == quote:
+                quote = None
+        elif c in '\'"':
+            quote = c
+        elif c == ';' or line.startswith('&&', i) or line.startswith('||', i):
+            segment = line[start:i].strip()
+            if segment:
+                ret.append((op, segment))
+            op = ';' if c == ';' else c + c
+            i += len(op)
+            start = i
+            verbatim = _is_system_command(line, start)
+            continue
+        i += 1
+    segment = line[start:].strip()
+    if segment:
+        ret.append((op, segment))
+    return ret
+
+def _is_system_command(line, start):
+    """Whether the first token of line[start:] is '!', see split_sequence()."""
+    rest = line[start:].lstrip()
+    return rest[:1] == '!' and rest[1:2].isspace() or rest == '!'
+
+
+def _prefix_matches(words, text):
+    """Find the strings starting with text in a sorted list of strings."""
+    if not text:
+        return list(words)
+    lo = bisect.bisect_left(words, text)
+    hi = bisect.bisect_left(words, text + chr(0x10ffff), lo)
+    return words[lo:hi]
+
 
 # The naming convention is same as the inspect module, which has such predicate
 # methods as isfunction, isclass, ismethod, etc..
@@ -268,9 +657,16 @@ def subshell(shell_cls, *commands, **kwargs):
     """Decorate a function to conditionally launch a _ShellBase subshell.
 
     Arguments:
-        shell_cls: A subclass of _ShellBase to be launched.
+        shell_cls: A subclass of _ShellBase to be launched, or its import path
+            as a string 'package.module:ClassName'. An import path is resolved
+            when the subshell is first entered, so the module of the subshell
+            is not imported until then, and may refer to a class defined later
+            or in a module importing this one. A path starting with '.' is
+            relative to the package of the module of the decorated function.
         commands: Names of command that should trigger this function object.
-        kwargs: The keyword arguments for the command decorator method.
+        kwargs: The keyword arguments for the command decorator method. If a
+            parser is specified, the decorated function receives the parsed
+            arguments while the subshell receives the raw list of arguments.
 
     -----------------------------
     Interface of methods decorated by this decorator method:
@@ -301,9 +697,21 @@ def subshell(shell_cls, *commands, **kwargs):
             '''
             pass
     """
+    parser = kwargs.pop('parser', None)
+    command_parser = _CommandParser(parser) if parser else None
+    if kwargs.get('batch'):
+        raise RuntimeError('subshell: commands entering subshells cannot be'
+                ' batched')
+
     def decorated_func(f):
         def inner_func(self, cmd, args):
-            retval = f(self, cmd, args)
+            if command_parser:
+                parsed_args = command_parser.parse(self, cmd, args)
+                if parsed_args is None:
+                    return
+                retval = f(self, cmd, parsed_args)
+            else:
+                retval = f(self, cmd, args)
             # Do not launch the subshell if the return value is None.
             if not retval:
                 return
@@ -315,12 +723,17 @@ def subshell(shell_cls, *commands, **kwargs):
             else:
                 prompt = retval
                 context = {}
-            return self.launch_subshell(shell_cls, cmd, args,
-                    prompt = prompt, context = context)
+            return self.launch_subshell(resolve_shell_cls(shell_cls,
+                    package = f.__module__), cmd, args, prompt = prompt,
+                    context = context)
         inner_func.__name__ = f.__name__
         inner_func.__doc__ = f.__doc__
         obj = command(*commands, **kwargs)(inner_func) if commands else inner_func
         obj.__launch_subshell__ = shell_cls
+        # The package relative import paths are resolved against.
+        obj.__subshell_package__ = f.__module__
+        if command_parser:
+            obj.__command_parser__ = command_parser
         return obj
     return decorated_func
 
@@ -329,6 +742,134 @@ def issubshellcommand(f):
     """Does the function object launch a subshell or not."""
     return hasattr(f, '__launch_subshell__')
 
+
+# Shell classes resolved by resolve_shell_cls(), keyed by (path, package).
+_resolved_shell_classes = {}
+
+def resolve_shell_cls(shell_cls, *, package = None):
+    """Resolve the import path of a shell class.
+
+    Arguments:
+        shell_cls: A class, returned as is, or an import path of the form
+            'package.module:ClassName'. The class name may be dotted for
+            nested classes.
+        package: The module relative paths, i.e., those starting with '.', are
+            resolved against. A module name is taken to mean its package.
+
+    Raises:
+        ValueError: The path is malformed.
+        ImportError, AttributeError: The class cannot be found.
+    """
+    if not isinstance(shell_cls, str):
+        return shell_cls
+    key = (shell_cls, package)
+    cls = _resolved_shell_classes.get(key)
+    if cls is not None:
+        return cls
+    module_name, sep, qualname = shell_cls.partition(':')
+    if not sep or not module_name or not qualname:
+        raise ValueError("invalid shell class path: '{}', expect"
+                " 'package.module:ClassName'".format(shell_cls))
+    import importlib
+    anchor = None
+    if module_name.startswith('.'):
+        if not package:
+            raise ValueError("relative shell class path without a package:"
+                    " '{}'".format(shell_cls))
+        # A module name, e.g., the __module__ of a function, is resolved to
+        # its package, like relative imports in that module.
+        anchor = package if _is_package(package) else package.rpartition('.')[0]
+    cls = importlib.import_module(module_name, anchor)
+    for attr in qualname.split('.'):
+        cls = getattr(cls, attr)
+    _resolved_shell_classes[key] = cls
+    return cls
+
+def _is_package(name):
+    module = sys.modules.get(name)
+    return module is not None and hasattr(module, '__path__')
+
+
+# The entry points of plugin groups, keyed by group name, see
+# _ShellBase.plugin_group.
+_plugin_entry_points = {}
+
+def _find_plugins(group):
+    """Find the entry points of a group without loading them.
+
+    Returns:
+        A list of tuples (name, value), sorted by name.
+    """
+    ret = _plugin_entry_points.get(group)
+    if ret is None:
+        import importlib.metadata
+        eps = importlib.metadata.entry_points()
+        if hasattr(eps, 'select'):
+            eps = eps.select(group = group)
+        else:
+            eps = eps.get(group, [])
+        ret = sorted({ (ep.name, ep.value) for ep in eps })
+        _plugin_entry_points[group] = ret
+    return ret
+
+class _Sequence(object):
+
+    """The state of the sequencing operators, shared by a shell and all its
+    subshells.
+
+    The commands following the first one in a line are pending until the shell
+    on top of the stack executes them, so that a command entering a subshell is
+    followed by commands executed in that subshell, and exit directives move
+    the rest of the line to the shell exited to.
+
+    Attributes:
+        pending: A collections.deque of tuples (op, command), see
+            split_sequence().
+        status: The status of the last command executed, 0 for success.
+    """
+
+    def __init__(self):
+        self.pending = collections.deque()
+        self.status = 0
+
+    def push(self, segments):
+        """Queue commands ahead of those already pending."""
+        self.pending.extendleft(reversed(segments))
+
+    def next_command(self):
+        """Pop the next pending command to execute.
+
+        Commands are skipped as in POSIX shells: after '&&' if the status is a
+        failure, after '||' if it is a success. Skipping does not change the
+        status.
+
+        Returns:
+            The command, or None if no command is pending.
+        """
+        while self.pending:
+            op, command = self.pending.popleft()
+            if op == '&&' and self.status != 0:
+                continue
+            if op == '||' and self.status == 0:
+                continue
+            return command
+        return None
+
+
+class _LineSource(object):
+
+    """Feed lines to shells in batch mode in place of a pipe end."""
+
+    def __init__(self, lines):
+        self._lines = iter(lines)
+
+    def recv(self):
+        try:
+            return next(self._lines)
+        except StopIteration:
+            raise EOFError
+
+
 class _ShellBase(object):
 
     """Base shell class.
@@ -378,46 +919,99 @@ class _ShellBase(object):
     #     ~     |  Allow '~' to be expanded to $HOME.
     _non_delims = r'-/\~'
 
+    # A tuple (shell, cmd) of the command being executed by any shell in this
+    # process, None if no command is being executed. Read by the sampling
+    # profiler to tag its samples.
+    _active_command = None
+
+    # Whether ';', '&&', and '||' separate commands in a line, see
+    # split_sequence(). Shells whose commands take code, e.g., python, turn it
+    # off.
+    sequencing = True
+
+    # The name of the entry point group of plugin subshells, None for none.
+    # Every entry point of the group adds a command, the name of the entry
+    # point, entering the subshell class the entry point refers to, e.g.,
+    #       [options.entry_points]
+    #       myshell.plugins =
+    #           deploy = mypkg.deploy:DeployShell
+    # Plugins are found when the first shell of the class is instantiated, but
+    # only imported when their command is executed. A class also has the
+    # plugins of the groups of its base classes.
+    plugin_group = None
+
+    # The number of recently used commands whose completion candidates are
+    # speculatively computed while waiting for input. 0 turns it off.
+    prefetch_depth = 3
+
     def __init__(self, *,
             batch_mode = False,
             debug = False,
             mode_stack = [],
             pipe_end = None,
             root_prompt = 'root',
+            sequence = None,
             stdout = sys.stdout,
             stderr = sys.stderr,
             temp_dir = None):
         """Instantiate a line-oriented interpreter framework.
 
         Arguments:
-            batch_mode: stdin is superseded by the pipe_end.
+            batch_mode: stdin is superseded by the pipe_end. Readline and
+                history files are not used.
             debug: If True, print_debug() prints to self.stderr.
             mode_stack: A stack of _ShellBase._Mode objects.
-            pipe_end: The receiving end of the pipe when run in batch mode.
+            pipe_end: The receiving end of the pipe when run in batch mode, or
+                any object whose recv() method returns the next line and
+                raises EOFError after the last.
             root_prompt: The root prompt.
+            sequence: The _Sequence object shared with the parent shell. The
+                default, None, means to create one, i.e., for the root shell.
             stdout, stderr: The file objects to write to for output and error.
             temp_dir: The temporary directory to save history files. The default
-                value, None, means to generate such a directory.
+                value, None, means to use that of the root shell, or, for the
+                root shell, to generate such a directory, in batch mode only
+                when first needed.
         """
         self.batch_mode = batch_mode
         self._pipe_end = pipe_end
+        self._sequence = sequence if sequence else _Sequence()
         self.debug = debug
         self.stdout = stdout
         self.stderr = stderr
         self._mode_stack = mode_stack
         self.root_prompt = root_prompt
-        self._temp_dir = temp_dir if temp_dir else tempfile.mkdtemp()
-        os.makedirs(os.path.join(self._temp_dir, 'history'), exist_ok = True)
+        self.__temp_dir = temp_dir
+        self.__temp_dir_ready = False
 
-        readline.parse_and_bind('tab: complete')
+        # Batch mode does not use readline at all, not even importing it, which
+        # reads the configuration of the terminal and the inputrc file.
+        if not batch_mode:
+            # Create the directory now, to share it with the subshells.
+            self._ensure_temp_dir()
+            import readline
+            readline.parse_and_bind('tab: complete')
+
+        type(self)._load_plugins()
 
         # Even though __build_XXX_map() methods are class methods, they must be
         # called via self. Otherwise they cannot find the commands.
         self._cmd_map_all, self._cmd_map_visible, self._cmd_map_internal = self.__build_cmd_maps()
         self._helper_map = self.__build_helper_map()
         self._completer_map = self.__build_completer_map()
+        self._spec_map = self.__build_spec_map(self._completer_map)
 
         self.__completion_candidates = []
+        # The line whose command is being executed, see __exec_line__().
+        self._line = ''
+        # If True, the next launch_subshell() returns the subshell instead of
+        # running it, see easyshell.script.
+        self._enter_only = False
+        self._prefetcher = None
+        if not batch_mode:
+            from .prefetch import CompletionPrefetcher
+            self._prefetcher = CompletionPrefetcher(self,
+                    depth = self.prefetch_depth)
 
     @property
     def context(self):
@@ -449,12 +1043,96 @@ class _ShellBase(object):
             clz = clz.__bases__[0]
         return clz.__doc__
 
+    @classmethod
+    def _load_plugins(cls):
+        """Add a command per entry point of the plugin groups to this class.
+
+        The groups are the plugin_group attributes set by this class and its
+        base classes, the former taking precedence. The commands are subshell
+        commands with the import paths of the entry points, so the plugins are
+        not imported until entered. Plugins whose names clash with existing
+        commands, including those inherited, are ignored.
+
+        The commands are added to this class only. The method of plugin 'name'
+        is named '_do_plugin_name', so that it does not shadow the methods of
+        other plugins, including those added to the base classes.
+        """
+        groups = []
+        for klass in cls.__mro__:
+            group = klass.__dict__.get('plugin_group')
+            if group and not group in groups:
+                groups.append(group)
+        if not groups or cls.__dict__.get('_plugins_loaded') == groups:
+            return
+        existing = set()
+        for name in dir(cls):
+            obj = getattr(cls, name)
+            if iscommand(obj):
+                existing.update(getcommands(obj))
+        for group in groups:
+            for name, value in _find_plugins(group):
+                if name in existing:
+                    continue
+                existing.add(name)
+                cls.__add_plugin(name, value)
+        cls._plugins_loaded = groups
+
+    @classmethod
+    def __add_plugin(cls, name, value):
+        def do_plugin(self, cmd, args):
+            return cmd
+        do_plugin.__name__ = do_plugin.__qualname__ = \
+                '_do_plugin_{}'.format(name)
+        do_plugin.__doc__ = "Enter the '{}' subshell, provided by the" \
+                " plugin '{}'.".format(name, value)
+        setattr(cls, do_plugin.__name__, subshell(value, name)(do_plugin))
+
+    @classmethod
+    def _command_maps(cls):
+        """Get the command maps of this class without creating an instance,
+        e.g., to compile scripts against it, see easyshell.script.
+
+        Returns:
+            A tuple (cmd_map_all, cmd_map_visible, cmd_map_internal), the same
+            as the _cmd_map_XXX attributes of the instances.
+        """
+        cls._load_plugins()
+        return cls.__build_cmd_maps()
+
     @property
     def prompt(self):
         return '({})$ '.format('-'.join(
                 [ self.root_prompt ] + \
                 [ m.prompt for m in self._mode_stack ]))
 
+    @property
+    def _temp_dir(self):
+        """The temporary directory to save history files, see
+        _ensure_temp_dir()."""
+        return self._ensure_temp_dir()
+
+    def _ensure_temp_dir(self):
+        """Create the temporary directory to save history files, if not yet.
+
+        A subshell without a directory of its own shares the directory of the
+        root shell, which is created once, on first use by any of them.
+
+        Returns:
+            The path of the directory.
+        """
+        if not self.__temp_dir_ready:
+            if not self.__temp_dir:
+                if self._mode_stack:
+                    root = self._mode_stack[0].shell
+                    self.__temp_dir = root._ensure_temp_dir()
+                else:
+                    import tempfile
+                    self.__temp_dir = tempfile.mkdtemp()
+            os.makedirs(os.path.join(self.__temp_dir, 'history'),
+                    exist_ok = True)
+            self.__temp_dir_ready = True
+        return self.__temp_dir
+
     @property
     def history_fname(self):
         """The temporary for storing the history of this shell."""
@@ -469,14 +1147,63 @@ class _ShellBase(object):
         if self.debug:
             print(msg, file = self.stderr)
 
-    def error(self, msg):
-        """Print message to self.stderr as-is."""
+    @property
+    def status(self):
+        """The status of the last command, 0 for success.
+
+        The status decides whether the commands following '&&' or '||' are
+        executed. It is reset to 0 before every command. Commands report
+        failures via error(), or by setting it, e.g., '!' sets the exit code of
+        the process it ran. Unknown commands set 127, and commands raising
+        errors and invalid arguments set 1, or 2 if rejected by the parser.
+        """
+        return self._sequence.status
+
+    @status.setter
+    def status(self, value):
+        self._sequence.status = value
+
+    def error(self, msg, *, status = 1):
+        """Print message to self.stderr as-is and fail the current command.
+
+        Arguments:
+            msg: The message.
+            status: The status of the command, see the status property.
+        """
         self.stderr.write(msg)
+        self.status = status
 
     def warning(self, msg):
         """Print a warning to self.stdout as=is."""
         self.stdout.write(msg)
 
+    def _create_subshell(self, shell_cls, cmd, args, *, prompt = None,
+            context = {}):
+        """Instantiate a subshell on top of this shell without running it.
+
+        The arguments are the same as those of launch_subshell().
+        """
+        shell_cls = resolve_shell_cls(shell_cls)
+        prompt = prompt if prompt else shell_cls.__name__
+        mode = _ShellBase._Mode(
+                shell = self,
+                cmd = cmd,
+                args = args,
+                prompt = prompt,
+                context = context,
+        )
+        return shell_cls(
+                batch_mode = self.batch_mode,
+                debug = self.debug,
+                mode_stack = self._mode_stack + [ mode ],
+                pipe_end = self._pipe_end,
+                root_prompt = self.root_prompt,
+                sequence = self._sequence,
+                stdout = self.stdout,
+                stderr = self.stderr,
+                temp_dir = self.__temp_dir,
+        )
+
     def launch_subshell(self, shell_cls, cmd, args, *, prompt = None, context =
             {}):
         """Launch a subshell.
@@ -489,7 +1216,8 @@ class _ShellBase(object):
         of directly launching subshells via this method.
 
         Arguments:
-            shell_cls: The _ShellBase class object to instantiate and launch.
+            shell_cls: The _ShellBase class object to instantiate and launch,
+                or its absolute import path, see resolve_shell_cls().
             args: Arguments used to launch this subshell.
             prompt: The name of the subshell. The default, None, means
                 to use the shell_cls.__name__.
@@ -502,38 +1230,53 @@ class _ShellBase(object):
             False, None, or anything that are evaluated as False: Inform the
                 parent shell to stay in that parent shell.
             An integer indicating the depth of shell to exit to. 0 = root shell.
+            The subshell object, without running it, if self._enter_only was
+                set, see easyshell.script.
         """
+        shell = self._create_subshell(shell_cls, cmd, args, prompt = prompt,
+                context = context)
+        if self._enter_only:
+            self._enter_only = False
+            return shell
+        shell_cls = type(shell)
+
         # Save history of the current shell.
-        readline.write_history_file(self.history_fname)
+        if not self.batch_mode:
+            import readline
+            readline.write_history_file(self.history_fname)
 
-        prompt = prompt if prompt else shell_cls.__name__
-        mode = _ShellBase._Mode(
-                shell = self,
-                cmd = cmd,
-                args = args,
-                prompt = prompt,
-                context = context,
-        )
-        shell = shell_cls(
-                batch_mode = self.batch_mode,
-                debug = self.debug,
-                mode_stack = self._mode_stack + [ mode ],
-                pipe_end = self._pipe_end,
-                root_prompt = self.root_prompt,
-                stdout = self.stdout,
-                stderr = self.stderr,
-                temp_dir = self._temp_dir,
-        )
         # The subshell creates its own history context.
         self.print_debug("Leave parent shell '{}'".format(self.prompt))
-        exit_directive = shell.cmdloop()
+        hooks = _active_hooks()
+        if hooks:
+            wall_start = time.time()
+            hooks.fire('subshell', 'pre', self, cmd, args, target = shell_cls,
+                    start = wall_start)
+        exception = None
+        start = time.perf_counter()
+        try:
+            exit_directive = shell.cmdloop()
+        except BaseException as e:
+            exception = e
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            metrics = _metrics()
+            if metrics.enabled:
+                metrics.REGISTRY.observe('subshell', type(self).__name__,
+                        shell_cls.__name__, duration, exception is not None)
+            if hooks:
+                hooks.fire('subshell', 'post', self, cmd, args,
+                        target = shell_cls, start = wall_start,
+                        duration = duration, exception = exception)
         self.print_debug("Enter parent shell '{}': {}".format(self.prompt, exit_directive))
 
         # Restore history. The subshell could have deleted the history file of
         # this shell via 'history clearall'.
-        readline.clear_history()
-        if os.path.isfile(self.history_fname):
-            readline.read_history_file(self.history_fname)
+        if not self.batch_mode:
+            readline.clear_history()
+            if os.path.isfile(self.history_fname):
+                readline.read_history_file(self.history_fname)
 
         if not exit_directive is True:
             return exit_directive
@@ -544,21 +1287,67 @@ class _ShellBase(object):
         Arguments:
             content: A unicode string representing the content to be processed.
         """
+        import multiprocessing
         pipe_send, pipe_recv = multiprocessing.Pipe()
         self._pipe_end = pipe_recv
-        proc = multiprocessing.Process(target = self.cmdloop)
+        # Start the child first, so that sending does not block once the pipe
+        # is full.
+        proc = multiprocessing.Process(target = self.__batch_child,
+                args = (pipe_send,))
+        proc.start()
         for line in content.split('\n'):
             pipe_send.send(line)
         pipe_send.close()
-        proc.start()
         proc.join()
 
+    def __batch_child(self, pipe_send):
+        # Close the inherited sending end, otherwise recv() never sees EOF.
+        pipe_send.close()
+        self.cmdloop()
+
+    def batch_lines(self, lines):
+        """Process lines in batch mode in this process.
+
+        Unlike batch_string(), no child process is forked, so the commands run
+        with the state of this process, e.g., its hooks and metrics, and the
+        startup cost is that of the commands alone.
+
+        Arguments:
+            lines: An iterable of unicode strings, the lines to process.
+
+        Returns:
+            The status of the last command executed, 0 for success, see the
+            status property, e.g., to be the exit code of the process.
+        """
+        if not self.batch_mode:
+            raise ValueError('batch_lines() requires batch_mode')
+        self._pipe_end = _LineSource(lines)
+        self.cmdloop()
+        return self.status
+
     def preloop(self):
         pass
 
     def postloop(self):
         pass
 
+    def checkpoint_state(self):
+        """Get the state of this shell saved in checkpoints of batch runs.
+
+        Checkpoints save the shells on the stack and the contexts they were
+        entered with, see easyshell.script.Checkpoint. Shells keeping other
+        state, e.g., in attributes set by commands, return it here to have it
+        restored by restore_state() when the run is resumed.
+
+        Returns:
+            A picklable object. The default, None, means no state.
+        """
+        return None
+
+    def restore_state(self, state):
+        """Restore the state returned by checkpoint_state() when resuming."""
+        pass
+
     def cmdloop(self):
         """Start the main loop of the interactive shell.
 
@@ -606,17 +1395,19 @@ class _ShellBase(object):
         self.print_debug("Enter subshell '{}'".format(self.prompt))
 
         # Save the completer function, the history buffer, and the
-        # completer_delims.
-        old_completer = readline.get_completer()
-        old_delims = readline.get_completer_delims()
-        new_delims = ''.join(list(set(old_delims) - set(_ShellBase._non_delims)))
-        readline.set_completer_delims(new_delims)
-
-        # Load the new completer function and start a new history buffer.
-        readline.set_completer(self.__driver_stub)
-        readline.clear_history()
-        if os.path.isfile(self.history_fname):
-            readline.read_history_file(self.history_fname)
+        # completer_delims. Batch mode does not use readline at all.
+        if not self.batch_mode:
+            import readline
+            old_completer = readline.get_completer()
+            old_delims = readline.get_completer_delims()
+            new_delims = ''.join(list(set(old_delims) - set(_ShellBase._non_delims)))
+            readline.set_completer_delims(new_delims)
+
+            # Load the new completer function and start a new history buffer.
+            readline.set_completer(self.__driver_stub)
+            readline.clear_history()
+            if os.path.isfile(self.history_fname):
+                readline.read_history_file(self.history_fname)
 
         # main loop
         try:
@@ -630,18 +1421,27 @@ class _ShellBase(object):
             self.preloop()
             while True:
                 exit_directive = False
-                try:
-                    if self.batch_mode:
-                        line = self._pipe_end.recv()
-                    else:
-                        line = input(self.prompt).strip()
-                except EOFError:
-                    line = _ShellBase.EOF
+                # The rest of a line with sequencing operators goes first.
+                line = self._sequence.next_command()
+                if line is None:
+                    try:
+                        if self.batch_mode:
+                            line = self._pipe_end.recv()
+                        else:
+                            # Completers only run ahead of time while
+                            # waiting for input, not along with the line.
+                            self._prefetcher.start()
+                            try:
+                                line = input(self.prompt).strip()
+                            finally:
+                                self._prefetcher.stop()
+                    except EOFError:
+                        line = _ShellBase.EOF
 
                 try:
                     exit_directive = self.__exec_line__(line)
                 except:
-                    self.stderr.write(traceback.format_exc())
+                    self.stderr.write(_format_exc())
 
                 if type(exit_directive) is int:
                     if len(self._mode_stack) > exit_directive:
@@ -654,11 +1454,15 @@ class _ShellBase(object):
                     break
         finally:
             self.postloop()
+            # Exiting the root shell drops the rest of the line, if any.
+            if not self._mode_stack:
+                self._sequence.pending.clear()
             # Restore the completer function, save the history, and restore old
             # delims.
-            readline.set_completer(old_completer)
-            readline.write_history_file(self.history_fname)
-            readline.set_completer_delims(old_delims)
+            if not self.batch_mode:
+                readline.set_completer(old_completer)
+                readline.write_history_file(self.history_fname)
+                readline.set_completer_delims(old_delims)
 
         self.print_debug("Leave subshell '{}': {}".format(self.prompt, exit_directive))
 
@@ -680,36 +1484,143 @@ class _ShellBase(object):
                 string is preprocessed by cmdloop() to convert the EOF character
                 to '\x04', i.e., 'D' - 64, if the EOF character is the only
                 character from the shell.
+
+        While the command runs, the line is available as self._line, e.g., for
+        commands that execute the rest of the line as another command.
         """
         # Ignoe empty lines and lines starting with a pound sign.
         if not line or line.rstrip().startswith('#'):
             return
 
-        cmd, args = ( '', [] )
+        # Execute the first command of a sequence and leave the rest pending,
+        # see _Sequence.
+        if self.sequencing and (';' in line or '&&' in line or '||' in line):
+            segments = split_sequence(line)
+            if not segments:
+                return
+            self._sequence.push(segments[1:])
+            line = segments[0][1]
 
-        toks = shlex.split(line)
-        if not toks:
-            return
+        if _active_hooks():
+            return self._exec_hooked_line(line, self.__exec_segment, line)
+        return self.__exec_segment(line)
 
+    def __exec_segment(self, line):
+        """Execute a line without sequencing operators, see __exec_line__()."""
         if line == _ShellBase.EOF:
             # This is a hack to allow the EOF character to behave exactly like
             # typing the 'exit' command.
-            readline.insert_text('exit\n')
-            readline.redisplay()
-            cmd = 'exit'
-        elif toks and toks[0] in self._cmd_map_internal.keys():
-            cmd = toks[0]
-            args = toks[1:] if len(toks) > 1 else []
+            if not self.batch_mode:
+                import readline
+                readline.insert_text('exit\n')
+                readline.redisplay()
+            cmd, args = ( 'exit', [] )
         else:
-            cmd, args = self.parse_line(line)
+            try:
+                toks = self._tokenize(line)
+            except ValueError:
+                # E.g., unbalanced quotes.
+                self.status = 1
+                raise
+            if toks is None:
+                return
+            cmd, args = toks
 
         if not cmd in self._cmd_map_all.keys():
-            self.stderr.write("{}: command not found\n".format(cmd))
+            self.error("{}: command not found\n".format(cmd), status = 127)
             return
 
+        if line == _ShellBase.EOF:
+            # Leave with the status of the last command, as POSIX shells do at
+            # the end of their input.
+            status = self.status
+            try:
+                return self._exec_command(cmd, args, line)
+            finally:
+                self.status = status
+        return self._exec_command(cmd, args, line)
+
+    def _exec_hooked_line(self, line, func, *args):
+        """Execute a line via func(*args), firing the 'line' hooks around it.
+
+        Only called if hooks are active. The line is seen by the hooks whether
+        or not its command exists or it can be tokenized, see easyshell.hooks.
+
+        Returns:
+            The return value of func.
+        """
+        from . import hooks
+        wall_start = time.time()
+        hooks.fire('line', 'pre', self, '', [], line = line,
+                start = wall_start)
+        exception = None
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        except BaseException as e:
+            exception = e
+            raise
+        finally:
+            hooks.fire('line', 'post', self, '', [], line = line,
+                    start = wall_start, duration = time.perf_counter() - start,
+                    exception = exception)
+
+    def _tokenize(self, line):
+        """Split a line, without sequencing operators, into a command and its
+        arguments, as __exec_line__() does.
+
+        Returns:
+            A tuple (cmd, args), or None if the line has no tokens.
+        """
+        toks = shlex.split(line)
+        if not toks:
+            return None
+        if toks[0] in self._cmd_map_internal.keys():
+            return ( toks[0], toks[1:] )
+        return self.parse_line(line)
+
+    def _exec_command(self, cmd, args, line, *, batch = False):
+        """Invoke the method of a known command, see __exec_line__().
+
+        Arguments:
+            cmd: The name of the command, a key of self._cmd_map_all.
+            args: The list of arguments, as returned by _tokenize().
+            line: The line the command was read from.
+            batch: If True, args is a list of lists of arguments passed at
+                once to a command decorated with batch = True, see command().
+        """
         func_name = self._cmd_map_all[cmd]
         func = getattr(self, func_name)
-        return func(cmd, args)
+        if batch:
+            func = functools.partial(func.__batch__, self)
+        self._line = line
+        outer_command = _ShellBase._active_command
+        _ShellBase._active_command = (self, cmd)
+        hooks = _active_hooks()
+        if hooks:
+            wall_start = time.time()
+            hooks.fire('command', 'pre', self, cmd, args, line = line,
+                    start = wall_start)
+        exception = None
+        self.status = 0
+        start = time.perf_counter()
+        try:
+            return func(cmd, args)
+        except BaseException as e:
+            exception = e
+            self.status = 1
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            metrics = _metrics()
+            if metrics.enabled:
+                metrics.REGISTRY.observe('command', type(self).__name__, cmd,
+                        duration, exception is not None or self.status != 0)
+            if hooks:
+                hooks.fire('command', 'post', self, cmd, args, line = line,
+                        start = wall_start, duration = duration,
+                        exception = exception)
+            _ShellBase._active_command = outer_command
 
     def parse_line(self, line):
         """Parse a line of input.
@@ -767,6 +1678,7 @@ class _ShellBase(object):
             non-driver methods are run within try-except blocks. When an error
             occurs, the stack trace is printed to self.stderr.
         """
+        import readline
         origline = readline.get_line_buffer()
         line = origline.lstrip()
         if line and line[-1] == '?':
@@ -793,36 +1705,73 @@ class _ShellBase(object):
             return self.__completion_candidates[state]
 
         # Update the cache when this method is first called, i.e., state == 0.
+        hooks = _active_hooks()
+        if hooks:
+            wall_start = time.time()
+            hooks.fire('complete', 'pre', self, toks[0] if toks else '', toks,
+                    text = text, start = wall_start)
+        start = time.perf_counter()
+        cmd, candidates, error = self.__find_candidates(toks, text)
+        duration = time.perf_counter() - start
+        metrics = _metrics()
+        if metrics.enabled:
+            # Unknown commands share one series, so that typos do not grow the
+            # registry.
+            name = cmd if not cmd or cmd in self._cmd_map_all else '<unknown>'
+            metrics.REGISTRY.observe('complete', type(self).__name__, name,
+                    duration, error)
+        if hooks:
+            hooks.fire('complete', 'post', self, cmd, toks, text = text,
+                    start = wall_start, duration = duration)
+        self.__completion_candidates = candidates if candidates else []
+        return self.__completion_candidates[state]
 
+    def __find_candidates(self, toks, text):
+        """Find the completion candidates, used by __driver_completer().
+
+        Errors raised by completer methods are printed to self.stderr.
+
+        Returns:
+            A tuple (cmd, candidates, error). cmd is the command whose argument
+            is completed, '' when completing the command itself. error is True
+            if the completer raised an error.
+        """
         # If the line is empty or the user is still inputing the first token,
         # complete with available commands.
         if not toks or (len(toks) == 1 and text == toks[0]):
             try:
-                self.__completion_candidates = self.__complete_cmds(text)
+                return '', self.__complete_cmds(text), False
             except:
                 self.stderr.write('\n')
-                self.stderr.write(traceback.format_exc())
-                self.__completion_candidates = []
-            return self.__completion_candidates[state]
+                self.stderr.write(_format_exc())
+                return '', [], True
 
         # Otherwise, try to complete with the registered completer method.
         cmd = toks[0]
         args = toks[1:] if len(toks) > 1 else None
         if text and args:
             del args[-1]
+        paused = contextlib.nullcontext()
+        if self._prefetcher:
+            if args is None and not text:
+                candidates = self._prefetcher.lookup(cmd)
+                if candidates is not None:
+                    return cmd, candidates, False
+            paused = self._prefetcher.paused()
         if cmd in self._completer_map.keys():
-            completer_name = self._completer_map[cmd]
-            completer_method = getattr(self, completer_name)
-            try:
-                self.__completion_candidates = completer_method(cmd, args, text)
-            except:
-                self.stderr.write('\n')
-                self.stderr.write(traceback.format_exc())
-                self.__completion_candidates = []
+            completer_method = getattr(self, self._completer_map[cmd])
+            complete = lambda: completer_method(cmd, args, text)
+        elif cmd in self._spec_map.keys():
+            complete = lambda: self._spec_map[cmd].complete(self, args, text)
         else:
-            self.__completion_candidates = []
-
-        return self.__completion_candidates[state]
+            return cmd, [], False
+        try:
+            with paused:
+                return cmd, complete(), False
+        except:
+            self.stderr.write('\n')
+            self.stderr.write(_format_exc())
+            return cmd, [], True
 
     def __complete_cmds(self, text):
         """Get the list of commands whose names start with a given text."""
@@ -851,7 +1800,7 @@ class _ShellBase(object):
                 msg = self.__get_help_message(toks)
             except Exception as e:
                 self.stderr.write('\n')
-                self.stderr.write(traceback.format_exc())
+                self.stderr.write(_format_exc())
                 self.stderr.flush()
             self.stdout.write('\n')
             self.stdout.write(msg)
@@ -870,8 +1819,9 @@ class _ShellBase(object):
 
             1.  The helper method registered with this command via the @helper
                 decorator.
-            2.  The doc string of the registered method.
-            3.  A default help message basically saying 'no help found'.
+            2.  The help message of the parser of the registered method.
+            3.  The doc string of the registered method.
+            4.  A default help message basically saying 'no help found'.
 
         Arguments:
             toks: The list of command followed by its arguments.
@@ -893,9 +1843,12 @@ class _ShellBase(object):
         if cmd in self._cmd_map_all.keys():
             name = self._cmd_map_all[cmd]
             method = getattr(self, name)
+            if hasattr(method, '__command_parser__'):
+                return method.__command_parser__.format_help(cmd)
             if method.__doc__:
                 return textwrap.dedent(method.__doc__)
 
+        import subprocess
         return textwrap.dedent('''\
                        No help message is found for:
                        {}
@@ -993,3 +1946,30 @@ class _ShellBase(object):
                                                     cmd, ret[cmd], obj.__name__))
                     ret[cmd] = obj.__name__
         return ret
+
+    @classmethod
+    def __build_spec_map(cls, completer_map):
+        """Build a mapping from command names to declarative completion specs.
+
+        Only commands declaring completion specs or parsers via the @command
+        decorator and having no completer methods are included. Completion
+        specs take precedence over parsers.
+
+        Only used by __init__() to initialize self._spec_map. MUST NOT be used
+        elsewhere.
+
+        Arguments:
+            completer_map: The mapping from command names to completer names.
+        """
+        ret = {}
+        for name in dir(cls):
+            obj = getattr(cls, name)
+            if not iscommand(obj):
+                continue
+            spec = getattr(obj, '__complete_spec__', None) or \
+                    getattr(obj, '__command_parser__', None)
+            if spec:
+                for cmd in getcommands(obj):
+                    if not cmd in completer_map.keys():
+                        ret[cmd] = spec
+        return ret
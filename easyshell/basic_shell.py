@@ -1,12 +1,80 @@
-import math
 import os
-import readline
-import shutil
-import subprocess
-import terminaltables
+import shlex
+import sys
 import textwrap
+import time
 
-from .base import _ShellBase, command, helper, completer, iscommand, getcommands
+from .base import _ShellBase, command, helper, iscommand, getcommands, \
+        format_time, strip_tokens
+
+def _exit_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Exit shell.')
+    parser.add_argument('directive',
+            nargs = '?',
+            choices = ['root', 'all'],
+            help = 'exit to the root shell or to the command line')
+    return parser
+
+def _stack_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Manage the shell stack.')
+    parser.add_argument('depth',
+            nargs = '?',
+            type = int,
+            help = 'exit to the stack by its depth, 0 = root shell')
+    return parser
+
+def _profile_parser():
+    import argparse
+    import pstats
+    parser = argparse.ArgumentParser(
+            description = 'Profile a command with cProfile.')
+    parser.add_argument('-n',
+            metavar = 'N',
+            type = int,
+            default = 20,
+            help = 'number of functions to display')
+    parser.add_argument('-s', '--sort',
+            default = 'cumulative',
+            choices = sorted(pstats.SortKey._value2member_map_.keys()),
+            help = 'the key to sort the functions by')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            help = 'dump the statistics to a .pstats file instead')
+    parser.add_argument('command',
+            nargs = argparse.REMAINDER,
+            help = 'the command to profile')
+    return parser
+
+def _stats_parser():
+    import argparse
+    parser = argparse.ArgumentParser(
+            description = 'Display or export per-command metrics.')
+    parser.add_argument('action',
+            nargs = '?',
+            choices = ['reset'],
+            help = 'drop all metrics')
+    parser.add_argument('-k', '--kind',
+            choices = ['command', 'complete', 'subshell'],
+            help = 'only display metrics of this kind')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            help = 'write the metrics to FILE instead of displaying them')
+    parser.add_argument('--format',
+            choices = ['json', 'prometheus'],
+            default = 'json',
+            help = 'the format of the file written with -o')
+    return parser
+
+def _resource_usage():
+    """Get (max RSS of self, max RSS of children) in kilobytes, if available."""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, \
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
 
 class BasicShell(_ShellBase):
 
@@ -15,15 +83,19 @@ class BasicShell(_ShellBase):
     @command('!', internal = True, visible = False)
     def _do_exec(self, cmd, args):
         """Execute a command using subprocess.Popen().
+
+        The status of the command is the exit code of the process.
         """
         if not args:
-            self.stderr.write("execute: empty command\n")
+            self.error("execute: empty command\n")
             return
-        proc = subprocess.Popen(subprocess.list2cmdline(args),
+        import subprocess
+        # Pass the rest of the line verbatim, so that the quoting survives.
+        proc = subprocess.Popen(strip_tokens(self._line, 1),
                 shell = True, stdout = self.stdout)
-        proc.wait()
+        self.status = proc.wait()
 
-    @command('end', 'exit', internal = True, nargs = '?')
+    @command('end', 'exit', internal = True, parser = _exit_parser)
     def _do_exit(self, cmd, args):
         """\
         Exit shell.
@@ -32,38 +104,19 @@ class BasicShell(_ShellBase):
             exit all            Exit to the command line.
         """
         if cmd == 'end':
-            if not args:
-                return 'root'
-            else:
-                self.stderr.write(textwrap.dedent('''\
-                        end: unrecognized arguments: {}
-                        ''')).format(args)
+            if args.directive:
+                self.error('end: unrecognized arguments: {}\n'.format(
+                        args.directive))
+                return
+            return 'root'
 
         # Hereafter, cmd == 'exit'.
-        if not args:
+        if not args.directive:
             return True
-        if len(args) > 1:
-            self.stderr.write(textwrap.dedent('''\
-                    exit: too many arguments: {}
-                    ''')).format(args)
-        exit_directive = args[0]
-        if exit_directive == 'root':
-            return 'root'
-        if exit_directive == 'all':
-            return 'all'
-        self.stderr.write(textwrap.dedent('''\
-                exit: unrecognized arguments: {}
-                ''')).format(args)
-
-    @completer('exit')
-    def _complete_exit(self, cmd, args, text):
-        """Find candidates for the 'exit' command."""
-        if args:
-            return
-        return [ x for x in { 'root', 'all', } \
-                if x.startswith(text) ]
+        return args.directive
 
-    @command('history', internal = True, nargs = '?')
+    @command('history', internal = True, nargs = '?',
+            choices = ['clear', 'clearall'])
     def _do_history(self, cmd, args):
         """\
         Display history.
@@ -71,11 +124,16 @@ class BasicShell(_ShellBase):
             history clear       Clear history.
             history clearall    Clear history for all shells.
         """
+        if self.batch_mode:
+            self.error('history: no history in batch mode\n')
+            return
+        import readline
         if args and args[0] == 'clear':
             readline.clear_history()
             readline.write_history_file(self.history_fname)
         elif args and args[0] == 'clearall':
             readline.clear_history()
+            import shutil
             shutil.rmtree(self._temp_dir, ignore_errors = True)
             os.makedirs(os.path.join(self._temp_dir, 'history'))
         else:
@@ -83,41 +141,85 @@ class BasicShell(_ShellBase):
             with open(self.history_fname, 'r', encoding = 'utf8') as f:
                 self.stdout.write(f.read())
 
-    @completer('history')
-    def _complete_history(self, cmd, args, text):
-        """Find candidates for the 'history' command."""
-        if args:
-            return
-        return [ x for x in { 'clear', 'clearall' } \
-                if x.startswith(text) ]
-
-    @command('stack', internal = True, nargs = '?')
+    @command('stack', internal = True, parser = _stack_parser,
+            choices_fn = lambda self: range(len(self._mode_stack) + 1))
     def _do_stack(self, cmd, args):
         """\
         Manage the shell stack.
             stack               Display the stack.
             stack <depth>       Exit to the stack by its depth.
         """
-        if not args:
+        if args.depth is None:
             self.__dump_stack()
             return
-        if len(args) > 1:
-            self.stderr.write('stack: too many arguments: {}\n'.format(args))
+        if args.depth < 0:
+            self.error('stack: negative depth: {}\n'.format(args.depth))
             return
+        return args.depth
+
+    @command('time', internal = True, nargs = '+')
+    def _do_time(self, cmd, args):
+        """\
+        Time a command.
+            time <command>      Execute <command> and report its wall time,
+                                CPU time, CPU time of child processes, max RSS
+                                growth and the net number of allocated memory
+                                blocks.
+        """
+        line = strip_tokens(self._line, 1)
+        rss_before, children_rss_before = _resource_usage()
+        children_before = os.times()
+        blocks_before = sys.getallocatedblocks()
+        cpu_before = time.process_time()
+        wall_before = time.perf_counter()
         try:
-            depth = int(args[0])
-        except ValueError:
-            self.stderr.write("stack: depth is not an integer: '{}'\n".format(args[0]))
-            return
-        if depth < 0:
-            self.stderr.write('stack: negative depth: {}\n'.format(depth))
-            return
-        return depth
+            return self.__exec_line__(line)
+        finally:
+            wall = time.perf_counter() - wall_before
+            cpu = time.process_time() - cpu_before
+            blocks = sys.getallocatedblocks() - blocks_before
+            children_after = os.times()
+            rss_after, children_rss_after = _resource_usage()
+            children = children_after.children_user + \
+                    children_after.children_system - \
+                    children_before.children_user - \
+                    children_before.children_system
+            self.stderr.write('\n'.join([
+                    'real      {:.6f} s'.format(wall),
+                    'cpu       {:.6f} s'.format(cpu),
+                    'children  {:.6f} s'.format(children),
+                    'blocks    {:+d}'.format(blocks),
+            ]))
+            self.stderr.write('\n')
+            if rss_before is not None:
+                self.stderr.write('max rss   {:+d} KiB (children {:d} KiB)\n'.format(
+                        rss_after - rss_before, children_rss_after))
 
-    @completer('stack')
-    def _complete_stack(self, cmd, args, text):
-        if not args:
-            return [ str(i) for i in range(len(self._mode_stack) + 1) ]
+    @command('profile', internal = True, parser = _profile_parser)
+    def _do_profile(self, cmd, args):
+        """\
+        Profile a command with cProfile.
+            profile [options] <command>     Execute <command> and display the
+                                            functions that took the most time.
+        """
+        if not args.command:
+            self.error('profile: no command given\n')
+            return
+        ntoks = len(shlex.split(self._line)) - len(args.command)
+        line = strip_tokens(self._line, ntoks)
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        try:
+            return profiler.runcall(self.__exec_line__, line)
+        finally:
+            if args.output:
+                profiler.dump_stats(args.output)
+                self.stderr.write('profile: statistics dumped to {}\n'.format(
+                        args.output))
+            else:
+                stats = pstats.Stats(profiler, stream = self.stdout)
+                stats.sort_stats(args.sort).print_stats(args.n)
 
     def __dump_stack(self):
         """Dump the shell stack in a human friendly way.
@@ -171,8 +273,44 @@ class BasicShell(_ShellBase):
         data = [['COMMANDS', 'DOC STRING']] + data_sorted
 
         # Create the commands table.
+        import terminaltables
         table_banner = 'List of Available Commands'
         table = terminaltables.SingleTable(data, table_banner)
         table.inner_row_border = True
         table.inner_heading_row_border = True
         print(table.table)
+
+    @command('stats', internal = True, parser = _stats_parser)
+    def _do_stats(self, cmd, args):
+        """\
+        Display or export per-command metrics.
+            stats                   Display the counts and latencies of
+                                    commands, completions, and subshells.
+            stats -o <file>         Export the metrics as JSON or Prometheus
+                                    text.
+            stats reset             Drop all metrics.
+        """
+        from . import metrics
+        if args.action == 'reset':
+            metrics.REGISTRY.reset()
+            return
+        if args.output:
+            metrics.REGISTRY.write(args.output, args.format)
+            return
+
+        data = [['KIND', 'SHELL', 'NAME', 'COUNT', 'ERRORS', 'MEAN', 'P50',
+                'P90', 'P99']]
+        for row in metrics.REGISTRY.rows():
+            if args.kind and row['kind'] != args.kind:
+                continue
+            # The percentiles are None in the unbounded bucket.
+            data.append([row['kind'], row['shell'], row['name'] or "''",
+                    str(row['count']), str(row['errors'])] + [
+                    format_time(row[key]) if row[key] is not None else 'inf'
+                    for key in ('mean', 'p50', 'p90', 'p99') ])
+        import terminaltables
+        table = terminaltables.SingleTable(data, 'Metrics')
+        for i in range(3, 9):
+            table.justify_columns[i] = 'right'
+        self.stdout.write(table.table)
+        self.stdout.write('\n')
@@ -1,13 +1,47 @@
-import pprint
+import argparse
+import functools
+import re
 import shlex
 import textwrap
 import traceback
 
-import easycompleter
-
-from .base import command, helper, completer
+from . import inspector
+from .base import command, helper, completer, format_time
 from .basic_shell import BasicShell
 
+def _mem_parser():
+    parser = argparse.ArgumentParser(description = 'Memory diagnostics.')
+    parser.add_argument('action',
+            choices = ['top', 'snap', 'diff', 'rss'],
+            help = 'top: objects per type; snap: take a tracemalloc snapshot;'
+                    ' diff: compare with the last snapshot by line;'
+                    ' rss: resident set size')
+    parser.add_argument('-n',
+            metavar = 'N',
+            type = int,
+            default = 20,
+            help = 'number of rows to display')
+    parser.add_argument('--count-only',
+            action = 'store_true',
+            help = 'top: count objects without summing their sizes')
+    return parser
+
+@functools.lru_cache(maxsize = 256)
+def _compile(source):
+    """Compile python source code, caching the code objects by source.
+
+    Returns:
+        A tuple (mode, code), where mode is 'eval' if the source is an
+        expression and 'exec' otherwise.
+
+    Raises:
+        SyntaxError: The source is neither an expression nor statements.
+    """
+    try:
+        return 'eval', compile(source, '<debug>', 'eval')
+    except SyntaxError:
+        return 'exec', compile(source, '<debug>', 'exec')
+
 class DebuggingShell(BasicShell):
 
     """Debugging shell.
@@ -20,57 +54,216 @@ class DebuggingShell(BasicShell):
     Available commands:
             p               Display object.
             e               Evaluate python code.
+            timeit          Time python code.
+            mem             Memory diagnostics.
+
+    Names assigned by 'e' persist in the namespace of this debugging shell,
+    where 'p' and 'timeit' find them too. The result of the last expression
+    evaluated by 'e' is bound to '_'.
     """
 
+    # The commands take python code, in which ';' is a separator of statements.
+    sequencing = False
+
+    # The default limits of the 'p' command.
+    print_depth = 3
+    print_items = 50
+    print_width = 120
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.__python_completer = easycompleter.python_default.Completer()
+        self._namespace = { 'self': self }
+        import easycompleter
+        self.__python_completer = easycompleter.python_default.Completer(
+                self._namespace)
 
     # TODO: This completer is not fully functional.
     @completer('p')
     def _complete_print(self, cmd, arg, text):
         return self.__python_completer.find_matches(text)
 
-    # TODO: This method is not fully implemented yet.
     @command('p')
     def _do_print(self, cmd, args):
         """\
-        Display symbols.
-            p               Display names of inspectable objects.
-            p <id>          Display the content of an object.
+        Display objects.
+            p                       Display names of inspectable objects.
+            p [options] <expr>      Display the content of an object.
+
+        The <expr> consists of names, attributes, and subscripts with literal
+        keys, e.g., self.context['args'][0]. It is looked up, not evaluated.
+
+        Options:
+            -d <depth>      Summarize containers nested deeper than <depth>.
+            -n <items>      Display at most <items> items per container.
+            -w <width>      Truncate lines longer than <width>.
         """
-        name = args[0].strip()
-        if not name:
-            self.stderr.write('TODO: Display names of inspectable objects.\n')
+        text = args[0].strip()
+        limits = { 'd': self.print_depth, 'n': self.print_items,
+                'w': self.print_width }
+        while True:
+            m = re.match(r'-([dnw])\s*(\d+)\s*', text)
+            if not m:
+                break
+            limits[m.group(1)] = int(m.group(2))
+            text = text[m.end():]
+
+        if not text:
+            for name in sorted(self._namespace.keys()):
+                if name == '__builtins__':
+                    continue
+                self.stdout.write('{}: {}\n'.format(name,
+                        type(self._namespace[name]).__name__))
             return
         try:
-            code = textwrap.dedent(r'''
-                    self.stdout.write(name + ':\n' + textwrap.indent(pprint.pformat({}), '    ') + '\n')
-                    ''').format(name).strip()
-            eval(code, globals(), locals())
-        except NameError:
-            self.stderr.write("p: name '{}' is not defined\n".format(name))
+            obj = inspector.resolve(text, self._namespace)
+        except Exception as e:
+            self.error('p: {}\n'.format(e))
+            return
+        self.stdout.write(text + ':\n')
+        self.__page(inspector.iter_lines(obj,
+                max_depth = limits['d'],
+                max_items = limits['n'],
+                max_width = limits['w']))
         self.stdout.flush()
 
+    def __page(self, lines):
+        """Write lines to self.stdout, one screen at a time if interactive."""
+        interactive = not self.batch_mode and self.stdout.isatty()
+        import shutil
+        page_size = shutil.get_terminal_size().lines - 1 if interactive else 0
+        for i, line in enumerate(lines, 1):
+            self.stdout.write(line)
+            self.stdout.write('\n')
+            if page_size > 0 and i % page_size == 0:
+                self.stdout.flush()
+                try:
+                    answer = input('-- more, q to quit -- ')
+                except EOFError:
+                    answer = 'q'
+                if answer.strip().lower().startswith('q'):
+                    return
+
+    @command('mem', internal = True, parser = _mem_parser)
+    def _do_mem(self, cmd, args):
+        """\
+        Memory diagnostics.
+            mem top [-n N]      Display the types using the most memory.
+            mem snap            Take a tracemalloc snapshot.
+            mem diff [-n N]     Display the lines allocating the most memory
+                                since the last snapshot.
+            mem rss             Display the resident set size.
+        """
+        from . import memory
+        if args.action == 'top':
+            rows, total_count, total_size = memory.top_types(args.n,
+                    sizes = not args.count_only)
+            self.stdout.write('{:>12}  {:>12}  {}\n'.format('COUNT', 'SIZE',
+                    'TYPE'))
+            for name, count, size in rows:
+                self.stdout.write('{:>12}  {:>12}  {}\n'.format(count,
+                        memory.format_size(size) if size is not None else '-',
+                        name))
+            self.stdout.write('{:>12}  {:>12}  (all gc-tracked objects)\n'.format(
+                    total_count, memory.format_size(total_size) \
+                            if total_size is not None else '-'))
+        elif args.action == 'snap':
+            if memory.take_snapshot():
+                self.stdout.write('mem: started tracemalloc, the snapshot only'
+                        ' contains allocations made from now on\n')
+            self.stdout.write('mem: snapshot taken\n')
+        elif args.action == 'diff':
+            stats = memory.diff_snapshot(args.n)
+            if stats is None:
+                self.error("mem: no snapshot, run 'mem snap' first\n")
+                return
+            for stat in stats:
+                frame = stat.traceback[0]
+                self.stdout.write('{:>12}  {:>+8}  {}:{}\n'.format(
+                        memory.format_size(stat.size_diff), stat.count_diff,
+                        frame.filename, frame.lineno))
+        elif args.action == 'rss':
+            current, peak = memory.rss()
+            self.stdout.write('current: {}\n'.format(memory.format_size(current) \
+                    if current is not None else 'unknown'))
+            self.stdout.write('peak:    {}\n'.format(memory.format_size(peak) \
+                    if peak is not None else 'unknown'))
 
-    # TODO: Use proper namespace for the dyncamic evaluation. According to the
-    # current implementation existing variables may be overwritten.
     @command('e')
     def _do_eval(self, cmd, args):
         """\
         Evaluate python code.
-            e <expr>        Evaluate <expr>.
+            e <expr>        Evaluate <expr> and display the result.
+            e <stmt>        Execute the statements <stmt>.
         """
-        code = args[0].lstrip()
-        if not code:
-            self.stderr.write('e: cannot evalutate empty expression\n')
+        source = args[0].strip()
+        if not source:
+            self.error('e: cannot evalutate empty expression\n')
             return
         try:
-            eval(code)
+            mode, code = _compile(source)
+            if mode == 'eval':
+                result = eval(code, self._namespace)
+                if result is not None:
+                    self._namespace['_'] = result
+                    for line in inspector.iter_lines(result,
+                            max_depth = self.print_depth,
+                            max_items = self.print_items,
+                            max_width = self.print_width):
+                        self.stdout.write(line)
+                        self.stdout.write('\n')
+            else:
+                exec(code, self._namespace)
         except:
-            self.stderr.write('''When executing code '{}', the following error was raised:\n\n'''.format(code))
+            self.error('''When executing code '{}', the following error was raised:\n\n'''.format(source))
             self.stderr.write(textwrap.indent(traceback.format_exc(), '    '))
 
+    @command('timeit')
+    def _do_timeit(self, cmd, args):
+        """\
+        Time python code.
+            timeit [options] <stmt>     Time <stmt> in the debugging namespace.
+
+        Options:
+            -n <number>     Execute <stmt> <number> times per repetition. By
+                            default, it is determined such that a repetition
+                            takes at least 0.2 seconds.
+            -r <repeat>     Repeat the timing <repeat> times, default 5.
+            -w <warmup>     Run <warmup> untimed repetitions first, default 1.
+        """
+        text = args[0].strip()
+        options = { 'n': 0, 'r': 5, 'w': 1 }
+        while True:
+            m = re.match(r'-([nrw])\s*(\d+)\s*', text)
+            if not m:
+                break
+            options[m.group(1)] = int(m.group(2))
+            text = text[m.end():]
+        if not text:
+            self.error('timeit: cannot time empty statement\n')
+            return
+
+        import statistics
+        import timeit
+        try:
+            timer = timeit.Timer(text, globals = self._namespace)
+            number = options['n']
+            if not number:
+                number, _ = timer.autorange()
+            for _ in range(options['w']):
+                timer.timeit(number)
+            times = [ t / number for t in
+                    timer.repeat(repeat = max(options['r'], 1), number = number) ]
+        except:
+            self.error('''When timing code '{}', the following error was raised:\n\n'''.format(text))
+            self.stderr.write(textwrap.indent(traceback.format_exc(), '    '))
+            return
+
+        stdev = statistics.stdev(times) if len(times) > 1 else 0.0
+        self.stdout.write('{} loops, best of {}: {} per loop'
+                ' (mean {} +- {})\n'.format(number, len(times),
+                        format_time(min(times)),
+                        format_time(statistics.mean(times)),
+                        format_time(stdev)))
 
     def parse_line(self, line):
         """Parser for the debugging shell.
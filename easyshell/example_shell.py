@@ -1,12 +1,12 @@
 import os
 import textwrap
 
-import easycompleter
-
 from .base import deprecated
 from . import shell
 
-# The subshell classes must be defined before being referenced.
+# The subshell classes referred to by class objects must be defined before
+# being referenced. Refer to a subshell class by its import path instead to
+# define it anywhere and import it lazily, see BarShell.
 class KarShell(shell.Shell):
     """The KarShell.
 
@@ -66,8 +66,10 @@ class MyShell(shell.Shell):
     def postloop(self):
         print('Thanks for using MyShell. Bye!')
 
-    # 'foo' and 'fsh' enters the FooShell with prompt 'foo-prompt'.
-    @shell.subshell(FooShell, 'foo', 'fsh', nargs = 0)
+    # 'foo' and 'fsh' enters the FooShell with prompt 'foo-prompt'. The fixed
+    # candidates of the first argument are declared via the choices argument.
+    @shell.subshell(FooShell, 'foo', 'fsh', nargs = 0,
+            choices = ['--all', '--no'])
     def do_foo(self, cmd, args_ignored):
         return 'foo-prompt'
 
@@ -77,17 +79,10 @@ class MyShell(shell.Shell):
     def help_foo(self, cmd, args_ignored):
         return 'foo (--all|--no), fsh         Enter the foo-prompt subshell.'
 
-    # Add completer method for 'foo'. The interface is detailed in the doc
-    # string of the Shell.__driver_completer() method.
-    @shell.completer('foo')
-    def complete_foo(self, cmd, args, text):
-        if args:
-            return
-        return [ x for x in { '--all', '--no' } \
-                if x.startswith(text) ]
-
-    # 'bar' enters the BarShell with prompt 'BarPrompt'.
-    @shell.subshell(BarShell, 'bar', nargs = 0)
+    # 'bar' enters the BarShell with prompt 'BarPrompt'. The class is referred
+    # to by its import path, which is resolved when 'bar' is first executed.
+    # A path starting with '.' is relative to the package of this module.
+    @shell.subshell('.example_shell:BarShell', 'bar', nargs = 0)
     def do_bar(self, cmd, args_ignored):
         return 'BarPrompt'
 
@@ -141,8 +136,10 @@ class MyShell(shell.Shell):
             self.stdout.write(f.read())
             self.stdout.write('\n')
 
-    # Use the file system completer to complete file names.
+    # Use the file system completer to complete file names. The interface is
+    # detailed in the doc string of the Shell.__driver_completer() method.
     @shell.completer('cat')
     def complete_show(self, cmd, args, text):
         if not args:
+            import easycompleter
             return easycompleter.fs.find_matches(text)
@@ -0,0 +1,160 @@
+"""Hooks fired around commands, completions, and subshells.
+
+Hooks are registered process-wide for one kind of event and one phase:
+    kind        'line'      A line is executed by __exec_line__(), or by
+                            easyshell.script.BlockExecutor, whether or not
+                            its command exists or it can be tokenized. Every
+                            command of a line with sequencing operators is a
+                            line of its own.
+                'command'   A command is dispatched by __exec_line__().
+                'complete'  Completion candidates are computed.
+                'subshell'  A subshell is entered (pre) and left (post).
+    phase       'pre'       Before the event. duration and exception are None.
+                'post'      After the event.
+
+A hook is a function taking one Event object. Errors raised by hooks are
+printed to the stderr of the shell and otherwise ignored.
+
+When no hook is registered, the shells skip building events altogether, so
+that hooks cost nothing unless used.
+"""
+
+import traceback
+
+KINDS = ('line', 'command', 'complete', 'subshell')
+PHASES = ('pre', 'post')
+
+# True iff any hook is registered. Checked by the shells before firing.
+active = False
+
+_hooks = { (kind, phase): [] for kind in KINDS for phase in PHASES }
+
+class Event(object):
+
+    """An event passed to hooks.
+
+    Attributes:
+        kind: 'line', 'command', 'complete', or 'subshell'.
+        phase: 'pre' or 'post'.
+        shell: The shell object the event happened in. For 'subshell' events,
+            the parent shell.
+        mode_stack: A list of the prompts of the modes of the shell, i.e., its
+            position in the shell stack.
+        cmd: The command being executed, completed, or entering the subshell.
+            '' when completing command names, and for 'line' events.
+        args: The arguments of the command. For 'complete' events, the list of
+            tokens preceding the text being completed. [] for 'line' events.
+        line: The line being executed, for 'line' and 'command' events.
+        text: The text being completed, for 'complete' events.
+        target: The class of the subshell, for 'subshell' events.
+        start: The time.time() when the event started.
+        duration: The duration in seconds, for the 'post' phase.
+        exception: The exception raised, if any, for the 'post' phase.
+    """
+
+    __slots__ = ('kind', 'phase', 'shell', 'mode_stack', 'cmd', 'args',
+            'line', 'text', 'target', 'start', 'duration', 'exception')
+
+    def __init__(self, kind, phase, shell, cmd, args, *, line = None,
+            text = None, target = None, start = None, duration = None,
+            exception = None):
+        self.kind = kind
+        self.phase = phase
+        self.shell = shell
+        self.mode_stack = [ mode.prompt for mode in shell._mode_stack ]
+        self.cmd = cmd
+        self.args = args
+        self.line = line
+        self.text = text
+        self.target = target
+        self.start = start
+        self.duration = duration
+        self.exception = exception
+
+def register(kind, hook, *, phase = 'post'):
+    """Register a hook.
+
+    Arguments:
+        kind: One of KINDS.
+        hook: A function taking one Event object.
+        phase: One of PHASES.
+    """
+    global active
+    if not kind in KINDS or not phase in PHASES:
+        raise ValueError("invalid hook kind or phase: '{}', '{}'".format(kind,
+                phase))
+    _hooks[(kind, phase)].append(hook)
+    active = True
+
+def unregister(kind, hook, *, phase = 'post'):
+    """Unregister a hook registered with the same arguments."""
+    global active
+    _hooks[(kind, phase)].remove(hook)
+    active = any(_hooks.values())
+
+def fire(kind, phase, shell, cmd, args, **kwargs):
+    """Fire the hooks of a kind and phase.
+
+    The keyword arguments are passed to the Event constructor.
+    """
+    hooks = _hooks[(kind, phase)]
+    if not hooks:
+        return
+    event = Event(kind, phase, shell, cmd, args, **kwargs)
+    for hook in list(hooks):
+        try:
+            hook(event)
+        except Exception:
+            shell.stderr.write(traceback.format_exc())
+
+class JsonlTracer(object):
+
+    """Write a span record per command, completion, and subshell to a file.
+
+    Every line of the file is a JSON object with the keys kind, start,
+    duration, depth, mode_stack, shell, cmd, args, and error. Together they
+    reconstruct a session, e.g., to find the commands that made it slow.
+    """
+
+    # The kinds of events traced. Lines are left out, as they mostly repeat
+    # the commands.
+    kinds = ('command', 'complete', 'subshell')
+
+    def __init__(self, fname):
+        self.fname = fname
+        self._file = None
+
+    def start(self):
+        """Open the file and register the hooks."""
+        import json
+        self._dumps = json.dumps
+        self._file = open(self.fname, 'a', encoding = 'utf8', buffering = 1)
+        for kind in self.kinds:
+            register(kind, self.record)
+
+    def stop(self):
+        """Unregister the hooks and close the file."""
+        if self._file is None:
+            return
+        for kind in self.kinds:
+            unregister(kind, self.record)
+        self._file.close()
+        self._file = None
+
+    def record(self, event):
+        span = {
+            'kind': event.kind,
+            'start': event.start,
+            'duration': event.duration,
+            'depth': len(event.mode_stack),
+            'mode_stack': event.mode_stack,
+            'shell': type(event.shell).__name__,
+            'cmd': event.cmd,
+            'args': event.args if isinstance(event.args, list) else \
+                    repr(event.args),
+            'error': repr(event.exception) if event.exception else None,
+        }
+        if event.kind == 'subshell':
+            span['target'] = event.target.__name__
+        self._file.write(self._dumps(span, ensure_ascii = False))
+        self._file.write('\n')
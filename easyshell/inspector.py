@@ -0,0 +1,177 @@
+"""Bounded, streaming display of python objects.
+
+Unlike pprint.pformat(), which builds the whole string before anything is
+shown, the functions in this module yield the display line by line. Nesting
+depth, the number of items shown per container, and the width of each line are
+bounded, so that displaying a huge object costs about as much as displaying
+its first few items.
+"""
+
+import ast
+import builtins
+import collections.abc
+import reprlib
+
+# Containers whose items are displayed, with their delimiters.
+_delimiters = {
+    dict: ('{', '}'),
+    list: ('[', ']'),
+    tuple: ('(', ')'),
+    set: ('{', '}'),
+    frozenset: ('frozenset({', '})'),
+}
+
+# Sequences displayed by _short_repr() instead of item by item.
+_atomic_sequences = (str, bytes, bytearray, memoryview, range)
+
+def _get_delimiters(obj):
+    """Get the delimiters of a container whose items are displayed.
+
+    Mappings, sets, and sequences other than the builtin ones, e.g.,
+    collections.defaultdict, collections.deque, or subclasses of list, are
+    delimited by their type name and the delimiters of the builtin container
+    they resemble, e.g., 'Counter({' and '})'.
+
+    Returns:
+        A tuple (open, close), or None if obj is not such a container.
+    """
+    ret = _delimiters.get(type(obj))
+    if ret is not None:
+        return ret
+    if isinstance(obj, collections.abc.Mapping):
+        ret = ('{', '}')
+    elif isinstance(obj, collections.abc.Set):
+        ret = ('{', '}')
+    elif isinstance(obj, collections.abc.Sequence) and \
+            not isinstance(obj, _atomic_sequences):
+        ret = ('[', ']')
+    else:
+        return None
+    name = type(obj).__name__
+    return (name + '(' + ret[0], ret[1] + ')')
+
+def resolve(expr, namespace):
+    """Look up an object by a python expression without evaluating it.
+
+    Only names, attributes, and subscripts with literal keys are supported, for
+    example, "self.context['args'][0]".
+
+    Arguments:
+        expr: The expression.
+        namespace: A dictionary in which names are looked up before builtins.
+
+    Raises:
+        NameError: A name is not defined.
+        ValueError: The expression is not supported.
+        Other exceptions raised by getattr() or subscripting.
+    """
+    try:
+        node = ast.parse(expr.strip(), mode = 'eval').body
+    except SyntaxError:
+        raise ValueError("invalid expression: '{}'".format(expr))
+    return _resolve_node(node, namespace)
+
+def _resolve_node(node, namespace):
+    if isinstance(node, ast.Name):
+        if node.id in namespace:
+            return namespace[node.id]
+        if node.id in builtins.__dict__:
+            return builtins.__dict__[node.id]
+        raise NameError("name '{}' is not defined".format(node.id))
+    if isinstance(node, ast.Attribute):
+        return getattr(_resolve_node(node.value, namespace), node.attr)
+    if isinstance(node, ast.Subscript):
+        obj = _resolve_node(node.value, namespace)
+        try:
+            key = ast.literal_eval(node.slice)
+        except ValueError:
+            raise ValueError('only literal keys are supported')
+        return obj[key]
+    raise ValueError("unsupported expression: '{}'".format(ast.dump(node)))
+
+def iter_lines(obj, *, max_depth = 3, max_items = 50, max_width = 120,
+        indent = '    '):
+    """Yield the lines displaying an object.
+
+    Arguments:
+        obj: The object to display.
+        max_depth: Containers nested deeper than this are summarized in one
+            line.
+        max_items: The maximal number of items shown per container. The rest
+            is replaced by a truncation marker.
+        max_width: The maximal width of a line. Longer lines are truncated.
+        indent: The string to indent nested items with.
+
+    Yields:
+        Strings without the trailing newline.
+    """
+    for depth, line in _iter(obj, 0, set(), max_depth, max_items, max_width):
+        line = indent * depth + line
+        if len(line) > max_width:
+            line = line[:max(max_width - 3, 0)] + '...'
+        yield line
+
+def _iter(obj, depth, path, max_depth, max_items, max_width):
+    """Yield tuples (depth, line) displaying obj.
+
+    Arguments:
+        path: The set of ids of the containers enclosing obj, for detecting
+            cycles.
+    """
+    delimiters = _get_delimiters(obj)
+    if delimiters is None:
+        yield depth, _short_repr(obj, max_width)
+        return
+    if id(obj) in path:
+        yield depth, '<cycle: {} at {:#x}>'.format(type(obj).__name__, id(obj))
+        return
+    if not obj:
+        yield depth, _short_repr(obj, max_width)
+        return
+    if depth >= max_depth:
+        yield depth, '{}...{} ({} items)'.format(delimiters[0], delimiters[1],
+                len(obj))
+        return
+
+    path.add(id(obj))
+    yield depth, delimiters[0]
+    shown = 0
+    if isinstance(obj, collections.abc.Mapping):
+        for key, value in obj.items():
+            if shown >= max_items:
+                break
+            shown += 1
+            prefix = _short_repr(key, max_width) + ': '
+            lines = _iter(value, depth + 1, path, max_depth, max_items,
+                    max_width)
+            first_depth, first_line = next(lines)
+            yield first_depth, prefix + first_line
+            yield from lines
+    else:
+        for value in obj:
+            if shown >= max_items:
+                break
+            shown += 1
+            yield from _iter(value, depth + 1, path, max_depth, max_items,
+                    max_width)
+    if shown < len(obj):
+        yield depth + 1, '... ({} more items)'.format(len(obj) - shown)
+    yield depth, delimiters[1]
+    path.discard(id(obj))
+
+def _short_repr(obj, max_width):
+    """The repr() of an object, bounded by max_width.
+
+    Strings and bytes are cut with their total length noted. Other objects are
+    abbreviated with reprlib, which limits the items shown of builtin
+    containers and truncates the repr() of other objects.
+    """
+    if isinstance(obj, (str, bytes, bytearray)) and len(obj) > max_width:
+        return repr(obj[:max_width]) + '...({} total)'.format(len(obj))
+    abbreviator = reprlib.Repr()
+    abbreviator.maxstring = abbreviator.maxother = max_width
+    try:
+        return abbreviator.repr(obj)
+    except Exception as e:
+        return '<repr of {} failed: {}>'.format(type(obj).__name__,
+                type(e).__name__)
@@ -1,5 +1,7 @@
 import sys
 
+from .base import positive_int
+
 def update_parser(parser):
     """Update the parser object for the shell.
 
@@ -23,6 +25,91 @@ def update_parser(parser):
     parser.add_argument('--debug',
             action = 'store_true',
             help = 'turn debug infomation on')
+    parser.add_argument('--sample-profile',
+            metavar = 'FILE',
+            help = 'run the sampling profiler and write the collapsed stacks'
+                    ' to FILE upon exit, not with a script FILE without'
+                    ' --blocks, as such scripts run in a child process')
+    parser.add_argument('--sample-rate',
+            metavar = 'HZ',
+            type = positive_int,
+            default = 100,
+            help = 'the number of samples per second of the sampling profiler')
+    parser.add_argument('--metrics-file',
+            metavar = 'FILE',
+            help = 'periodically export per-command metrics to FILE, not'
+                    ' with a script FILE without --blocks, as such scripts run'
+                    ' in a child process')
+    parser.add_argument('--metrics-format',
+            choices = ['json', 'prometheus'],
+            default = 'json',
+            help = 'the format of the metrics file')
+    parser.add_argument('--metrics-interval',
+            metavar = 'SECONDS',
+            type = float,
+            default = 60.0,
+            help = 'the interval between exports of the metrics file')
+    parser.add_argument('--trace',
+            metavar = 'FILE',
+            help = 'append a JSON span record per command, completion, and'
+                    ' subshell to FILE, not with a script FILE without'
+                    ' --blocks, as such scripts run in a child process')
+    parser.add_argument('--record',
+            metavar = 'FILE',
+            help = 'append a record per executed line to FILE, to be replayed'
+                    ' by easyshell.replay, not with a script FILE without'
+                    ' --blocks, as such scripts run in a child process')
+    parser.add_argument('-c',
+            metavar = 'COMMAND',
+            dest = 'command',
+            help = "execute COMMAND in this process and exit with the status"
+                    " of its last command, e.g., 'foo; kar x; p y'")
+    parser.add_argument('--blocks',
+            action = 'store_true',
+            help = 'execute FILE or COMMAND in this process as a block'
+                    ' structured script, where indentation enters and leaves'
+                    ' subshells')
+    parser.add_argument('--check',
+            action = 'store_true',
+            help = 'with --blocks, only compile the script and report the'
+                    ' unknown commands, wrong numbers of arguments, and'
+                    ' blocks not headed by subshell commands')
+    parser.add_argument('--plan-cache',
+            metavar = 'DIR',
+            help = 'with --blocks, the directory of cached compiled scripts,'
+                    ' not used unless only the current user can write to it,'
+                    ' the default is $XDG_CACHE_HOME/easyshell/plans')
+    parser.add_argument('--no-plan-cache',
+            action = 'store_true',
+            help = 'with --blocks, always compile the script')
+    parser.add_argument('--checkpoint',
+            metavar = 'FILE',
+            help = 'with --blocks, periodically save the progress to FILE, to'
+                    ' be resumed with --resume, and remove FILE once the'
+                    ' script is complete')
+    parser.add_argument('--checkpoint-interval',
+            metavar = 'SECONDS',
+            type = float,
+            default = 60.0,
+            help = 'the interval between saves of the checkpoint')
+    parser.add_argument('--resume',
+            action = 'store_true',
+            help = 'continue from the checkpoint FILE, if any, instead of'
+                    ' from the beginning of the script')
+    parser.add_argument('--batch-size',
+            metavar = 'N',
+            type = positive_int,
+            default = 1000,
+            help = 'with --blocks, pass up to N consecutive lines of a batched'
+                    ' command to it at once')
+    parser.add_argument('--fail-fast',
+            action = 'store_true',
+            help = 'with --blocks, stop at the first line whose command'
+                    ' fails, same as --max-errors 1')
+    parser.add_argument('--max-errors',
+            metavar = 'N',
+            type = positive_int,
+            help = 'with --blocks, stop after N lines whose commands fail')
     parser.add_argument('file',
             metavar = 'FILE',
             nargs = '?',
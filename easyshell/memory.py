@@ -0,0 +1,121 @@
+"""In-process memory diagnostics.
+
+The functions in this module back the 'mem' command of the debugging shell.
+"""
+
+import collections
+import gc
+import os
+import sys
+import tracemalloc
+
+# The tracemalloc snapshot that take_snapshot() took last.
+_snapshot = None
+
+def top_types(n, *, sizes = True):
+    """Count the objects tracked by the garbage collector per type.
+
+    Only objects tracked by the garbage collector, i.e., containers, are
+    visited. Atomic objects such as ints and strs are counted only through the
+    sizes of the containers referring to them, if at all.
+
+    Arguments:
+        n: The number of types to report.
+        sizes: Also sum sys.getsizeof() per type. Counting alone is several
+            times faster on large heaps.
+
+    Returns:
+        A tuple (rows, total_count, total_size), where rows is a list of at most
+        n tuples (type_name, count, size) sorted by size, or by count if sizes
+        is False, and size is None if sizes is False.
+    """
+    objs = gc.get_objects()
+    counts = collections.Counter(map(type, objs))
+    if sizes:
+        getsizeof = sys.getsizeof
+        size_per_type = collections.defaultdict(int)
+        for obj in objs:
+            size_per_type[type(obj)] += getsizeof(obj)
+        ranked = sorted(size_per_type.items(), key = lambda x: -x[1])[:n]
+        rows = [ (_type_name(t), counts[t], size) for t, size in ranked ]
+        total_size = sum(size_per_type.values())
+    else:
+        rows = [ (_type_name(t), count, None)
+                for t, count in counts.most_common(n) ]
+        total_size = None
+    total_count = len(objs)
+    del objs
+    return rows, total_count, total_size
+
+def take_snapshot():
+    """Take a tracemalloc snapshot, starting tracemalloc if needed.
+
+    Returns:
+        True if tracemalloc was started by this call, i.e., the snapshot only
+        contains the allocations made from now on.
+    """
+    global _snapshot
+    started = not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    _snapshot = tracemalloc.take_snapshot()
+    return started
+
+def diff_snapshot(n):
+    """Compare a new snapshot with the last one by line.
+
+    Arguments:
+        n: The number of lines to report.
+
+    Returns:
+        A list of at most n tracemalloc.StatisticDiff objects, largest growth
+        first, or None if no snapshot was taken before.
+    """
+    if _snapshot is None or not tracemalloc.is_tracing():
+        return None
+    current = tracemalloc.take_snapshot()
+    filters = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    ]
+    stats = current.filter_traces(filters).compare_to(
+            _snapshot.filter_traces(filters), 'lineno')
+    return stats[:n]
+
+def rss():
+    """Get the resident set size of this process.
+
+    Returns:
+        A tuple (current, peak) in bytes. current is None if it cannot be
+        determined on this platform.
+    """
+    current = None
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            current = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return current, None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes elsewhere.
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return current, peak
+
+def format_size(size):
+    """Format a number of bytes in a human friendly way."""
+    for unit in ('B', 'KiB', 'MiB', 'GiB'):
+        if abs(size) < 1024 or unit == 'GiB':
+            break
+        size /= 1024
+    return '{:.1f} {}'.format(size, unit) if unit != 'B' else \
+            '{} B'.format(size)
+
+def _type_name(t):
+    module = getattr(t, '__module__', None)
+    if module in (None, 'builtins'):
+        return t.__qualname__
+    return module + '.' + t.__qualname__
@@ -0,0 +1,133 @@
+"""Speculative precomputation of completion candidates.
+
+While the shell is blocked in input(), a background thread completes the first
+argument of the commands that are most likely to be completed next, via their
+completer methods, completion specs, or parsers, and keeps the results. The
+first TAB after typing such a command then hits a warm cache.
+
+Completers never run concurrently with commands or with each other: the thread
+is stopped, and joined, before the line read is executed, and the foreground
+completion waits for the completer the thread is running, if any.
+"""
+
+import threading
+
+class CompletionPrefetcher(object):
+
+    """Warm the completion candidates of recently used commands.
+
+    The prediction is based on the history of the current shell. As every
+    subshell keeps its own history, i.e., the history is keyed by the mode
+    stack, the prediction automatically follows the mode stack.
+
+    Only the candidates for the first argument with an empty text, i.e., the
+    state right after typing '<command> ', are prefetched. They are valid until
+    the next line is executed.
+
+    Attributes:
+        depth: The maximal number of distinct commands to prefetch for.
+    """
+
+    def __init__(self, shell, *, depth = 3):
+        self._shell = shell
+        self.depth = depth
+        self._cache = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Held while a completer runs, see paused().
+        self._busy = threading.Lock()
+        self._thread = None
+
+    def predict(self):
+        """Predict the commands whose completers are likely invoked next.
+
+        Returns:
+            A list of at most self.depth command names, most recent first.
+        """
+        import readline
+        completer_map = self._shell._completer_map
+        spec_map = self._shell._spec_map
+        ret = []
+        for i in range(readline.get_current_history_length(), 0, -1):
+            line = readline.get_history_item(i)
+            if not line:
+                continue
+            toks = line.split(None, 1)
+            if not toks:
+                continue
+            cmd = toks[0]
+            if (cmd in completer_map or cmd in spec_map) and not cmd in ret:
+                ret.append(cmd)
+                if len(ret) >= self.depth:
+                    break
+        return ret
+
+    def start(self):
+        """Start warming the cache in a background thread."""
+        if self.depth <= 0:
+            return
+        cmds = self.predict()
+        if not cmds:
+            return
+        self._thread = threading.Thread(target = self.__run,
+                args = (self._generation, cmds), daemon = True)
+        self._thread.start()
+
+    def stop(self):
+        """Drop all prefetched candidates and wait for the thread to finish.
+
+        A completer already running is not interrupted, but no other completer
+        is started afterwards.
+        """
+        self.invalidate()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def invalidate(self):
+        """Drop all prefetched candidates, including those still in flight."""
+        with self._lock:
+            self._generation += 1
+            self._cache = {}
+
+    def paused(self):
+        """Get a context manager keeping the thread from running completers.
+
+        Entering it waits for the completer being run by the thread, if any.
+        """
+        return self._busy
+
+    def lookup(self, cmd):
+        """Get the prefetched candidates of a command.
+
+        Returns:
+            A list of candidates, or None if nothing was prefetched for cmd.
+        """
+        with self._lock:
+            return self._cache.get(cmd)
+
+    def __run(self, generation, cmds):
+        for cmd in cmds:
+            if generation != self._generation:
+                return
+            # Errors are reported by the foreground completion, if ever.
+            try:
+                with self._busy:
+                    if generation != self._generation:
+                        return
+                    candidates = self.__complete(cmd) or []
+            except Exception:
+                continue
+            with self._lock:
+                if generation != self._generation:
+                    return
+                self._cache[cmd] = list(candidates)
+
+    def __complete(self, cmd):
+        # Same precedence as the foreground completion: completer methods
+        # first, then completion specs and parsers.
+        shell = self._shell
+        if cmd in shell._completer_map:
+            completer_method = getattr(shell, shell._completer_map[cmd])
+            return completer_method(cmd, None, '')
+        return shell._spec_map[cmd].complete(shell, None, '')
@@ -0,0 +1,436 @@
+"""Record sessions and replay them, e.g., to load test new versions of shells.
+
+A Recorder appends a record per line executed by the shells of this process to
+a file, e.g., with the --record option of 'python3 -m easyshell'. Every line of
+the file is a JSON array:
+
+    [start, depth, status, duration, line, session]
+
+where start is the time.time() the line started, depth the depth of the shell
+executing it in the shell stack, status its status, 0 for success, duration
+its latency in seconds, and session the id of the root shell it was executed
+under. Lines are recorded whether or not their commands exist or they can be
+tokenized. Every command of a line with sequencing operators is recorded as a
+line of its own. Commands executed by other commands, e.g., by 'time', are part
+of the line of the outer command. The latency of a line entering a subshell
+lasts until the subshell is entered.
+
+The replayer feeds the recorded lines of every session to a new root shell in
+batch mode, at the original pace or as fast as possible, in several processes at
+once, and reports the latency distribution of every command, e.g.:
+
+    $ python3 -m easyshell.replay session.rec -n 8
+    $ python3 -m easyshell.replay session.rec --speed 1 --shell mypkg:MyShell
+
+Subshells left without a recorded line, e.g., by the blocks of block-structured
+scripts, are left by the replayer as if Ctrl-D was typed. Lines executed at
+another depth or with another status than recorded are counted as diverged.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+import weakref
+
+from . import hooks
+from .base import _ShellBase, format_time, positive_int, \
+        resolve_shell_cls
+
+class _LineHooks(object):
+
+    """Call line() once per line executed by the shells.
+
+    A line is a line executed by a shell not already executing a line, see the
+    'line' hooks of easyshell.hooks. Subclasses override begin() and line().
+
+    Attributes:
+        depth: The depth of the shell on top of the stack, as seen by the
+            subshell events.
+    """
+
+    def __init__(self):
+        # Lists [shell, is_line, start, entered, cmd, tag] of the lines being
+        # executed, innermost last.
+        self._stack = []
+        self.depth = 0
+
+    def start(self):
+        """Register the hooks."""
+        hooks.register('line', self.__pre, phase = 'pre')
+        hooks.register('line', self.__post)
+        hooks.register('command', self.__command, phase = 'pre')
+        hooks.register('subshell', self.__enter, phase = 'pre')
+        hooks.register('subshell', self.__leave)
+
+    def stop(self):
+        """Unregister the hooks."""
+        hooks.unregister('line', self.__pre, phase = 'pre')
+        hooks.unregister('line', self.__post)
+        hooks.unregister('command', self.__command, phase = 'pre')
+        hooks.unregister('subshell', self.__enter, phase = 'pre')
+        hooks.unregister('subshell', self.__leave)
+
+    def begin(self, event):
+        """Called when a line starts.
+
+        Returns:
+            A tag passed to line().
+        """
+        return None
+
+    def line(self, event, cmd, duration, tag):
+        """Called when a line is done.
+
+        Arguments:
+            event: The 'post' Event object of the line.
+            cmd: The command of the line. If no command was dispatched, e.g.,
+                as it does not exist, the first word of the line.
+            duration: The latency of the line in seconds.
+            tag: The return value of begin().
+        """
+        pass
+
+    def __pre(self, event):
+        self.depth = len(event.mode_stack)
+        is_line = not any(entry[0] is event.shell for entry in self._stack)
+        self._stack.append([ event.shell, is_line, time.perf_counter(), None,
+                None, self.begin(event) if is_line else None ])
+
+    def __post(self, event):
+        shell, is_line, start, entered, cmd, tag = self._stack.pop()
+        if is_line:
+            end = entered if entered is not None else time.perf_counter()
+            if cmd is None:
+                words = event.line.split(None, 1)
+                cmd = words[0] if words else ''
+            self.line(event, cmd, end - start, tag)
+
+    def __command(self, event):
+        # The first command dispatched by the innermost line of the shell.
+        for entry in reversed(self._stack):
+            if entry[0] is event.shell:
+                if entry[4] is None:
+                    entry[4] = event.cmd
+                break
+
+    def __enter(self, event):
+        self.depth = len(event.mode_stack) + 1
+        now = time.perf_counter()
+        for entry in reversed(self._stack):
+            if entry[0] is not event.shell:
+                break
+            if entry[3] is None:
+                entry[3] = now
+
+    def __leave(self, event):
+        self.depth = len(event.mode_stack)
+
+class Recorder(_LineHooks):
+
+    """Append a record per line executed by the shells to a file."""
+
+    def __init__(self, fname):
+        super().__init__()
+        self.fname = fname
+        self._file = None
+        # Maps root shells to the ids of their sessions.
+        self._sessions = weakref.WeakKeyDictionary()
+
+    def start(self):
+        """Open the file and register the hooks."""
+        self._file = open(self.fname, 'a', encoding = 'utf8', buffering = 1)
+        super().start()
+
+    def stop(self):
+        """Unregister the hooks and close the file."""
+        if self._file is None:
+            return
+        super().stop()
+        self._file.close()
+        self._file = None
+
+    def line(self, event, cmd, duration, tag):
+        shell = event.shell
+        root = shell._mode_stack[0].shell if shell._mode_stack else shell
+        session = self._sessions.get(root)
+        if session is None:
+            import uuid
+            session = self._sessions[root] = '{}-{}'.format(os.getpid(),
+                    uuid.uuid4().hex[:12])
+        record = [ round(event.start, 6), len(event.mode_stack),
+                shell.status, round(duration, 9), event.line, session ]
+        self._file.write(json.dumps(record, ensure_ascii = False,
+                separators = (',', ':')))
+        self._file.write('\n')
+
+def _session(record):
+    """The session of a record, None for records without one."""
+    return record[5] if len(record) > 5 else None
+
+def load(fname):
+    """Load the records of a file written by a Recorder.
+
+    Returns:
+        A list of tuples (start, depth, status, duration, line, session). The
+        records of every session are consecutive and sorted by start, i.e., in
+        the order the lines were typed. Sessions are sorted by the start of
+        their first lines. Records written without a session have the session
+        None.
+    """
+    records = []
+    with open(fname, encoding = 'utf8') as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                if len(record) < 6:
+                    record.append(None)
+                records.append(tuple(record))
+    records.sort(key = lambda r: r[0])
+    first = {}
+    for record in records:
+        first.setdefault(_session(record), record[0])
+    records.sort(key = lambda r: first[_session(r)])
+    return records
+
+class _Source(object):
+
+    """Feed recorded lines to the shells, in place of a pipe end.
+
+    Before a line recorded at a lower depth than the shell on top, EOF lines
+    are fed to leave subshells.
+
+    Attributes:
+        current: The record of the line fed last, None for EOF lines.
+    """
+
+    def __init__(self, records, tracker, *, speed = 0.0, max_gap = 10.0):
+        self._records = records
+        self._tracker = tracker
+        self._i = 0
+        self.current = None
+        # The times to feed the lines at, relative to the first one.
+        self._offsets = None
+        if speed > 0:
+            self._offsets = [ 0.0 ]
+            for prev, rec in zip(records, records[1:]):
+                self._offsets.append(self._offsets[-1] +
+                        min(rec[0] - prev[0], max_gap) / speed)
+        self._t0 = None
+
+    @property
+    def done(self):
+        return self._i >= len(self._records)
+
+    def recv(self):
+        self.current = None
+        if self.done:
+            raise EOFError
+        rec = self._records[self._i]
+        if rec[1] < self._tracker.depth:
+            return _ShellBase.EOF
+        if self._offsets is not None:
+            now = time.perf_counter()
+            if self._t0 is None:
+                self._t0 = now
+            delay = self._t0 + self._offsets[self._i] - now
+            if delay > 0:
+                time.sleep(delay)
+        self._i += 1
+        self.current = rec
+        return rec[4]
+
+class _Replay(_LineHooks):
+
+    """Collect the latencies of the lines of a replay."""
+
+    def __init__(self):
+        super().__init__()
+        self.source = None
+        self.latencies = {}
+        self.errors = {}
+        self.diverged = 0
+
+    def begin(self, event):
+        rec = self.source.current
+        if rec is not None and rec[1] != len(event.mode_stack):
+            self.diverged += 1
+            return None
+        return rec
+
+    def line(self, event, cmd, duration, tag):
+        if tag is None:
+            return
+        self.latencies.setdefault(cmd, []).append(duration)
+        status = event.shell.status
+        if status != 0:
+            self.errors[cmd] = self.errors.get(cmd, 0) + 1
+        if status != tag[2]:
+            self.diverged += 1
+
+def replay(records, shell_cls, *, speed = 0.0, max_gap = 10.0):
+    """Replay records in shells in batch mode in this process.
+
+    Every recorded session is replayed in a new root shell, and in another one
+    whenever the root shell exits before the last line of the session. The
+    sessions are replayed one after the other. Outputs of the shells are
+    discarded.
+
+    Arguments:
+        records: A list of records, as returned by load().
+        shell_cls: The class of the root shells, or its import path.
+        speed: The speed relative to the original pace, e.g., 2 for twice as
+            fast. 0 means as fast as possible.
+        max_gap: The maximal pause between lines, in recorded seconds.
+
+    Returns:
+        A dictionary with the keys lines, the number of lines replayed,
+        seconds, the wall time, diverged, the number of diverged lines,
+        latencies, mapping commands to lists of latencies in seconds, and
+        errors, mapping commands to the number of failed lines.
+    """
+    shell_cls = resolve_shell_cls(shell_cls)
+    collector = _Replay()
+    collector.start()
+    start = time.perf_counter()
+    try:
+        with open(os.devnull, 'w') as devnull:
+            for session, group in itertools.groupby(records, key = _session):
+                source = _Source(list(group), collector, speed = speed,
+                        max_gap = max_gap)
+                collector.source = source
+                while not source.done:
+                    collector.depth = 0
+                    shell_cls(batch_mode = True, pipe_end = source,
+                            stdout = devnull, stderr = devnull).cmdloop()
+    finally:
+        collector.stop()
+    return {
+        'lines': sum(len(v) for v in collector.latencies.values()),
+        'seconds': time.perf_counter() - start,
+        'diverged': collector.diverged,
+        'latencies': collector.latencies,
+        'errors': collector.errors,
+    }
+
+def _replay_process(fname, shell_cls, speed, max_gap):
+    """Replay a file in a worker process, whose outputs are discarded."""
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    return replay(load(fname), shell_cls, speed = speed, max_gap = max_gap)
+
+def summarize(name, latencies, *, unit):
+    """Summarize a list of latencies in seconds, e.g., of a replay.
+
+    The result has the same keys as those of benchmarks.runner.measure(), so
+    that benchmarks.runner compares it, and the p90, p99, and max latencies.
+
+    Arguments:
+        name: The name of the result.
+        latencies: A non-empty list of latencies.
+        unit: What a latency is of, e.g., 'line'.
+    """
+    import statistics
+    if len(latencies) >= 2:
+        percentiles = statistics.quantiles(latencies, n = 100,
+                method = 'inclusive')
+        quartiles = statistics.quantiles(latencies, n = 4,
+                method = 'inclusive')
+        p90, p99, iqr = percentiles[89], percentiles[98], \
+                quartiles[2] - quartiles[0]
+    else:
+        p90 = p99 = latencies[0]
+        iqr = 0.0
+    median = statistics.median(latencies)
+    return {
+        'name': name,
+        'unit': unit,
+        'items': 1,
+        'number': 1,
+        'repeat': len(latencies),
+        'min': min(latencies),
+        'median': median,
+        'mean': statistics.mean(latencies),
+        'stdev': statistics.stdev(latencies) if len(latencies) > 1 else 0.0,
+        'iqr': iqr,
+        'rate': 1.0 / median if median else float('inf'),
+        'p90': p90,
+        'p99': p99,
+        'max': max(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__,
+            formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('file',
+            metavar = 'FILE',
+            help = 'the records written by --record')
+    parser.add_argument('--shell',
+            metavar = 'MODULE:CLASS',
+            default = 'easyshell.example_shell:MyShell',
+            help = 'the import path of the root shell class')
+    parser.add_argument('-n', '--concurrency',
+            metavar = 'N',
+            type = positive_int,
+            default = 1,
+            help = 'the number of replays run at once, each in a process')
+    parser.add_argument('--speed',
+            type = float,
+            default = 0.0,
+            help = 'the speed relative to the recorded pace, e.g., 1 for the'
+                    ' original pace, 0 for as fast as possible')
+    parser.add_argument('--max-gap',
+            metavar = 'SECONDS',
+            type = float,
+            default = 10.0,
+            help = 'the maximal recorded pause between lines, e.g., between'
+                    ' sessions, that is kept')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            help = 'write the latencies of the commands to FILE as JSON, in'
+                    ' the format of benchmarks.runner, e.g., for comparison')
+    args = parser.parse_args()
+
+    import multiprocessing
+    work = [ (args.file, args.shell, args.speed, args.max_gap) ] * \
+            args.concurrency
+    start = time.perf_counter()
+    with multiprocessing.Pool(args.concurrency) as pool:
+        reports = pool.starmap(_replay_process, work)
+    seconds = time.perf_counter() - start
+
+    latencies = {}
+    errors = {}
+    for report in reports:
+        for cmd, values in report['latencies'].items():
+            latencies.setdefault(cmd, []).extend(values)
+        for cmd, n in report['errors'].items():
+            errors[cmd] = errors.get(cmd, 0) + n
+    lines = sum(report['lines'] for report in reports)
+    diverged = sum(report['diverged'] for report in reports)
+
+    results = []
+    print('{:<24}{:>8}{:>12}{:>12}{:>12}{:>12}{:>8}'.format('command', 'lines',
+            'p50', 'p90', 'p99', 'max', 'errors'))
+    for cmd in sorted(latencies):
+        result = summarize(cmd, latencies[cmd], unit = 'line')
+        results.append(result)
+        print('{:<24}{:>8}{:>12}{:>12}{:>12}{:>12}{:>8}'.format(cmd,
+                len(latencies[cmd]), format_time(result['median']),
+                format_time(result['p90']),
+                format_time(result['p99']),
+                format_time(result['max']), errors.get(cmd, 0)))
+    print('{} lines in {:.3f} s, {:.1f} lines/s, {} replays, {} diverged'
+            .format(lines, seconds, lines / seconds if seconds else 0.0,
+            args.concurrency, diverged))
+
+    if args.output:
+        with open(args.output, 'w', encoding = 'utf8') as f:
+            json.dump({ 'environment': { 'python': sys.version.split()[0],
+                    'time': time.time() }, 'results': results }, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+"""Low-overhead sampling profiler.
+
+A background thread periodically samples the stack of the profiled thread via
+sys._current_frames(). Unlike cProfile, the profiled code is not instrumented,
+so its speed is barely affected. The samples are written as collapsed stacks,
+one line per unique stack followed by its count, which is the input format of
+flame graph tools such as flamegraph.pl and speedscope.
+
+Every sample is prefixed with the prompt of the shell executing a command and
+the name of the command, so the flame graph is split by subshell and command.
+Samples taken while no command is executing, e.g., while waiting for input, are
+not recorded.
+"""
+
+import collections
+import os
+import sys
+import threading
+
+from .base import _ShellBase
+
+class SamplingProfiler(object):
+
+    """Sample the stack of a thread at a fixed rate.
+
+    Attributes:
+        rate: The number of samples per second.
+        samples: A collections.Counter mapping tuples of frame labels, root
+            first, to the number of times they were sampled.
+    """
+
+    def __init__(self, *, rate = 100, thread_id = None):
+        """Create a sampling profiler.
+
+        Arguments:
+            rate: The number of samples per second.
+            thread_id: The id of the thread to sample. The default, None, means
+                the main thread.
+
+        Raises:
+            ValueError: The rate is not positive.
+        """
+        if rate <= 0:
+            raise ValueError('sampling rate must be positive: {}'.format(rate))
+        self.rate = rate
+        self.samples = collections.Counter()
+        self._thread_id = thread_id if thread_id is not None else \
+                threading.main_thread().ident
+        self._labels = {}
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None
+
+    def start(self):
+        """Start sampling in a background thread."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target = self.__run, daemon = True,
+                name = 'easyshell-sampler')
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the background thread to finish."""
+        if self._thread is None:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def write(self, fname):
+        """Write the samples to a file in the collapsed stack format."""
+        with open(fname, 'w', encoding = 'utf8') as f:
+            for stack, count in self.samples.most_common():
+                f.write(';'.join(stack))
+                f.write(' {}\n'.format(count))
+
+    def __run(self):
+        interval = 1.0 / self.rate
+        while not self._stop_event.wait(interval):
+            self.sample()
+
+    def sample(self):
+        """Take one sample of the profiled thread."""
+        active = _ShellBase._active_command
+        if active is None:
+            return
+        frame = sys._current_frames().get(self._thread_id)
+        if frame is None:
+            return
+        labels = self._labels
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            label = labels.get(code)
+            if label is None:
+                label = _sanitize('{}:{}'.format(
+                        os.path.basename(code.co_filename),
+                        getattr(code, 'co_qualname', code.co_name)))
+                labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        shell, cmd = active
+        stack.append(_sanitize('cmd:' + cmd))
+        stack.append(_sanitize('shell:' + shell.prompt.strip()))
+        stack.reverse()
+        self.samples[tuple(stack)] += 1
+
+def _sanitize(label):
+    """Remove the separators of the collapsed stack format from a label."""
+    return label.replace(';', ':').replace(' ', '_')
+
+# The profiler started by start(), if any.
+_profiler = None
+
+def start(*, rate = 100):
+    """Start the process-wide sampling profiler of the main thread.
+
+    Returns:
+        False if it is already running, True otherwise.
+    """
+    global _profiler
+    if _profiler is not None and _profiler.running:
+        return False
+    _profiler = SamplingProfiler(rate = rate)
+    _profiler.start()
+    return True
+
+def stop(fname):
+    """Stop the process-wide sampling profiler and write its samples.
+
+    Returns:
+        The number of samples written, or None if it is not running.
+    """
+    global _profiler
+    if _profiler is None or not _profiler.running:
+        return None
+    _profiler.stop()
+    _profiler.write(fname)
+    n = sum(_profiler.samples.values())
+    _profiler = None
+    return n
@@ -0,0 +1,903 @@
+"""Block-structured scripts, where indentation opens and closes subshells.
+
+A line followed by lines indented deeper is the header of a block. The header
+must be a command entering a subshell, and the lines of the block are executed
+in that subshell. The subshell is left when the block ends, without an 'exit'
+or 'end' line, e.g.:
+
+    foo
+        context
+        kar x
+            p y
+        stack
+    bar
+        hello
+
+Blank lines and lines starting with '#' do not affect the structure. A dedent
+must return to the indentation of an enclosing block, as in python.
+
+Before it runs, a script is compiled against the shell classes it enters into
+a Plan, a flat list of operations. Every line is resolved against the commands
+of the class of the shell executing it: the command must exist, its arguments
+must match its nargs or its parser, and a header must be a subshell command,
+whose subshell class is resolved to compile the block. The problems are
+reported with their line numbers, all at once and before anything runs.
+Plans are pre-tokenized, and load_plan() caches them on disk, keyed by the
+script and the commands of the shell classes, so that repeated runs of a script
+neither parse nor tokenize it. The cache is private to the user and keeps the
+plans used last.
+
+The plan is executed in this process with an explicit stack of subshells,
+i.e., entering a block pushes a subshell without running its cmdloop(), and
+leaving a block pops it. Exit directives, e.g., 'exit', 'end', or 'stack 1',
+leave the blocks down to the shell exited to, and the rest of those blocks is
+skipped.
+
+Long runs can save their progress periodically to a Checkpoint, and resume
+from it after a crash. An error policy stops a run after a number of failed
+lines, leaving a checkpoint at the first line not done.
+"""
+
+import contextlib
+import hashlib
+import io
+import os
+import pickle
+import time
+import traceback
+
+from . import hooks
+from . import metrics
+from .base import SEQUENCE_OPERATORS, _LineSource, _ShellBase, _check_nargs, \
+        iscommand, resolve_shell_cls, split_sequence
+
+class ScriptError(Exception):
+
+    """The structure of a script is invalid.
+
+    Attributes:
+        lineno: The number of the offending line, starting from 1.
+    """
+
+    def __init__(self, lineno, message):
+        super().__init__('line {}: {}'.format(lineno, message))
+        self.lineno = lineno
+
+class Block(object):
+
+    """A line of a script and the block of lines indented under it.
+
+    Attributes:
+        lineno: The number of the line, starting from 1. 0 for the root.
+        line: The line without indentation. '' for the root.
+        body: A list of Block objects, empty if the line is not a header.
+    """
+
+    __slots__ = ('lineno', 'line', 'body')
+
+    def __init__(self, lineno, line):
+        self.lineno = lineno
+        self.line = line
+        self.body = []
+
+def parse(content):
+    """Parse a script into a tree of blocks.
+
+    Arguments:
+        content: A unicode string, the script.
+
+    Returns:
+        The root Block object, whose body are the top level lines.
+
+    Raises:
+        ScriptError: The indentation is inconsistent.
+    """
+    root = Block(0, '')
+    # Tuples (indentation, block) of the open blocks, innermost last.
+    stack = [ ('', root) ]
+    for lineno, raw in enumerate(content.split('\n'), 1):
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        indent = raw[:len(raw) - len(raw.lstrip())]
+        if indent != stack[-1][0]:
+            if indent.startswith(stack[-1][0]):
+                # Open the block of the previous line.
+                parent = stack[-1][1]
+                if not parent.body:
+                    raise ScriptError(lineno, 'unexpected indent')
+                stack.append((indent, parent.body[-1]))
+            else:
+                while len(stack) > 1 and stack[-1][0] != indent and \
+                        stack[-1][0].startswith(indent):
+                    stack.pop()
+                if stack[-1][0] != indent:
+                    raise ScriptError(lineno, 'unindent does not match any'
+                            ' outer indentation level')
+        stack[-1][1].body.append(Block(lineno, line))
+    return root
+
+# The version of the format of plans, part of the keys of cached plans.
+PLAN_VERSION = 1
+
+# The operations of plans are tuples whose first item is one of:
+#   (OP_EXEC, lineno, line, cmd, args)
+#       Execute a line. If cmd is None, the line is executed by __exec_line__(),
+#       e.g., as it has sequencing operators or was not resolved when compiled.
+#       Otherwise the command cmd is executed with the list of arguments args.
+#   (OP_ENTER, lineno, line, cmd, args, end)
+#       Execute the header of a block, as OP_EXEC, and enter the subshell. If
+#       no subshell is entered, skip to the operation at index end, i.e., after
+#       the OP_LEAVE of the block.
+#   (OP_LEAVE,)
+#       Leave the block.
+OP_EXEC, OP_ENTER, OP_LEAVE = range(3)
+
+class Plan(object):
+
+    """A compiled script.
+
+    Attributes:
+        ops: The list of operations, see OP_EXEC.
+        root: The import path of the shell class the script was compiled for.
+        classes: A dictionary mapping the import paths of the shell classes the
+            script was compiled against to their fingerprints.
+        errors: A list of ScriptError objects, the problems found by the
+            compiler. Not saved in the cache.
+    """
+
+    def __init__(self, ops, root, classes, errors):
+        self.ops = ops
+        self.root = root
+        self.classes = classes
+        self.errors = errors
+
+    def __getstate__(self):
+        return ( self.ops, self.root, self.classes )
+
+    def __setstate__(self, state):
+        self.ops, self.root, self.classes = state
+        self.errors = []
+
+def class_path(cls):
+    """Get the import path of a class, as accepted by resolve_shell_cls()."""
+    return '{}:{}'.format(cls.__module__, cls.__qualname__)
+
+def _hash_code(h, code):
+    """Update a hash with a code object, its names and constants, and those of
+    the code objects nested in it, e.g., of its inner functions."""
+    h.update(code.co_code)
+    h.update(repr(code.co_names).encode('utf8'))
+    for const in code.co_consts:
+        if isinstance(const, type(code)):
+            _hash_code(h, const)
+        elif isinstance(const, frozenset):
+            # The order of the items depends on the hash seed of the process.
+            h.update(repr(sorted(repr(x) for x in const)).encode('utf8'))
+        else:
+            h.update(repr(const).encode('utf8'))
+
+def _parser_signature(parser):
+    """Get what validating arguments with an argparse parser depends on, as a
+    tuple whose repr() is the same in every process."""
+    def name(obj):
+        if obj is None:
+            return None
+        return '{}.{}'.format(getattr(obj, '__module__', ''),
+                getattr(obj, '__qualname__', type(obj).__qualname__))
+    return tuple(( type(action).__name__, tuple(action.option_strings),
+            action.dest, action.nargs, action.required, name(action.type),
+            sorted(repr(x) for x in action.choices) \
+                    if action.choices is not None else None )
+            for action in parser._actions)
+
+class _Registry(object):
+
+    """The commands of a shell class, as seen by the compiler.
+
+    The registry is built from the class alone, so that checking whether cached
+    plans are current runs no constructors of shells.
+
+    Attributes:
+        cls: The shell class.
+        cmd_map_all: A dictionary mapping the commands of the class to the
+            names of their methods.
+        cmd_map_internal: The same, for the internal commands, e.g., 'exit'.
+        fingerprint: A digest of everything compiled plans depend on: the
+            commands, their methods, nargs, the arguments of their parsers,
+            and subshell classes, and the code, including the constants, of
+            the tokenizer of the class.
+    """
+
+    def __init__(self, cls):
+        self.cls = cls
+        self._shell = None
+        self.cmd_map_all, _, self.cmd_map_internal = cls._command_maps()
+        h = hashlib.sha256(class_path(cls).encode('utf8'))
+        h.update(repr(cls.sequencing).encode('utf8'))
+        for name in ( 'parse_line', '_tokenize' ):
+            _hash_code(h, getattr(cls, name).__code__)
+        for cmd, func_name in sorted(self.cmd_map_all.items()):
+            func = getattr(cls, func_name)
+            command_parser = getattr(func, '__command_parser__', None)
+            h.update(repr(( cmd, func_name, cmd in self.cmd_map_internal,
+                    func.__command__.get('nargs'),
+                    _parser_signature(command_parser.parser) \
+                            if command_parser else None,
+                    getattr(func, '__launch_subshell__', None) )).encode('utf8'))
+        self.fingerprint = h.hexdigest()
+
+    @property
+    def shell(self):
+        """An instance of the class in batch mode, created when a script is
+        first compiled against the class, to tokenize lines in the same way as
+        the shells executing them."""
+        if self._shell is None:
+            self._shell = self.cls(batch_mode = True)
+        return self._shell
+
+    def check(self, lineno, line):
+        """Resolve a line without sequencing operators.
+
+        Returns:
+            A tuple (cmd, args, target, error). cmd and args are as returned by
+            _ShellBase._tokenize(), or None if the line cannot be tokenized or
+            the command does not exist. target is the subshell class entered by
+            the command, or None. error is a ScriptError object, or None.
+        """
+        try:
+            toks = self.shell._tokenize(line)
+        except ValueError as e:
+            return None, None, None, ScriptError(lineno, '{}: {}'.format(e,
+                    line))
+        if toks is None:
+            return None, None, None, None
+        cmd, args = toks
+        func_name = self.cmd_map_all.get(cmd)
+        if func_name is None:
+            return None, None, None, ScriptError(lineno, "{}: command not"
+                    " found in {}".format(cmd, self.cls.__name__))
+        func = getattr(self.cls, func_name)
+
+        error = None
+        command_parser = getattr(func, '__command_parser__', None)
+        if command_parser:
+            parser = command_parser.parser
+            parser.prog = cmd
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out), \
+                    contextlib.redirect_stderr(out):
+                try:
+                    parser.parse_args(args)
+                except SystemExit as e:
+                    if e.code:
+                        lines = out.getvalue().strip().split('\n')
+                        error = ScriptError(lineno, lines[-1])
+        elif iscommand(func):
+            msg = _check_nargs(cmd, func.__command__['nargs'], args)
+            if msg:
+                error = ScriptError(lineno, msg.strip())
+
+        target = None
+        if hasattr(func, '__launch_subshell__'):
+            try:
+                target = resolve_shell_cls(func.__launch_subshell__,
+                        package = func.__subshell_package__)
+            except (ImportError, AttributeError, ValueError) as e:
+                error = ScriptError(lineno, '{}: cannot resolve the subshell'
+                        ' class: {}'.format(cmd, e))
+        return cmd, args, target, error
+
+# Registries of the shell classes compiled against, keyed by class.
+_registries = {}
+
+def _registry(cls):
+    registry = _registries.get(cls)
+    if registry is None:
+        registry = _registries[cls] = _Registry(cls)
+    return registry
+
+class _Compiler(object):
+
+    """Compile a tree of blocks into a Plan, see compile_script()."""
+
+    def __init__(self):
+        self.ops = []
+        self.classes = {}
+        self.errors = []
+
+    def block(self, blocks, registry):
+        """Compile the lines of a block executed by a shell whose registry is
+        given, or None if the class of the shell is unknown."""
+        if registry is not None:
+            self.classes[class_path(registry.cls)] = registry.fingerprint
+        for block in blocks:
+            nerrors = len(self.errors)
+            cmd, args, target = self.line(block, registry)
+            if not block.body:
+                self.ops.append(( OP_EXEC, block.lineno, block.line, cmd,
+                        args ))
+                continue
+            if registry is not None and target is None and \
+                    len(self.errors) == nerrors:
+                self.errors.append(ScriptError(block.lineno, "'{}' does not"
+                        " enter a subshell, but heads a block".format(
+                        block.line)))
+            i = len(self.ops)
+            self.ops.append(None)
+            self.block(block.body, _registry(target) if target else None)
+            self.ops.append(( OP_LEAVE, ))
+            self.ops[i] = ( OP_ENTER, block.lineno, block.line, cmd, args,
+                    len(self.ops) )
+
+    def line(self, block, registry):
+        """Check a line.
+
+        Returns:
+            A tuple (cmd, args, target), the pre-tokenized command, None if the
+            line has to be executed by __exec_line__(), and the subshell class
+            the line enters, or None.
+        """
+        if registry is None:
+            return None, None, None
+        line = block.line
+        if not (registry.cls.sequencing and
+                any(op in line for op in SEQUENCE_OPERATORS)):
+            cmd, args, target, error = registry.check(block.lineno, line)
+            if error:
+                self.errors.append(error)
+            return cmd, args, target
+
+        # The rest of a sequence runs in the subshell entered by the first
+        # command. Internal commands, e.g., 'exit', may leave shells, so the
+        # rest of their line is not checked.
+        entered = None
+        for i, ( op, segment ) in enumerate(split_sequence(line)):
+            cmd, args, target, error = registry.check(block.lineno, segment)
+            if error:
+                self.errors.append(error)
+            if i == 0:
+                entered = target
+            if cmd is None or cmd in registry.cmd_map_internal:
+                break
+            if target is not None:
+                registry = _registry(target)
+                self.classes[class_path(target)] = registry.fingerprint
+        return None, None, entered
+
+def compile_script(root, shell_cls):
+    """Compile a tree of blocks for a shell class.
+
+    Lines which cannot be resolved are compiled to be executed as they are, so
+    that a plan with errors still executes as the script would without
+    compiling it.
+
+    Arguments:
+        root: The root Block object, as returned by parse().
+        shell_cls: The class of the shell executing the script.
+
+    Returns:
+        A Plan object, whose errors attribute lists the problems found.
+    """
+    compiler = _Compiler()
+    compiler.block(root.body, _registry(shell_cls))
+    return Plan(compiler.ops, class_path(shell_cls), compiler.classes,
+            compiler.errors)
+
+# The number of plans kept in a cache directory. Beyond it, the least recently
+# used plans are removed.
+MAX_CACHED_PLANS = 64
+
+def default_cache_dir():
+    """Get the default directory of cached plans, of the current user."""
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or
+            os.path.join(os.path.expanduser('~'), '.cache'), 'easyshell',
+            'plans')
+
+def _private_dir(dirname):
+    """Create a directory of cached plans readable and writable by the current
+    user only, if it does not exist.
+
+    As loading a plan unpickles it, which may run arbitrary code, plans are only
+    loaded from and saved to directories no other user can write to.
+
+    Returns:
+        Whether the directory is owned by the current user and not writable by
+        the group or others.
+    """
+    try:
+        os.makedirs(dirname, mode = 0o700, exist_ok = True)
+        st = os.stat(dirname)
+    except OSError:
+        return False
+    return st.st_uid == os.getuid() and not st.st_mode & 0o022
+
+def _evict(cache_dir, max_plans):
+    """Remove the least recently used plans beyond max_plans."""
+    try:
+        names = [ name for name in os.listdir(cache_dir)
+                if name.endswith('.plan') ]
+    except OSError:
+        return
+    if len(names) <= max_plans:
+        return
+    entries = []
+    for name in names:
+        fname = os.path.join(cache_dir, name)
+        try:
+            entries.append(( os.stat(fname).st_mtime, fname ))
+        except OSError:
+            pass
+    entries.sort()
+    for mtime, fname in entries[:len(entries) - max_plans]:
+        try:
+            os.unlink(fname)
+        except OSError:
+            pass
+
+def load_plan(content, shell_cls, *, cache_dir = None,
+        max_plans = MAX_CACHED_PLANS):
+    """Compile a script, or load its plan cached by an earlier call.
+
+    A cached plan is used if the script and the fingerprints of all the shell
+    classes it was compiled against are unchanged. Plans with errors are not
+    cached. The cache is not used if its directory is not owned by the current
+    user or is writable by others, see _private_dir().
+
+    Arguments:
+        content: A unicode string, the script.
+        shell_cls: The class of the shell executing the script.
+        cache_dir: The directory of cached plans, created with permissions for
+            the current user only. None means not to cache.
+        max_plans: The number of plans kept in the directory, the least
+            recently used are removed.
+
+    Returns:
+        A Plan object.
+
+    Raises:
+        ScriptError: The indentation is inconsistent.
+    """
+    if cache_dir is None or not _private_dir(cache_dir):
+        return compile_script(parse(content), shell_cls)
+
+    root = class_path(shell_cls)
+    h = hashlib.sha256('{}\n{}\n{}\n'.format(PLAN_VERSION, root,
+            _registry(shell_cls).fingerprint).encode('utf8'))
+    h.update(content.encode('utf8'))
+    fname = os.path.join(cache_dir, h.hexdigest() + '.plan')
+    try:
+        with open(fname, 'rb') as f:
+            plan = pickle.load(f)
+        if _is_current(plan, shell_cls):
+            # The modification time orders the plans by their last use.
+            os.utime(fname)
+            return plan
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError,
+            ValueError, TypeError):
+        pass
+
+    plan = compile_script(parse(content), shell_cls)
+    if not plan.errors:
+        import tempfile
+        try:
+            fd, tmp = tempfile.mkstemp(dir = cache_dir,
+                    prefix = '.easyshell-plan-')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(plan, f, protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, fname)
+        except OSError:
+            # The cache is an optimization, e.g., it may be read only.
+            pass
+        else:
+            _evict(cache_dir, max_plans)
+    return plan
+
+def _is_current(plan, shell_cls):
+    """Are the shell classes a cached plan was compiled against unchanged?"""
+    for path, fingerprint in plan.classes.items():
+        if path == plan.root:
+            cls = shell_cls
+        else:
+            try:
+                cls = resolve_shell_cls(path)
+            except (ImportError, AttributeError, ValueError):
+                return False
+        if _registry(cls).fingerprint != fingerprint:
+            return False
+    return True
+
+class Checkpoint(object):
+
+    """A file saving the progress of a BlockExecutor, to resume it.
+
+    A checkpoint records the index of the next operation of the plan, the
+    status, the number of failed lines so far, and the shells on the stack:
+    their classes, the commands, prompts, and contexts they were entered with,
+    and the states returned by their checkpoint_state() methods, all taken
+    between the same two lines. It is pickled, so contexts and states must be
+    picklable.
+
+    Attributes:
+        fname: The path of the file.
+        interval: The minimal time between periodic saves, in seconds.
+    """
+
+    VERSION = 2
+
+    def __init__(self, fname, *, interval = 60.0):
+        self.fname = fname
+        self.interval = interval
+
+    def save(self, data):
+        """Atomically replace the file with a dictionary, see load()."""
+        import tempfile
+        dirname = os.path.dirname(os.path.abspath(self.fname))
+        fd, tmp = tempfile.mkstemp(dir = dirname,
+                prefix = '.easyshell-checkpoint-')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(dict(data, version = self.VERSION), f,
+                        protocol = pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.fname)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+    def load(self):
+        """Load the dictionary saved last.
+
+        Returns:
+            The dictionary, or None if there is no checkpoint.
+
+        Raises:
+            ValueError: The file is not a checkpoint of this version.
+        """
+        try:
+            with open(self.fname, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except (EOFError, pickle.UnpicklingError) as e:
+            raise ValueError('{}: invalid checkpoint: {}'.format(self.fname, e))
+        if not isinstance(data, dict) or data.get('version') != self.VERSION:
+            raise ValueError('{}: invalid checkpoint'.format(self.fname))
+        return data
+
+    def remove(self):
+        """Remove the file, if any, e.g., once the run is complete."""
+        try:
+            os.unlink(self.fname)
+        except FileNotFoundError:
+            pass
+
+class _Frame(object):
+
+    """A shell on the explicit stack of BlockExecutor.
+
+    Attributes:
+        end: The index of the operation following the block of the shell.
+    """
+
+    def __init__(self, shell, end, *, cmd = None, args = None):
+        self.shell = shell
+        self.end = end
+        self.cmd = cmd
+        self.args = args
+        self.start = time.perf_counter()
+        self.wall_start = time.time()
+
+class BlockExecutor(object):
+
+    """Execute block-structured scripts in a shell in batch mode.
+
+    Commands entering subshells outside of headers, e.g., in the last line of
+    a block, enter and leave their subshells immediately, as the subshells
+    read the end of input.
+    """
+
+    def __init__(self, shell, *, checkpoint = None, max_errors = None,
+            batch_size = 1000):
+        """Create an executor.
+
+        Arguments:
+            shell: The root shell, in batch mode.
+            checkpoint: A Checkpoint object to save the progress to, or None.
+            max_errors: The number of failed lines, i.e., lines whose last
+                command has a non-zero status or raised, after which the run
+                stops. The default, None, means never to stop.
+            batch_size: The maximal number of consecutive lines of a command
+                decorated with batch = True, see command(), executed at once.
+                Such a run of lines is one line for max_errors, checkpoints,
+                and metrics. Lines are not batched while hooks are active,
+                e.g., while recording, so that hooks see every line.
+
+        Attributes:
+            errors: The number of failed lines of the last run.
+            stopped: Whether the last run was stopped by max_errors.
+        """
+        if not shell.batch_mode:
+            raise ValueError('BlockExecutor requires a shell in batch_mode')
+        self.shell = shell
+        self.checkpoint = checkpoint
+        self.max_errors = max_errors
+        self.batch_size = batch_size
+        # Whether commands are batched, keyed by (shell class, command).
+        self._batched = {}
+        self.errors = 0
+        self.stopped = False
+
+    def run(self, root):
+        """Compile and execute a tree of blocks, see run_plan().
+
+        Arguments:
+            root: The root Block object, as returned by parse().
+        """
+        return self.run_plan(compile_script(root, type(self.shell)))
+
+    def run_string(self, content):
+        """Parse and execute a script, see run()."""
+        return self.run(parse(content))
+
+    def run_plan(self, plan, *, resume = False):
+        """Execute a plan.
+
+        With a checkpoint, the progress is saved periodically, before the
+        next line, and when max_errors stops the run, after the line stopping
+        it. A run raising, e.g., upon KeyboardInterrupt, leaves the checkpoint
+        saved last. The checkpoint is removed once the run is complete.
+
+        Arguments:
+            plan: A Plan object compiled for the class of the shell.
+            resume: Whether to continue from the checkpoint, if there is one,
+                instead of from the beginning of the plan.
+
+        Returns:
+            The exit directive of the root shell, as cmdloop().
+
+        Raises:
+            ValueError: The plan is compiled for another class, or the
+                checkpoint to resume from is invalid or of another plan.
+        """
+        shell = self.shell
+        if plan.root != class_path(type(shell)):
+            raise ValueError('the plan is compiled for {}, not {}'.format(
+                    plan.root, class_path(type(shell))))
+        ops = plan.ops
+        checkpoint = self.checkpoint
+        plan_id = None
+        data = None
+        if checkpoint:
+            plan_id = hashlib.sha256(pickle.dumps(( plan.root, ops ),
+                    protocol = 4)).hexdigest()
+            if resume:
+                data = checkpoint.load()
+                if data is not None and data['plan'] != plan_id:
+                    raise ValueError('{}: the checkpoint is of another script'
+                            .format(checkpoint.fname))
+        shell._pipe_end = _LineSource(())
+        stack = [ _Frame(shell, len(ops)) ]
+        self.errors = 0
+        self.stopped = False
+        directive = None
+        ip = 0
+        shell.preloop()
+        if data is not None:
+            ip = self.__restore(stack, data)
+        next_save = time.monotonic() + checkpoint.interval if checkpoint \
+                else None
+        complete = False
+        try:
+            while ip < len(ops):
+                if checkpoint and time.monotonic() >= next_save:
+                    self.__save(plan_id, ip, stack)
+                    next_save = time.monotonic() + checkpoint.interval
+                op = ops[ip]
+                ip += 1
+                if op[0] == OP_LEAVE:
+                    self.__leave(stack)
+                    continue
+                argvs = None
+                if op[0] == OP_EXEC and not hooks.active and \
+                        self.__batched(stack[-1].shell, op[3]):
+                    argvs, ip = self.__group(ops, op, ip)
+                directive, ip = self.__exec(stack, op, ip, argvs)
+                failed = shell.status != 0
+                if failed:
+                    self.errors += 1
+                if directive == 'all' or (directive is True and
+                        len(stack) == 1):
+                    break
+                ip = self.__pop_to(stack, directive, ip)
+                if failed and self.max_errors is not None and \
+                        self.errors >= self.max_errors:
+                    shell.stderr.write('line {}: stopping after {} failed'
+                            ' line{}\n'.format(op[1], self.errors,
+                            '' if self.errors == 1 else 's'))
+                    self.stopped = True
+                    # The failed line is done, resuming continues after it.
+                    if checkpoint:
+                        self.__save(plan_id, ip, stack)
+                    break
+            complete = not self.stopped
+        finally:
+            # Do not save a run raising, the states of its shells may be those
+            # of a partially executed line.
+            if complete and checkpoint:
+                checkpoint.remove()
+            while len(stack) > 1:
+                self.__leave(stack)
+            shell.postloop()
+            shell._sequence.pending.clear()
+        return directive
+
+    def __save(self, plan_id, ip, stack):
+        shells = []
+        for frame in stack:
+            entry = {
+                'cls': class_path(type(frame.shell)),
+                'end': frame.end,
+                'state': frame.shell.checkpoint_state(),
+            }
+            if frame.shell._mode_stack:
+                mode = frame.shell._mode_stack[-1]
+                entry.update(cmd = mode.cmd, args = mode.args,
+                        prompt = mode.prompt, context = mode.context)
+            shells.append(entry)
+        try:
+            self.checkpoint.save({
+                'plan': plan_id,
+                'ip': ip,
+                'status': self.shell.status,
+                'errors': self.errors,
+                'time': time.time(),
+                'shells': shells,
+            })
+        except (OSError, pickle.PicklingError, TypeError, AttributeError) as e:
+            # Keep running, the next save may succeed, e.g., once a context
+            # that cannot be pickled is left.
+            self.shell.stderr.write('checkpoint: cannot save {}: {}\n'.format(
+                    self.checkpoint.fname, e))
+
+    def __restore(self, stack, data):
+        """Rebuild the stack of shells saved in a checkpoint.
+
+        Returns:
+            The index of the next operation.
+        """
+        shells = data['shells']
+        self.shell.restore_state(shells[0]['state'])
+        for entry in shells[1:]:
+            parent = stack[-1].shell
+            subshell = parent._create_subshell(entry['cls'], entry['cmd'],
+                    entry['args'], prompt = entry['prompt'],
+                    context = entry['context'])
+            subshell.restore_state(entry['state'])
+            self.__enter(stack, subshell, entry['end'])
+        self.shell.status = data['status']
+        self.errors = data['errors']
+        return data['ip']
+
+    def __batched(self, shell, cmd):
+        key = ( type(shell), cmd )
+        batched = self._batched.get(key)
+        if batched is None:
+            func_name = shell._cmd_map_all.get(cmd) if cmd is not None else None
+            batched = self._batched[key] = func_name is not None and \
+                    getattr(type(shell), func_name).__command__['batch']
+        return batched
+
+    def __group(self, ops, op, ip):
+        """Collect the arguments of the run of lines of a batched command.
+
+        Returns:
+            A tuple (argvs, ip), the list of lists of arguments, and the index
+            of the operation following the run.
+        """
+        argvs = [ op[4] ]
+        cmd = op[3]
+        while ip < len(ops) and len(argvs) < self.batch_size:
+            nxt = ops[ip]
+            if nxt[0] != OP_EXEC or nxt[3] != cmd:
+                break
+            argvs.append(nxt[4])
+            ip += 1
+        return argvs, ip
+
+    def __exec(self, stack, op, ip, argvs = None):
+        """Execute an operation, and the rest of its sequence, in the shell on
+        top.
+
+        Arguments:
+            argvs: The lists of arguments of a run of lines of a batched
+                command starting at op, or None.
+
+        Returns:
+            A tuple (directive, ip), the last exit directive, or None, and the
+            index of the next operation.
+        """
+        shell = stack[-1].shell
+        header = op[0] == OP_ENTER
+        cmd = op[3]
+        shell._enter_only = header
+        try:
+            if argvs is not None:
+                ret = shell._exec_command(cmd, argvs, op[2], batch = True)
+            elif cmd is not None and cmd in shell._cmd_map_all:
+                if hooks.active:
+                    ret = shell._exec_hooked_line(op[2], shell._exec_command,
+                            cmd, op[4], op[2])
+                else:
+                    ret = shell._exec_command(cmd, op[4], op[2])
+            else:
+                ret = shell.__exec_line__(op[2])
+        except Exception:
+            shell.stderr.write(traceback.format_exc())
+            ret = None
+        finally:
+            shell._enter_only = False
+
+        if header:
+            if isinstance(ret, _ShellBase):
+                self.__enter(stack, ret, op[5])
+                ret = None
+            else:
+                # Exit directives of the header are still honored.
+                shell.error("line {}: '{}' did not enter a subshell, skipping"
+                        " its block\n".format(op[1], op[2]))
+                ip = op[5]
+
+        # The rest of a line with sequencing operators runs in the shell on
+        # top, which the directives of earlier commands may have changed.
+        while True:
+            line = stack[-1].shell._sequence.next_command()
+            if line is None or ret == 'all' or (ret is True and
+                    len(stack) == 1):
+                return ret, ip
+            ip = self.__pop_to(stack, ret, ip)
+            try:
+                ret = stack[-1].shell.__exec_line__(line)
+            except Exception:
+                stack[-1].shell.stderr.write(traceback.format_exc())
+                ret = None
+
+    def __enter(self, stack, subshell, end):
+        mode = subshell._mode_stack[-1]
+        frame = _Frame(subshell, end, cmd = mode.cmd, args = mode.args)
+        if hooks.active:
+            hooks.fire('subshell', 'pre', mode.shell, mode.cmd, mode.args,
+                    target = type(subshell), start = frame.wall_start)
+        stack.append(frame)
+        subshell.preloop()
+
+    def __leave(self, stack):
+        frame = stack.pop()
+        frame.shell.postloop()
+        parent = stack[-1].shell
+        duration = time.perf_counter() - frame.start
+        if metrics.enabled:
+            metrics.REGISTRY.observe('subshell', type(parent).__name__,
+                    type(frame.shell).__name__, duration)
+        if hooks.active:
+            hooks.fire('subshell', 'post', parent, frame.cmd, frame.args,
+                    target = type(frame.shell), start = frame.wall_start,
+                    duration = duration)
+
+    def __pop_to(self, stack, directive, ip):
+        """Leave blocks according to an exit directive, see cmdloop().
+
+        Returns:
+            The index of the next operation, after the blocks left.
+        """
+        if directive is True:
+            depth = len(stack) - 2
+        elif directive == 'root':
+            depth = 0
+        elif type(directive) is int and directive >= 0:
+            depth = directive
+        else:
+            return ip
+        while len(stack) - 1 > depth:
+            ip = stack[-1].end
+            self.__leave(stack)
+        return ip
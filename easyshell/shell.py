@@ -1,12 +1,37 @@
-from .base import command, helper, completer, subshell
+from .base import command, helper, completer, positive_int, subshell
 from .basic_shell import BasicShell
-from .debugging_shell import DebuggingShell
+
+def _debug_parser():
+    import argparse
+    parser = argparse.ArgumentParser(description = 'Enter the debugging shell.')
+    parser.add_argument('action',
+            nargs = '?',
+            choices = ['on', 'off', 'shell', 'toggle', 'sample'],
+            help = 'turn debugging info on/off, toggle it, enter the'
+                    ' debugging shell, or control the sampling profiler')
+    parser.add_argument('sample_action',
+            nargs = '?',
+            choices = ['start', 'stop'],
+            help = 'start or stop the sampling profiler')
+    parser.add_argument('-o', '--output',
+            metavar = 'FILE',
+            default = 'easyshell.samples',
+            help = 'sample: the file to write the collapsed stacks to')
+    parser.add_argument('--rate',
+            metavar = 'HZ',
+            type = positive_int,
+            default = 100,
+            help = 'sample: the number of samples per second')
+    return parser
 
 class _Shell(BasicShell):
 
     """Embed DebuggingShell into BasicShell."""
 
-    @subshell(DebuggingShell, 'debug', internal = True)
+    # The debugging shell is referred to by its import path, so that it is only
+    # imported when entered.
+    @subshell('.debugging_shell:DebuggingShell', 'debug', internal = True,
+            parser = _debug_parser)
     def _do_debug(self, cmd, args):
         """\
         Enter the debugging shell.
@@ -14,15 +39,15 @@ class _Shell(BasicShell):
             debug {on,off}      Turn on/off debugging info.
             debug shell         Enter debugging shell.
             debug toggle        Toggle current debugging status.
+            debug sample start  Start the sampling profiler.
+            debug sample stop   Stop the sampling profiler and write the
+                                samples as collapsed stacks.
         """
-        if not args:
+        action = args.action
+        if not action:
             self.stdout.write('on' if self.debug else 'off')
             self.stdout.write('\n')
             return
-        if len(args) > 1:
-            self.stderr.write('debug: too many arguments: {}\n'.format(args))
-            return
-        action = args[0]
         if action == 'on':
             self.debug = True
         elif action == 'off':
@@ -33,15 +58,22 @@ class _Shell(BasicShell):
             self.debug = not self.debug
             self.stdout.write('on' if self.debug else 'off')
             self.stdout.write('\n')
-        else:
-            self.stderr.write('debug: unrecognized argument: {}\n'.format(action))
-
-    @completer('debug')
-    def _complete_debug(self, cmd, args, text):
-        if args:
-            return []
-        return [ x for x in { 'on', 'off', 'shell', 'toggle', } \
-                if x.startswith(text) ]
+        elif action == 'sample':
+            from . import sampler
+            if args.sample_action == 'start':
+                if not sampler.start(rate = args.rate):
+                    self.error('debug: the sampling profiler is'
+                            ' already running\n')
+            elif args.sample_action == 'stop':
+                n = sampler.stop(args.output)
+                if n is None:
+                    self.error('debug: the sampling profiler is not'
+                            ' running\n')
+                else:
+                    self.stdout.write('debug: {} samples written to {}\n'.format(
+                            n, args.output))
+            else:
+                self.error('debug: sample: expect start or stop\n')
 
 class Shell(_Shell):
 
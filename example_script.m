@@ -6,7 +6,7 @@ foo
         stack 1
     stack
     end
-bar --
+bar
     你好
     stack
     こんにちは
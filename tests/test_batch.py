@@ -0,0 +1,38 @@
+import io
+
+from easyshell import command, deprecated
+from easyshell.script import BlockExecutor
+from easyshell.shell import Shell
+
+
+class BatchShell(Shell):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.calls = []
+
+    @deprecated
+    @command('put', nargs = 1, batch = True)
+    def do_put(self, cmd, argvs):
+        self.calls.append([ args[0] for args in argvs ])
+
+
+def make_shell():
+    return BatchShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+
+
+def test_deprecated_batch_command_runs_batched(capsys):
+    shell = make_shell()
+    executor = BlockExecutor(shell)
+    executor.run_string('put a\nput b\nput c\n')
+    assert shell.calls == [ [ 'a', 'b', 'c' ] ]
+    assert shell.stderr.getvalue() == ''
+    assert executor.errors == 0
+    assert 'deprecated' in capsys.readouterr().out
+
+
+def test_deprecated_batch_command_runs_per_line():
+    shell = make_shell()
+    shell.batch_lines([ 'put a', 'put b' ])
+    assert shell.calls == [ [ 'a' ], [ 'b' ] ]
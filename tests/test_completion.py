@@ -0,0 +1,78 @@
+import io
+
+from easyshell import command
+from easyshell.shell import Shell
+
+
+class SpecShell(Shell):
+
+    colors = [ 'red', 'green' ]
+
+    @command('pick', choices = [ 'apple', 'apricot', 'banana', 'cherry' ])
+    def do_pick(self, cmd, args):
+        pass
+
+    @command('seek', int_range = range(8, 12))
+    def do_seek(self, cmd, args):
+        pass
+
+    @command('paint', choices = [ 'grey' ],
+            choices_fn = lambda shell: shell.colors)
+    def do_paint(self, cmd, args):
+        pass
+
+    @command('open', files = True)
+    def do_open(self, cmd, args):
+        pass
+
+
+def complete(shell, cmd, args, text):
+    return shell._spec_map[cmd].complete(shell, args, text)
+
+
+def make_shell():
+    return SpecShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+
+
+def test_choices_are_matched_by_prefix():
+    shell = make_shell()
+    assert complete(shell, 'pick', None, '') == \
+            [ 'apple', 'apricot', 'banana', 'cherry' ]
+    assert complete(shell, 'pick', None, 'ap') == [ 'apple', 'apricot' ]
+    assert complete(shell, 'pick', None, 'apr') == [ 'apricot' ]
+    assert complete(shell, 'pick', None, 'cherry') == [ 'cherry' ]
+    assert complete(shell, 'pick', None, 'cherryx') == []
+    assert complete(shell, 'pick', None, 'b') == [ 'banana' ]
+
+
+def test_int_range_is_matched_by_prefix():
+    shell = make_shell()
+    assert complete(shell, 'seek', None, '') == [ '10', '11', '8', '9' ]
+    assert complete(shell, 'seek', None, '1') == [ '10', '11' ]
+
+
+def test_choices_fn_follows_the_state_of_the_shell():
+    shell = make_shell()
+    assert complete(shell, 'paint', None, 'gr') == [ 'grey', 'green' ]
+    shell.colors = [ 'gold' ]
+    assert complete(shell, 'paint', None, 'g') == [ 'grey', 'gold' ]
+
+
+def test_only_the_first_argument_is_completed():
+    shell = make_shell()
+    assert complete(shell, 'pick', [ 'apple' ], 'a') == []
+
+
+def test_files_are_completed(tmp_path, monkeypatch):
+    (tmp_path / 'notes.txt').write_text('')
+    (tmp_path / 'nested').mkdir()
+    monkeypatch.chdir(tmp_path)
+    shell = make_shell()
+    assert complete(shell, 'open', None, 'n') == [ 'nested/', 'notes.txt' ]
+
+
+def test_results_are_not_shared_between_calls():
+    shell = make_shell()
+    complete(shell, 'pick', None, '').append('kiwi')
+    assert 'kiwi' not in complete(shell, 'pick', None, '')
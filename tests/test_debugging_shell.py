@@ -0,0 +1,24 @@
+import io
+import re
+
+from easyshell.debugging_shell import DebuggingShell
+
+
+def make_shell():
+    return DebuggingShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+
+
+def test_names_persist_across_commands():
+    shell = make_shell()
+    shell.batch_lines([ 'e x = [ 1, 2 ]', 'e x.append(3)', 'p x' ])
+    assert shell.stdout.getvalue() == 'x:\n[\n    1\n    2\n    3\n]\n'
+
+
+def test_timeit_reports_durations_with_units():
+    shell = make_shell()
+    shell.batch_lines([ 'e x = list(range(10))', 'timeit -n 10 -r 2 sum(x)' ])
+    assert re.search(r'^10 loops, best of 2: [0-9.]+ [nu]?s per loop'
+            r' \(mean [0-9.]+ [nmu]?s \+- [0-9.]+ [nmu]?s\)$',
+            shell.stdout.getvalue(), re.M)
+    assert shell.stderr.getvalue() == ''
@@ -0,0 +1,85 @@
+import os
+
+import pytest
+
+from easycompleter import fs
+
+
+@pytest.fixture(autouse = True)
+def empty_cache():
+    fs._cache.clear()
+    yield
+    fs._cache.clear()
+
+
+def touch_dir(path, ns):
+    os.utime(path, ns = (ns, ns))
+
+
+def test_listing_is_sorted_and_flags_directories(tmp_path):
+    (tmp_path / 'b.txt').write_text('')
+    (tmp_path / 'a').mkdir()
+    assert fs.listdir(str(tmp_path)) == ([ 'a', 'b.txt' ], [ True, False ])
+
+
+def test_listing_is_cached_until_the_directory_changes(tmp_path):
+    (tmp_path / 'a.txt').write_text('')
+    touch_dir(tmp_path, 10**18)
+    names, isdirs = fs.listdir(str(tmp_path))
+    assert fs.listdir(str(tmp_path))[0] is names
+
+    (tmp_path / 'b.txt').write_text('')
+    touch_dir(tmp_path, 10**18 + 1)
+    assert fs.listdir(str(tmp_path))[0] == [ 'a.txt', 'b.txt' ]
+
+
+def test_relative_paths_follow_the_working_directory(tmp_path, monkeypatch):
+    for name in ('one', 'two'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / name).write_text('')
+        # The same modification time must not confuse the directories.
+        touch_dir(tmp_path / name, 10**18)
+    monkeypatch.chdir(tmp_path / 'one')
+    assert fs.listdir('.')[0] == [ 'one' ]
+    monkeypatch.chdir(tmp_path / 'two')
+    assert fs.listdir('.')[0] == [ 'two' ]
+
+
+def test_least_recently_used_listings_are_evicted(tmp_path, monkeypatch):
+    monkeypatch.setattr(fs, '_CACHE_SIZE', 2)
+    for name in ('a', 'b', 'c'):
+        (tmp_path / name).mkdir()
+    fs.listdir(str(tmp_path / 'a'))
+    fs.listdir(str(tmp_path / 'b'))
+    fs.listdir(str(tmp_path / 'a'))
+    fs.listdir(str(tmp_path / 'c'))
+    cached = { os.stat(str(tmp_path / name)).st_ino for name in ('a', 'c') }
+    assert { ino for dev, ino in fs._cache } == cached
+
+
+def test_missing_directory_lists_nothing(tmp_path):
+    assert fs.listdir(str(tmp_path / 'missing')) == ([], [])
+    assert not fs._cache
+
+
+def test_fuzzy_matches_subsequences_of_segments(tmp_path, monkeypatch):
+    (tmp_path / 'easyshell').mkdir()
+    for name in ('basic_shell.py', 'base.py', 'shell.py', '.bs'):
+        (tmp_path / 'easyshell' / name).write_text('')
+    (tmp_path / 'README').write_text('')
+    monkeypatch.chdir(tmp_path)
+    assert fs.fuzzy_matches('e/bs') == [ 'easyshell/basic_shell.py',
+            'easyshell/base.py' ]
+    assert fs.fuzzy_matches('e/xyz') == []
+    assert fs.fuzzy_matches('rdm') == [ 'README' ]
+    assert fs.fuzzy_matches('rDM') == []
+    assert fs.fuzzy_matches('e/.b') == [ 'easyshell/.bs' ]
+
+
+def test_subsequence_regex_agrees_with_the_score():
+    names = [ 'a-b', 'ab', 'ba', 'A]b', 'x^\\y', 'aXb', '' ]
+    for pattern in ('ab', 'a-b', ']b', '^\\', 'Xb', ''):
+        regex = fs._subsequence_regex(pattern)
+        for name in names:
+            assert bool(regex.match(name)) == \
+                    (fs._fuzzy_score(pattern, name) is not None)
@@ -0,0 +1,141 @@
+import io
+import json
+
+import pytest
+
+from easyshell import command, hooks, subshell
+from easyshell.shell import Shell
+
+
+class InnerShell(Shell):
+    pass
+
+
+class HookedShell(Shell):
+
+    @subshell(InnerShell, 'inner', nargs = 0)
+    def do_inner(self, cmd, args):
+        return 'inner'
+
+    @command('ok', nargs = '*')
+    def do_ok(self, cmd, args):
+        pass
+
+    @command('fail', nargs = 0)
+    def do_fail(self, cmd, args):
+        raise RuntimeError('fail')
+
+
+class Recorder(object):
+
+    def __init__(self):
+        self.events = []
+
+    def __call__(self, event):
+        self.events.append((event.kind, event.phase, event.cmd, event.args,
+                event.line, event.exception))
+
+
+@pytest.fixture
+def recorder():
+    recorder = Recorder()
+    registered = [ (kind, phase) for kind in ('line', 'command')
+            for phase in hooks.PHASES ]
+    for kind, phase in registered:
+        hooks.register(kind, recorder, phase = phase)
+    yield recorder
+    for kind, phase in registered:
+        hooks.unregister(kind, recorder, phase = phase)
+
+
+def make_shell():
+    return HookedShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+
+
+def test_registering_turns_hooks_on_and_off():
+    assert not hooks.active
+    hook = lambda event: None
+    hooks.register('command', hook)
+    assert hooks.active
+    hooks.unregister('command', hook)
+    assert not hooks.active
+
+
+def test_invalid_kinds_and_phases_are_rejected():
+    with pytest.raises(ValueError):
+        hooks.register('nosuch', lambda event: None)
+    with pytest.raises(ValueError):
+        hooks.register('command', lambda event: None, phase = 'during')
+    assert not hooks.active
+
+
+def test_commands_fire_pre_and_post(recorder):
+    make_shell().batch_lines([ 'ok a b' ])
+    assert recorder.events[:4] == [
+        ('line', 'pre', '', [], 'ok a b', None),
+        ('command', 'pre', 'ok', [ 'a', 'b' ], 'ok a b', None),
+        ('command', 'post', 'ok', [ 'a', 'b' ], 'ok a b', None),
+        ('line', 'post', '', [], 'ok a b', None),
+    ]
+
+
+def test_lines_of_unknown_commands_fire_line_hooks_only(recorder):
+    make_shell().batch_lines([ 'nosuch x' ])
+    assert recorder.events[:2] == [
+        ('line', 'pre', '', [], 'nosuch x', None),
+        ('line', 'post', '', [], 'nosuch x', None),
+    ]
+
+
+def test_post_hooks_see_the_exception(recorder):
+    shell = make_shell()
+    shell.batch_lines([ 'fail' ])
+    kind, phase, cmd, args, line, exception = recorder.events[2]
+    assert (kind, phase, cmd) == ('command', 'post', 'fail')
+    assert isinstance(exception, RuntimeError)
+
+
+def test_errors_of_hooks_are_reported_and_ignored():
+    def hook(event):
+        raise KeyError('hook')
+    hooks.register('command', hook)
+    try:
+        shell = make_shell()
+        assert shell.batch_lines([ 'ok' ]) == 0
+    finally:
+        hooks.unregister('command', hook)
+    assert "KeyError: 'hook'" in shell.stderr.getvalue()
+
+
+def test_jsonl_tracer_writes_a_span_per_command(tmp_path):
+    fname = str(tmp_path / 'trace.jsonl')
+    tracer = hooks.JsonlTracer(fname)
+    tracer.start()
+    try:
+        make_shell().batch_lines([ 'ok x', 'nosuch' ])
+    finally:
+        tracer.stop()
+    assert not hooks.active
+    with open(fname, encoding = 'utf8') as f:
+        spans = [ json.loads(line) for line in f ]
+    assert [ (span['kind'], span['cmd'], span['args']) for span in spans ] == \
+            [ ('command', 'ok', [ 'x' ]), ('command', 'exit', []) ]
+    assert spans[0]['depth'] == 0
+    assert spans[0]['shell'] == 'HookedShell'
+    assert spans[0]['duration'] >= 0
+
+
+def test_subshells_fire_when_entered_and_left():
+    events = []
+    hook = lambda event: events.append((event.phase, event.cmd,
+            event.target.__name__, event.mode_stack))
+    hooks.register('subshell', hook, phase = 'pre')
+    hooks.register('subshell', hook)
+    try:
+        make_shell().batch_lines([ 'inner', 'ok', 'exit' ])
+    finally:
+        hooks.unregister('subshell', hook, phase = 'pre')
+        hooks.unregister('subshell', hook)
+    assert events == [ ('pre', 'inner', 'InnerShell', []),
+            ('post', 'inner', 'InnerShell', []) ]
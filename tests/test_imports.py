@@ -0,0 +1,15 @@
+import pytest
+
+from benchmarks import check_imports
+
+# The timing depends on the load of the machine, e.g., of tests run in
+# parallel, so that the time budget is only checked with a wide margin. The
+# module budget and the lazy modules are exact.
+MARGIN = 2.0
+
+
+@pytest.mark.parametrize('module', check_imports.MODULES)
+def test_import_budget(module):
+    seconds, modules, problems = check_imports.check(module,
+            max_ms = check_imports.MAX_MS * MARGIN)
+    assert problems == []
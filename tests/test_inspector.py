@@ -0,0 +1,31 @@
+import collections
+
+from easyshell import inspector
+
+
+def test_large_defaultdict_is_bounded():
+    d = collections.defaultdict(list)
+    for i in range(100000):
+        d[i].append(i)
+    lines = list(inspector.iter_lines(d, max_items = 5, max_width = 80))
+    assert lines[0] == 'defaultdict({'
+    assert lines[-1] == '})'
+    assert '    ... (99995 more items)' in lines
+    assert len(lines) < 30
+    assert all(len(line) <= 80 for line in lines)
+
+
+def test_large_counter_is_bounded():
+    counter = collections.Counter(range(100000))
+    lines = list(inspector.iter_lines(counter, max_items = 3))
+    assert lines == [ 'Counter({', '    0: 1', '    1: 1', '    2: 1',
+            '    ... (99997 more items)', '})' ]
+
+
+def test_fallback_repr_is_bounded():
+    class Huge(object):
+        def __repr__(self):
+            return 'x' * 100000
+    lines = list(inspector.iter_lines(Huge(), max_width = 1000))
+    assert len(lines) == 1
+    assert len(lines[0]) <= 1000
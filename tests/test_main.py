@@ -0,0 +1,65 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_command(command):
+    """Run 'python3 -m easyshell -c command' and return its exit code."""
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _ROOT
+    proc = subprocess.run([ sys.executable, '-m', 'easyshell', '-c', command ],
+            cwd = _ROOT, env = env, stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL)
+    return proc.returncode
+
+
+@pytest.mark.parametrize('command, code', [
+    ('stack', 0),
+    ('nosuch', 127),
+    ('exit foo', 2),
+    ('stack && nosuch', 127),
+    ('nosuch && stack', 127),
+    ('nosuch || stack', 0),
+    ('foo; nosuch', 127),
+    ('! exit 3', 3),
+])
+def test_command_exit_code(command, code):
+    assert run_command(command) == code
+
+
+@pytest.mark.parametrize('argv', [
+    [ '-m', 'easyshell', '--sample-rate', '0', '-c', 'stack' ],
+    [ '-m', 'easyshell', '--max-errors', '-1', '-c', 'stack' ],
+    [ '-m', 'easyshell', '--batch-size', 'x', '-c', 'stack' ],
+    [ '-m', 'easyshell.replay', '-n', '0', 'session.rec' ],
+])
+def test_non_positive_counts_are_rejected(argv):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _ROOT
+    proc = subprocess.run([ sys.executable ] + argv, cwd = _ROOT, env = env,
+            stdout = subprocess.DEVNULL, stderr = subprocess.PIPE,
+            universal_newlines = True)
+    assert proc.returncode == 2
+    assert 'expect a positive integer' in proc.stderr
+
+
+def test_batch_mode_does_not_use_readline():
+    code = '\n'.join([
+        'import sys',
+        'from easyshell.example_shell import MyShell',
+        "status = MyShell(batch_mode = True).batch_lines([ 'stack', 'foo',"
+                " 'stack 0', 'history' ])",
+        "assert 'readline' not in sys.modules, 'readline imported'",
+        'sys.exit(status)',
+    ])
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _ROOT
+    proc = subprocess.run([ sys.executable, '-c', code ], cwd = _ROOT,
+            env = env, stdout = subprocess.DEVNULL, stderr = subprocess.PIPE,
+            universal_newlines = True)
+    assert 'history: no history in batch mode' in proc.stderr
+    assert proc.returncode == 1
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from easyshell import metrics
+from easyshell.base import format_time
+from easyshell.example_shell import MyShell
+
+
+@pytest.fixture
+def shell():
+    metrics.REGISTRY.reset()
+    yield MyShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+    metrics.REGISTRY.reset()
+
+
+def complete(shell, toks, text):
+    """Complete like readline does, with the first state."""
+    try:
+        return shell._ShellBase__driver_completer(toks, text, 0)
+    except IndexError:
+        return None
+
+
+def series(kind):
+    return sorted(row['name'] for row in metrics.REGISTRY.rows()
+            if row['kind'] == kind)
+
+
+def test_commands_are_recorded_by_name(shell):
+    shell.batch_lines([ 'stack', 'stack 0', 'nosuch' ])
+    rows = [ row for row in metrics.REGISTRY.rows()
+            if row['kind'] == 'command' ]
+    # The end of input executes 'exit'.
+    assert [ (row['name'], row['count']) for row in rows ] == [ ('exit', 1),
+            ('stack', 2) ]
+
+
+def test_completions_of_unknown_commands_share_a_series(shell):
+    complete(shell, [ 'fo' ], 'fo')
+    complete(shell, [ 'foo', '' ], '')
+    complete(shell, [ 'typo1', '' ], '')
+    complete(shell, [ 'typo2', 'x' ], 'x')
+    assert series('complete') == [ '', '<unknown>', 'foo' ]
+
+
+def test_stats_formats_latencies(shell):
+    pytest.importorskip('terminaltables')
+    shell.batch_lines([ 'stack', 'stats -k command' ])
+    assert 'stack' in shell.stdout.getvalue()
+
+
+@pytest.mark.parametrize('seconds, text', [
+    (2.5, '2.500 s'),
+    (0.0125, '12.500 ms'),
+    (3e-6, '3.000 us'),
+    (4e-8, '40.0 ns'),
+])
+def test_format_time(seconds, text):
+    assert format_time(seconds) == text
@@ -0,0 +1,78 @@
+import argparse
+import io
+
+from easyshell import command
+from easyshell.shell import Shell
+
+
+def _move_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('steps', type = int)
+    parser.add_argument('--to', nargs = '*', default = None)
+    parser.add_argument('-v', '--verbose', action = 'count', default = 0)
+    return parser
+
+def _tag_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-t', '--tag', action = 'append')
+    return parser
+
+
+class ParserShell(Shell):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.namespaces = []
+
+    @command('move', parser = _move_parser)
+    def do_move(self, cmd, namespace):
+        self.namespaces.append(namespace)
+
+    @command('tag', parser = _tag_parser)
+    def do_tag(self, cmd, namespace):
+        self.namespaces.append(namespace)
+
+
+def make_shell():
+    return ParserShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+
+
+def test_repeated_arguments_are_parsed_once():
+    shell = make_shell()
+    parser = ParserShell.do_move.__command_parser__
+    cached = len(parser._cache or {})
+    shell.batch_lines([ 'move 3 --to a b -vv', 'move 3 --to a b -vv' ])
+    first, second = shell.namespaces
+    assert vars(first) == { 'steps': 3, 'to': [ 'a', 'b' ], 'verbose': 2 }
+    assert vars(second) == vars(first)
+    assert len(parser._cache) == cached + 1
+
+
+def test_cached_namespaces_are_copies():
+    shell = make_shell()
+    shell.batch_lines([ 'move 1 --to x' ])
+    shell.namespaces[0].steps = 100
+    shell.namespaces[0].to.append('y')
+    shell.batch_lines([ 'move 1 --to x' ])
+    assert vars(shell.namespaces[1]) == { 'steps': 1, 'to': [ 'x' ],
+            'verbose': 0 }
+
+
+def test_errors_are_not_cached():
+    shell = make_shell()
+    parser = ParserShell.do_move.__command_parser__
+    cached = len(parser._cache or {})
+    assert shell.batch_lines([ 'move nan' ]) == 2
+    assert shell.namespaces == []
+    assert len(parser._cache) == cached
+    assert 'invalid int value' in shell.stderr.getvalue()
+
+
+def test_parsers_with_impure_actions_are_not_cached():
+    shell = make_shell()
+    shell.batch_lines([ 'tag -t a', 'tag -t a' ])
+    first, second = shell.namespaces
+    assert first.tag == [ 'a' ] and second.tag == [ 'a' ]
+    assert first.tag is not second.tag
+    assert ParserShell.do_tag.__command_parser__._cache is False
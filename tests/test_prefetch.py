@@ -0,0 +1,65 @@
+import threading
+
+import pytest
+
+readline = pytest.importorskip('readline')
+
+from easyshell.prefetch import CompletionPrefetcher
+
+
+class SlowCompleterShell(object):
+
+    def __init__(self):
+        self._completer_map = { 'foo': 'complete_foo' }
+        self._spec_map = {}
+        self.started = threading.Event()
+        self.release = threading.Event()
+        self.running = False
+
+    def complete_foo(self, cmd, args, text):
+        self.running = True
+        self.started.set()
+        self.release.wait(5)
+        self.running = False
+        return [ 'a', 'b' ]
+
+
+@pytest.fixture
+def history():
+    readline.clear_history()
+    readline.add_history('foo x')
+    yield
+    readline.clear_history()
+
+
+def test_prefetched_candidates_are_looked_up(history):
+    shell = SlowCompleterShell()
+    shell.release.set()
+    prefetcher = CompletionPrefetcher(shell)
+    prefetcher.start()
+    prefetcher._thread.join(5)
+    assert prefetcher.lookup('foo') == [ 'a', 'b' ]
+    prefetcher.stop()
+    assert prefetcher.lookup('foo') is None
+
+
+def test_stop_waits_for_running_completer(history):
+    shell = SlowCompleterShell()
+    prefetcher = CompletionPrefetcher(shell)
+    prefetcher.start()
+    assert shell.started.wait(5)
+    threading.Timer(0.05, shell.release.set).start()
+    prefetcher.stop()
+    assert not shell.running
+    assert prefetcher.lookup('foo') is None
+
+
+def test_paused_waits_for_running_completer(history):
+    shell = SlowCompleterShell()
+    prefetcher = CompletionPrefetcher(shell)
+    prefetcher.start()
+    assert shell.started.wait(5)
+    threading.Timer(0.05, shell.release.set).start()
+    with prefetcher.paused():
+        assert not shell.running
+    prefetcher.stop()
@@ -0,0 +1,32 @@
+import os
+
+import pytest
+
+pytest.importorskip('pty')
+pytest.importorskip('termios')
+
+from benchmarks.bench_pty import CTRL_D, CTRL_U, TAB, prompt, start_child
+
+
+@pytest.fixture
+def shell(tmp_path):
+    shell = start_child(10, str(tmp_path))
+    yield shell
+    shell.close()
+
+
+def test_complete_and_exit(shell):
+    shell.expect(prompt(0), timeout = 30.0)
+    shell.send('zzz-u')
+    shell.expect('zzz-u')
+    shell.send(TAB)
+    shell.expect('nique')
+    shell.send(' b' + TAB.decode())
+    shell.expect('eta-choice')
+    shell.send(CTRL_U + b'sub\n')
+    shell.expect(prompt(1))
+    shell.send(CTRL_D)
+    shell.expect(prompt(0))
+    shell.send(CTRL_D)
+    status = shell.close()
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
@@ -0,0 +1,365 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from easyshell import command, subshell
+from easyshell import script
+from easyshell.shell import Shell
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class MarkingShell(Shell):
+
+    @property
+    def marks(self):
+        return self.context['marks']
+
+    @command('mark', nargs = 1)
+    def do_mark(self, cmd, args):
+        self.marks.append((type(self).__name__, args[0]))
+
+    @command('fail', nargs = 0)
+    def do_fail(self, cmd, args):
+        self.error('fail\n', status = 3)
+
+    # Raise KeyboardInterrupt after marking, as many times as there are items
+    # in the list interrupts.
+    @command('interrupt', nargs = 0)
+    def do_interrupt(self, cmd, args):
+        self.marks.append((type(self).__name__, 'interrupt'))
+        if interrupts:
+            interrupts.pop()
+            raise KeyboardInterrupt()
+
+
+interrupts = []
+
+
+class LeafShell(MarkingShell):
+    pass
+
+
+class MidShell(MarkingShell):
+
+    @subshell(LeafShell, 'leaf', nargs = 0)
+    def do_leaf(self, cmd, args):
+        return 'leaf', { 'marks': self.marks }
+
+
+class TopShell(MarkingShell):
+
+    marks = None
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.marks = []
+
+    @subshell(MidShell, 'mid', nargs = '?')
+    def do_mid(self, cmd, args):
+        return 'mid', { 'marks': self.marks }
+
+
+def make_executor(**kwargs):
+    shell = TopShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+    return script.BlockExecutor(shell, **kwargs)
+
+
+def run(content, **kwargs):
+    executor = make_executor(**kwargs)
+    executor.run_string(content)
+    return executor.shell.marks
+
+
+def test_parse_builds_the_tree_of_blocks():
+    root = script.parse('a\n  b\n\n  # c\n    d\n  e\nf\n')
+    def tree(block):
+        return [ (b.lineno, b.line, tree(b)) for b in block.body ]
+    assert tree(root) == [
+        (1, 'a', [ (2, 'b', [ (5, 'd', []) ]), (6, 'e', []) ]),
+        (7, 'f', []),
+    ]
+
+
+@pytest.mark.parametrize('content, lineno', [
+    ('  a\n', 1),
+    ('a\n    b\n  c\n', 3),
+    ('a\n\tb\n  c\n', 3),
+])
+def test_parse_rejects_inconsistent_indentation(content, lineno):
+    with pytest.raises(script.ScriptError) as info:
+        script.parse(content)
+    assert info.value.lineno == lineno
+
+
+def test_blocks_run_in_their_subshells():
+    assert run('mark a\nmid\n  mark b\n  leaf\n    mark c\n  mark d\n'
+            'mark e\n') == [ ('TopShell', 'a'), ('MidShell', 'b'),
+            ('LeafShell', 'c'), ('MidShell', 'd'), ('TopShell', 'e') ]
+
+
+def test_exit_leaves_the_rest_of_the_block():
+    assert run('mid\n  leaf\n    exit\n    mark a\n  mark b\n  end\n'
+            '  mark c\nmark d\n') == [ ('MidShell', 'b'), ('TopShell', 'd') ]
+
+
+def test_sequences_continue_in_the_subshell_entered():
+    assert run('mid; mark a; exit; mark b\nmark c\n') == [ ('MidShell', 'a'),
+            ('TopShell', 'b'), ('TopShell', 'c') ]
+
+
+def test_headers_which_enter_no_subshell_skip_their_block():
+    executor = make_executor()
+    executor.run_string('mid x y\n  mark a\nmark b\n')
+    assert executor.shell.marks == [ ('TopShell', 'b') ]
+    assert "line 1: 'mid x y' did not enter a subshell" in \
+            executor.shell.stderr.getvalue()
+
+
+def test_failed_lines_are_counted():
+    executor = make_executor()
+    executor.run_string('fail\nmid\n  fail\n  mark a\nfail && mark b\n')
+    assert executor.errors == 3
+    assert not executor.stopped
+    assert executor.shell.marks == [ ('MidShell', 'a') ]
+
+
+def test_max_errors_stops_the_run():
+    executor = make_executor(max_errors = 2)
+    executor.run_string('fail\nmark a\nfail\nmark b\n')
+    assert executor.stopped
+    assert executor.shell.marks == [ ('TopShell', 'a') ]
+    assert 'line 3: stopping after 2 failed lines' in \
+            executor.shell.stderr.getvalue()
+
+
+def test_compile_resolves_commands_and_subshells():
+    plan = script.compile_script(script.parse(
+            'mark a\nmid\n  leaf\n    mark "b c"\n'), TopShell)
+    assert plan.errors == []
+    assert plan.ops == [
+        (script.OP_EXEC, 1, 'mark a', 'mark', [ 'a' ]),
+        (script.OP_ENTER, 2, 'mid', 'mid', [], 6),
+        (script.OP_ENTER, 3, 'leaf', 'leaf', [], 5),
+        (script.OP_EXEC, 4, 'mark "b c"', 'mark', [ 'b c' ]),
+        (script.OP_LEAVE,),
+        (script.OP_LEAVE,),
+    ]
+    assert sorted(plan.classes) == sorted(script.class_path(cls)
+            for cls in ( TopShell, MidShell, LeafShell ))
+
+
+def test_compile_reports_every_problem():
+    plan = script.compile_script(script.parse(
+            'nosuch\nmark\nmark a\n  mark b\nmid\n  leaf x\n  mark a b\n'
+            'mid; nosuch2\n'), TopShell)
+    assert [ (e.lineno, str(e)) for e in plan.errors ] == [
+        (1, 'line 1: nosuch: command not found in TopShell'),
+        (2, 'line 2: mark: expect 1 arguments, provided 0: []'),
+        (3, "line 3: 'mark a' does not enter a subshell, but heads a block"),
+        (6, "line 6: leaf: expect 0 arguments, provided 1: ['x']"),
+        (7, "line 7: mark: expect 1 arguments, provided 2: ['a', 'b']"),
+        (8, 'line 8: nosuch2: command not found in MidShell'),
+    ]
+
+
+def test_plans_with_errors_still_run():
+    assert run('nosuch\nmark a\n') == [ ('TopShell', 'a') ]
+
+
+def test_run_plan_rejects_plans_of_other_classes():
+    plan = script.compile_script(script.parse('mark a\n'), MidShell)
+    with pytest.raises(ValueError):
+        make_executor().run_plan(plan)
+
+
+def test_executor_requires_batch_mode():
+    with pytest.raises(ValueError):
+        script.BlockExecutor(TopShell(batch_mode = False))
+
+
+def easyshell(*args):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _ROOT
+    return subprocess.run([ sys.executable, '-m', 'easyshell',
+            '--no-plan-cache', '--blocks' ] + list(args), cwd = _ROOT,
+            env = env, stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+            universal_newlines = True)
+
+
+def test_check_reports_problems_without_running():
+    proc = easyshell('--check', '-c', 'foo\n  nosuch\ncat a b\n')
+    assert proc.returncode == 2
+    assert proc.stderr.splitlines() == [
+        'line 2: nosuch: command not found in FooShell',
+        "line 3: cat: expect 0 or 1 argument, provided 2: ['a', 'b']",
+    ]
+    assert 'Welcome' not in proc.stdout
+
+
+def test_check_passes_valid_scripts():
+    proc = easyshell('--check', '-c', 'foo\n  kar x\n    pfoo\nbar\n  hello\n')
+    assert (proc.returncode, proc.stdout, proc.stderr) == (0, '', '')
+
+
+def test_blocks_run_in_this_process():
+    proc = easyshell('-c', 'foo\n  kar x\n    pabc\nbar\n  hello\n')
+    assert proc.returncode == 0
+    assert "cmd = 'p', arg = 'abc'" in proc.stdout
+    assert 'Hello world!' in proc.stdout
+
+
+class CountingShell(TopShell):
+
+    instances = 0
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        type(self).instances += 1
+
+
+def plans(cache_dir):
+    return sorted(name for name in os.listdir(cache_dir)
+            if name.endswith('.plan'))
+
+
+def test_cached_plans_are_loaded_without_creating_shells(tmp_path):
+    cache_dir = str(tmp_path / 'plans')
+    content = 'mark a\nmid\n  mark b\n'
+    plan = script.load_plan(content, CountingShell, cache_dir = cache_dir)
+    assert len(plans(cache_dir)) == 1
+    created = CountingShell.instances
+    script._registries.clear()
+    cached = script.load_plan(content, CountingShell, cache_dir = cache_dir)
+    assert cached is not plan
+    assert cached.ops == plan.ops
+    assert CountingShell.instances == created
+
+
+def test_cache_directories_are_private(tmp_path):
+    cache_dir = str(tmp_path / 'plans')
+    script.load_plan('mark a\n', TopShell, cache_dir = cache_dir)
+    assert os.stat(cache_dir).st_mode & 0o777 == 0o700
+    assert os.stat(os.path.join(cache_dir, plans(cache_dir)[0])).st_mode & \
+            0o077 == 0
+
+
+def test_directories_writable_by_others_are_not_used(tmp_path):
+    cache_dir = str(tmp_path / 'plans')
+    os.mkdir(cache_dir)
+    os.chmod(cache_dir, 0o777)
+    plan = script.load_plan('mark a\n', TopShell, cache_dir = cache_dir)
+    assert plan.errors == []
+    assert plans(cache_dir) == []
+
+
+def test_plans_with_errors_are_not_cached(tmp_path):
+    cache_dir = str(tmp_path / 'plans')
+    plan = script.load_plan('nosuch\n', TopShell, cache_dir = cache_dir)
+    assert len(plan.errors) == 1
+    assert plans(cache_dir) == []
+
+
+def test_the_least_recently_used_plans_are_removed(tmp_path):
+    cache_dir = str(tmp_path / 'plans')
+    names = []
+    for i in range(3):
+        before = set(plans(cache_dir)) if i else set()
+        script.load_plan('mark {}\n'.format(i), TopShell, cache_dir = cache_dir,
+                max_plans = 3)
+        name, = set(plans(cache_dir)) - before
+        os.utime(os.path.join(cache_dir, name), ( i, i ))
+        names.append(name)
+    # Using the oldest plan makes it the most recently used.
+    script.load_plan('mark 0\n', TopShell, cache_dir = cache_dir,
+            max_plans = 3)
+    script.load_plan('mark 3\n', TopShell, cache_dir = cache_dir,
+            max_plans = 3)
+    kept = plans(cache_dir)
+    assert len(kept) == 3
+    assert names[0] in kept and names[2] in kept and names[1] not in kept
+
+
+def test_fingerprints_depend_on_the_commands():
+    class Changing(TopShell):
+        @command('mark', nargs = '*')
+        def do_mark(self, cmd, args):
+            pass
+    before = script._registry(TopShell).fingerprint
+    assert script._Registry(Changing).fingerprint != before
+    assert script._Registry(TopShell).fingerprint == before
+
+
+class ResumableShell(TopShell):
+
+    def checkpoint_state(self):
+        return self.marks
+
+    def restore_state(self, state):
+        self.marks = state
+
+
+def run_resumable(content, fname, *, resume = False, max_errors = None):
+    executor = script.BlockExecutor(ResumableShell(batch_mode = True,
+            stdout = io.StringIO(), stderr = io.StringIO()),
+            checkpoint = script.Checkpoint(fname, interval = 0),
+            max_errors = max_errors)
+    plan = script.compile_script(script.parse(content), ResumableShell)
+    executor.run_plan(plan, resume = resume)
+    return executor
+
+
+def test_complete_runs_remove_the_checkpoint(tmp_path):
+    fname = str(tmp_path / 'checkpoint')
+    executor = run_resumable('mark a\nmid\n  mark b\n', fname)
+    assert not os.path.exists(fname)
+    assert executor.shell.marks == [ ('ResumableShell', 'a'),
+            ('MidShell', 'b') ]
+
+
+def test_stopped_runs_resume_after_the_line_stopping_them(tmp_path):
+    fname = str(tmp_path / 'checkpoint')
+    content = 'mark a\nfail\nmark b\nfail\nmark c\n'
+    executor = run_resumable(content, fname, max_errors = 1)
+    assert executor.stopped
+    data = script.Checkpoint(fname).load()
+    assert (data['ip'], data['errors']) == (2, 1)
+    assert data['shells'][0]['state'] == [ ('ResumableShell', 'a') ]
+
+    # The failed line is not executed again, and counts for max_errors.
+    executor = run_resumable(content, fname, resume = True, max_errors = 2)
+    assert executor.stopped
+    assert executor.errors == 2
+    assert executor.shell.marks == [ ('ResumableShell', 'a'),
+            ('ResumableShell', 'b') ]
+    data = script.Checkpoint(fname).load()
+    assert (data['ip'], data['errors']) == (4, 2)
+
+
+def test_interrupted_runs_resume_before_the_line_interrupted(tmp_path):
+    fname = str(tmp_path / 'checkpoint')
+    content = 'fail\nmid\n  mark a\n  interrupt\n  fail\n  mark b\nmark c\n'
+    interrupts.append(True)
+    with pytest.raises(KeyboardInterrupt):
+        run_resumable(content, fname, max_errors = 2)
+    assert not interrupts
+    data = script.Checkpoint(fname).load()
+    assert data['errors'] == 1
+    # Not the state after the line partially executed.
+    assert data['shells'][0]['state'] == [ ('MidShell', 'a') ]
+
+    executor = run_resumable(content, fname, resume = True, max_errors = 2)
+    assert executor.stopped
+    assert executor.shell.marks == [ ('MidShell', 'a'),
+            ('MidShell', 'interrupt') ]
+
+
+def test_checkpoints_of_other_scripts_are_rejected(tmp_path):
+    fname = str(tmp_path / 'checkpoint')
+    run_resumable('fail\nmark a\n', fname, max_errors = 1)
+    with pytest.raises(ValueError):
+        run_resumable('fail\nmark b\n', fname, resume = True)
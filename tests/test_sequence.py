@@ -0,0 +1,123 @@
+import io
+import os
+import subprocess
+import sys
+
+import pytest
+
+from easyshell import command, subshell
+from easyshell.base import _Sequence, split_sequence
+from easyshell.shell import Shell
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize('line, segments', [
+    ('a', [ (';', 'a') ]),
+    ('a; b', [ (';', 'a'), (';', 'b') ]),
+    ('a && b || c', [ (';', 'a'), ('&&', 'b'), ('||', 'c') ]),
+    ('a;;  ; b;', [ (';', 'a'), (';', 'b') ]),
+    ('a&&b', [ (';', 'a'), ('&&', 'b') ]),
+    ('echo "a; b" \'c && d\'', [ (';', 'echo "a; b" \'c && d\'') ]),
+    ('echo a\\; b', [ (';', 'echo a\\; b') ]),
+    ("echo 'a\\'; b", [ (';', "echo 'a\\'"), (';', 'b') ]),
+    ('a & b | c', [ (';', 'a & b | c') ]),
+    ('', []),
+])
+def test_split_sequence(line, segments):
+    assert split_sequence(line) == segments
+
+
+@pytest.mark.parametrize('line, segments', [
+    ('! echo a && echo b', [ (';', '! echo a && echo b') ]),
+    ('  !  echo a; echo b', [ (';', '!  echo a; echo b') ]),
+    ('a; ! echo b || echo c', [ (';', 'a'), (';', '! echo b || echo c') ]),
+    ('a && !', [ (';', 'a'), ('&&', '!') ]),
+    ('!a; b', [ (';', '!a'), (';', 'b') ]),
+    ('a "!" ; b', [ (';', 'a "!"'), (';', 'b') ]),
+])
+def test_system_commands_take_the_rest_of_the_line(line, segments):
+    assert split_sequence(line) == segments
+
+
+@pytest.mark.parametrize('status, ops, command', [
+    (0, [ '&&' ], 'x'),
+    (1, [ '&&' ], None),
+    (0, [ '||' ], None),
+    (1, [ '||' ], 'x'),
+    (1, [ ';' ], 'x'),
+    (1, [ '&&', '&&', '||' ], 'x'),
+    (0, [ '||', '&&' ], 'x'),
+])
+def test_next_command_skips_by_status(status, ops, command):
+    sequence = _Sequence()
+    sequence.status = status
+    sequence.push([ (op, 'x') for op in ops ])
+    assert sequence.next_command() == command
+
+
+class InnerShell(Shell):
+
+    @command('mark', nargs = 1)
+    def do_mark(self, cmd, args):
+        self.context['marks'].append(args[0])
+
+
+class SequenceShell(Shell):
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.marks = []
+
+    @command('mark', nargs = 1)
+    def do_mark(self, cmd, args):
+        self.marks.append(args[0])
+
+    @command('fail', nargs = 0)
+    def do_fail(self, cmd, args):
+        self.error('fail\n', status = 3)
+
+    @subshell(InnerShell, 'inner', nargs = 0)
+    def do_inner(self, cmd, args):
+        return 'inner', { 'marks': self.marks }
+
+
+def run(*lines):
+    shell = SequenceShell(batch_mode = True, stdout = io.StringIO(),
+            stderr = io.StringIO())
+    status = shell.batch_lines(list(lines))
+    return shell.marks, status
+
+
+@pytest.mark.parametrize('line, marks, status', [
+    ('mark a; mark b', [ 'a', 'b' ], 0),
+    ('fail; mark b', [ 'b' ], 0),
+    ('fail && mark b', [], 3),
+    ('fail && mark b || mark c', [ 'c' ], 0),
+    ('mark a || mark b && mark c', [ 'a', 'c' ], 0),
+    ('mark a && fail || fail && mark d', [ 'a' ], 3),
+    ('nosuch || mark b', [ 'b' ], 0),
+    ('mark a && nosuch', [ 'a' ], 127),
+])
+def test_status_decides_the_commands_executed(line, marks, status):
+    assert run(line) == (marks, status)
+
+
+def test_status_propagates_across_subshells():
+    # The rest of the line runs in the subshell entered.
+    assert run('inner; mark a && fail', 'mark b') == ([ 'a', 'b' ], 0)
+    assert run('inner && fail || mark a; exit; mark b') == ([ 'a', 'b' ], 0)
+    # Exiting the subshell moves the rest of the line to the parent shell.
+    assert run('inner; fail; exit && mark a; fail') == ([ 'a' ], 3)
+
+
+def test_system_command_gets_the_operators():
+    env = dict(os.environ)
+    env['PYTHONPATH'] = _ROOT
+    proc = subprocess.run([ sys.executable, '-m', 'easyshell', '-c',
+            '! echo a && echo b; exit 4' ], cwd = _ROOT, env = env,
+            stdout = subprocess.PIPE, stderr = subprocess.PIPE,
+            universal_newlines = True)
+    assert 'a\nb\n' in proc.stdout
+    assert 'command not found' not in proc.stderr
+    assert proc.returncode == 4